@@ -1,36 +1,234 @@
+import base64
+import csv
+import datetime
+import functools
+import gzip
+import hashlib
+import io
 import json
+import logging
+import os
+import pickle
+import socket
+import textwrap
+import time
+import unicodedata
+from urllib.parse import quote
 
 import frappe
+import pymysql
 from erpnext.accounts.doctype.pos_closing_entry.pos_closing_entry import (
 	make_closing_entry_from_opening,
 )
-from erpnext.accounts.doctype.pos_invoice.pos_invoice import get_stock_availability
+from erpnext.accounts.doctype.pos_invoice.pos_invoice import get_pos_reserved_qty, make_sales_return
 from erpnext.selling.doctype.customer.customer import get_credit_limit, get_customer_outstanding
 from erpnext.stock.stock_ledger import NegativeStockError
 from frappe import _
-from frappe.utils import flt, getdate, now_datetime
+from frappe.utils import add_days, cint, flt, get_datetime, getdate, now_datetime, nowtime
+from pymysql.constants import FIELD_TYPE
+from pymysql.converters import conversions
+from werkzeug.wrappers import Response
 
 
 def get_current_pricing_date():
 	return getdate(now_datetime())
 
 
+def is_truthy(value):
+	if isinstance(value, str):
+		return value.strip().lower() in {"1", "true", "yes", "y", "on"}
+	return bool(value)
+
+
+# --- READ REPLICA ROUTING ---
+
+REPLICA_READ_STATS_CACHE_KEY = "minimart_pos_replica_reads"
+REPLICA_LAG_CACHE_KEY = "minimart_pos_replica_lag"
+REPLICA_LAG_CHECK_INTERVAL = 1
+REPLICA_HEARTBEAT_NAME = "heartbeat"
+RECENT_WRITE_CACHE_KEY = "minimart_pos_recent_write"
+
+
+def replica_read(fn):
+	"""Run a read-only endpoint against the read replica when that is safe.
+
+	Uses the same site config as `frappe.read_only` (`read_from_replica`,
+	`replica_host`). The call stays on the primary while the current transaction
+	has writes, for `mart_pos_replica_sticky_seconds` (default 10) after the same
+	user wrote through Mart POS, and when the replica is more than
+	`mart_pos_replica_max_lag` seconds (default 5) behind or has no heartbeat yet.
+	Each routed call is counted for `get_replica_read_stats`.
+	"""
+
+	@functools.wraps(fn)
+	def wrapper(*args, **kwargs):
+		if not (frappe.conf.read_from_replica and frappe.conf.replica_host) or is_reading_from_replica():
+			return fn(*args, **kwargs)
+
+		if cint(getattr(frappe.local.db, "transaction_writes", 0)):
+			route = "transaction"
+		elif frappe.cache().get_value(f"{RECENT_WRITE_CACHE_KEY}:{frappe.session.user}"):
+			route = "recent_write"
+		else:
+			route = connect_read_replica()
+
+		record_replica_read(fn.__name__, route)
+		if route != "replica":
+			return fn(*args, **kwargs)
+		try:
+			return fn(*args, **kwargs)
+		finally:
+			disconnect_read_replica()
+
+	return wrapper
+
+
+def is_reading_from_replica():
+	return bool(getattr(frappe.local, "primary_db", None))
+
+
+def connect_read_replica():
+	"""Switch `frappe.db` to the replica and return "replica", or the reason it stayed on the primary."""
+	primary_db = frappe.local.db
+	try:
+		frappe.connect_replica()
+	except Exception:
+		frappe.logger("minimart_pos").warning("Could not connect to the read replica", exc_info=True)
+		return "error"
+	if frappe.local.db is primary_db:
+		return "error"
+
+	try:
+		lag = get_replica_lag()
+	except Exception:
+		# Heartbeat table not replicated yet, replica error, or the primary stamp failed.
+		frappe.logger("minimart_pos").warning("Could not read the replica heartbeat", exc_info=True)
+		disconnect_read_replica()
+		return "error"
+	if lag is None or lag > cint(frappe.conf.get("mart_pos_replica_max_lag") or 5):
+		disconnect_read_replica()
+		return "not_replicating" if lag is None else "lag"
+	return "replica"
+
+
+def disconnect_read_replica():
+	replica_db = frappe.local.db
+	frappe.local.db = frappe.local.primary_db
+	for attr in ("primary_db", "replica_db"):
+		if hasattr(frappe.local, attr):
+			delattr(frappe.local, attr)
+	replica_db.close()
+
+
+def get_replica_lag():
+	"""Return how many seconds the replica is behind, or None before it has a heartbeat.
+
+	Must be called on the replica connection. Reads the age of the heartbeat
+	row the replica has applied, then stamps a new one on the primary for the
+	next check. The age counts from the previous check's stamp, so it never
+	under-reports: after an idle spell the first check sees an old beat and
+	that read stays on the primary. The answer is cached for a second, so the
+	primary gets at most one heartbeat write a second.
+	"""
+	cache = frappe.cache()
+	lag = cache.get_value(REPLICA_LAG_CACHE_KEY)
+	if lag is None:
+		age = frappe.db.sql(
+			"""
+			SELECT TIMESTAMPDIFF(MICROSECOND, beat, UTC_TIMESTAMP(6)) / 1000000
+			FROM `tabMart POS Replica Heartbeat`
+			WHERE name = %s
+			""",
+			REPLICA_HEARTBEAT_NAME,
+		)
+		lag = max(flt(age[0][0]), 0) if age else -1
+		write_replica_heartbeat()
+		cache.set_value(REPLICA_LAG_CACHE_KEY, lag, expires_in_sec=REPLICA_LAG_CHECK_INTERVAL)
+	return None if lag < 0 else lag
+
+
+def write_replica_heartbeat():
+	"""Stamp the heartbeat row on the primary and commit.
+
+	Only reached from `replica_read`, which routes to the replica only when the
+	primary transaction has no writes, so the commit carries nothing else.
+	"""
+	primary_db = frappe.local.primary_db
+	primary_db.sql(
+		"""
+		INSERT INTO `tabMart POS Replica Heartbeat` (name, beat, creation, modified, owner, modified_by)
+		VALUES (%(name)s, UTC_TIMESTAMP(6), NOW(6), NOW(6), 'Administrator', 'Administrator')
+		ON DUPLICATE KEY UPDATE beat = UTC_TIMESTAMP(6), modified = NOW(6)
+		""",
+		{"name": REPLICA_HEARTBEAT_NAME},
+	)
+	primary_db.commit()
+
+
+def mark_recent_write():
+	"""Keep the current user's reads on the primary for a few seconds after a Mart POS write."""
+	if frappe.conf.read_from_replica:
+		frappe.cache().set_value(
+			f"{RECENT_WRITE_CACHE_KEY}:{frappe.session.user}",
+			1,
+			expires_in_sec=cint(frappe.conf.get("mart_pos_replica_sticky_seconds") or 10),
+		)
+
+
+def record_replica_read(endpoint, route):
+	cache = frappe.cache()
+	key = cache.make_key(REPLICA_READ_STATS_CACHE_KEY)
+	pipe = cache.pipeline()
+	pipe.hincrby(key, route, 1)
+	pipe.hincrby(key, f"{endpoint}:{route}", 1)
+	pipe.execute()
+
+
+@frappe.whitelist()
+def get_replica_read_stats(reset=False):
+	"""Return how many routed reads were served by the replica, and why the rest were not."""
+	frappe.only_for("System Manager")
+	cache = frappe.cache()
+	key = cache.make_key(REPLICA_READ_STATS_CACHE_KEY)
+	pipe = cache.pipeline()
+	pipe.hgetall(key)
+	if is_truthy(reset):
+		pipe.delete(key)
+	counts = {frappe.safe_decode(field): cint(value) for field, value in pipe.execute()[0].items()}
+
+	routes = {field: count for field, count in counts.items() if ":" not in field}
+	endpoints = {}
+	for field, count in counts.items():
+		if ":" in field:
+			endpoint, route = field.split(":", 1)
+			endpoints.setdefault(endpoint, {})[route] = count
+
+	total = sum(routes.values())
+	return {
+		"total": total,
+		"replica": routes.get("replica", 0),
+		"replica_share": flt(routes.get("replica", 0) / total, 4) if total else 0,
+		"routes": routes,
+		"endpoints": endpoints,
+	}
+
+
 def get_latest_item_price_rate(item_code, uom, price_list, pricing_date=None):
 	"""Return the latest active price for one item/UOM/price list as of the given date."""
 	pricing_date = pricing_date or get_current_pricing_date()
+	# Plain column comparisons, so the (item_code, price_list, uom, valid_from,
+	# creation) index serves the ORDER BY; NULLs sort last in DESC order.
+	uom_condition = "ip.uom = %s" if uom else "IFNULL(ip.uom, '') = %s"
 	result = frappe.db.sql(
-		"""
+		f"""
 		SELECT ip.price_list_rate
 		FROM `tabItem Price` ip
 		WHERE ip.item_code = %s
 			AND ip.price_list = %s
-			AND IFNULL(ip.uom, '') = %s
+			AND {uom_condition}
 			AND (ip.valid_from IS NULL OR ip.valid_from <= %s)
 			AND (ip.valid_upto IS NULL OR ip.valid_upto >= %s)
-		ORDER BY
-			COALESCE(ip.valid_from, '1900-01-01') DESC,
-			COALESCE(ip.creation, '1900-01-01 00:00:00') DESC,
-			ip.name DESC
+		ORDER BY ip.valid_from DESC, ip.creation DESC, ip.name DESC
 		LIMIT 1
 		""",
 		(item_code, price_list, uom or "", pricing_date, pricing_date),
@@ -39,6 +237,7 @@ def get_latest_item_price_rate(item_code, uom, price_list, pricing_date=None):
 
 
 @frappe.whitelist()
+@replica_read
 def get_item_uoms_and_prices(item_code, price_list=None):
 	"""Return UOMs and prices for an item, for POS UOM switching."""
 	if not item_code:
@@ -95,20 +294,18 @@ def get_bundle_components(item_code, warehouse=None):
 	for row in components:
 		if not frappe.db.get_value("Item", row.item_code, "is_stock_item"):
 			continue
+		component_rows.append({"item_code": row.item_code, "qty": flt(row.qty)})
 
-		component = {"item_code": row.item_code, "qty": flt(row.qty)}
-		if warehouse:
-			component["available_qty"] = get_available_qty(row.item_code, warehouse)
-		component_rows.append(component)
+	if warehouse and component_rows:
+		available_qty_map = get_available_qty_map({row["item_code"] for row in component_rows}, warehouse)
+		for component in component_rows:
+			component["available_qty"] = available_qty_map.get(component["item_code"], 0)
 
 	return component_rows
 
 
 def get_available_qty(item_code, warehouse):
-	availability, is_stock_item, _ = get_stock_availability(item_code, warehouse)
-	if not is_stock_item:
-		return 0
-	return flt(availability)
+	return get_available_qty_map([item_code], warehouse).get(item_code, 0)
 
 
 def resolve_item_code(item_code_or_barcode):
@@ -144,9 +341,10 @@ def add_required_stock(required_stock, item_code, qty):
 def validate_cart_stock(cart):
 	"""Validate Mart POS cart stock from the server-side POS Profile warehouse.
 
-	Product-card quantities are display-only. Checkout validation uses ERPNext's
-	POS stock availability helper so barcode/search items, filtered cards, paged
-	cards, and Product Bundle components do not depend on the current DOM.
+	Product-card quantities are display-only. Checkout validation reads Bin and
+	the pending POS quantity counter on the server so barcode/search items,
+	filtered cards, paged cards, and Product Bundle components do not depend on
+	the current DOM.
 	"""
 	profile = get_assigned_pos_profile()
 	warehouse = profile.warehouse
@@ -191,14 +389,14 @@ def validate_cart_stock(cart):
 				"stock_uom": item_doc.stock_uom,
 			}
 
+	available_qty_map = get_available_qty_map(
+		[item_code for item_code in required_stock if not item_details.get(item_code, {}).get("missing")],
+		warehouse,
+	)
 	issues = []
 	for item_code, required_qty in required_stock.items():
 		details = item_details.get(item_code) or {}
-		if details.get("missing"):
-			available_qty = 0
-		else:
-			availability, is_stock_item, _ = get_stock_availability(item_code, warehouse)
-			available_qty = flt(availability) if is_stock_item else 0
+		available_qty = available_qty_map.get(item_code, 0)
 		if required_qty > available_qty:
 			issues.append(
 				{
@@ -309,28 +507,256 @@ def get_bundle_available_qty(components):
 	return min(possible_qty) if possible_qty else 0
 
 
-def get_catalog_rows(profile, item_code=None, search_term=None, item_group=None, limit_page_length=None, in_stock_only=True):
+# --- PENDING POS QTY ---
+
+# POS Invoices are submitted with update_stock = 0, so their quantities stay out
+# of Bin until the shift is consolidated. `Mart POS Pending Qty` keeps that
+# quantity per (item, warehouse), counting POS Invoice Item rows and the Packed
+# Item rows of bundles, so availability is Bin minus one stored number instead
+# of a sum over every unconsolidated invoice line.
+
+
+def get_available_qty_map(item_codes, warehouse):
+	"""Return {item_code: Bin actual qty - pending POS qty} for stock items, in one query.
+
+	Non-stock items are left out (their availability is 0).
+	"""
+	item_codes = list(item_codes or [])
+	if not item_codes or not warehouse:
+		return {}
+
+	return {
+		item_code: flt(qty)
+		for item_code, qty in frappe.db.sql(
+			"""
+			SELECT i.name, COALESCE(b.actual_qty, 0) - COALESCE(pq.pending_qty, 0)
+			FROM `tabItem` i
+			LEFT JOIN `tabBin` b ON b.item_code = i.name AND b.warehouse = %s
+			LEFT JOIN `tabMart POS Pending Qty` pq ON pq.item_code = i.name AND pq.warehouse = %s
+			WHERE i.name IN %s AND i.is_stock_item = 1
+			""",
+			(warehouse, warehouse, tuple(item_codes)),
+		)
+	}
+
+
+def on_pos_invoice_submit(doc, method=None):
+	add_pending_pos_qty([doc.name], 1)
+
+
+def on_pos_invoice_cancel(doc, method=None):
+	if not doc.get("consolidated_invoice"):
+		add_pending_pos_qty([doc.name], -1)
+
+
+def on_pos_invoice_merge_log_submit(doc, method=None):
+	add_pending_pos_qty([row.pos_invoice for row in doc.pos_invoices], -1)
+
+
+def on_pos_invoice_merge_log_cancel(doc, method=None):
+	add_pending_pos_qty([row.pos_invoice for row in doc.pos_invoices], 1)
+
+
+def add_pending_pos_qty(invoice_names, sign):
+	"""Add (sign=1) or remove (sign=-1) the quantities of the given POS Invoices from the counter.
+
+	Runs inside the invoice's own transaction, so the counter and the invoice
+	commit or roll back together.
+	"""
+	invoice_names = [name for name in invoice_names if name]
+	if not invoice_names:
+		return
+
+	rows = get_pending_pos_qty_rows({"invoices": tuple(invoice_names)}, "p.name IN %(invoices)s")
+	write_pending_pos_qty([(item_code, warehouse, sign * flt(qty)) for item_code, warehouse, qty in rows])
+
+
+def get_pending_pos_qty_rows(values, condition):
+	"""Return (item_code, warehouse, stock qty) of POS Invoice items and packed bundle components."""
+	rows = {}
+	for item_code, warehouse, qty in frappe.db.sql(
+		f"""
+		SELECT pii.item_code, pii.warehouse, SUM(pii.stock_qty)
+		FROM `tabPOS Invoice Item` pii
+		INNER JOIN `tabPOS Invoice` p ON p.name = pii.parent
+		WHERE {condition}
+		GROUP BY pii.item_code, pii.warehouse
+		UNION ALL
+		SELECT pk.item_code, pk.warehouse, SUM(pk.qty)
+		FROM `tabPacked Item` pk
+		INNER JOIN `tabPOS Invoice` p ON p.name = pk.parent AND pk.parenttype = 'POS Invoice'
+		WHERE {condition}
+		GROUP BY pk.item_code, pk.warehouse
+		""",
+		values,
+	):
+		if item_code and warehouse:
+			rows[(item_code, warehouse)] = rows.get((item_code, warehouse), 0) + flt(qty)
+	return [(item_code, warehouse, qty) for (item_code, warehouse), qty in rows.items()]
+
+
+def write_pending_pos_qty(rows):
+	"""Add each (item_code, warehouse, qty) delta to the counter."""
+	rows = [row for row in rows if row[2]]
+	if not rows:
+		return
+
+	now = now_datetime()
+	placeholders = ", ".join(["(%s, %s, %s, %s, %s, 0, 0, %s, %s, %s)"] * len(rows))
+	frappe.db.sql(
+		f"""
+		INSERT INTO `tabMart POS Pending Qty`
+			(name, creation, modified, modified_by, owner, docstatus, idx,
+			item_code, warehouse, pending_qty)
+		VALUES {placeholders}
+		ON DUPLICATE KEY UPDATE
+			pending_qty = pending_qty + VALUES(pending_qty),
+			modified = VALUES(modified)
+		""",
+		[
+			value
+			for item_code, warehouse, qty in rows
+			for value in (
+				get_pending_pos_qty_name(item_code, warehouse),
+				now,
+				now,
+				"Administrator",
+				"Administrator",
+				item_code,
+				warehouse,
+				qty,
+			)
+		],
+	)
+
+
+def get_pending_pos_qty_name(item_code, warehouse):
+	return hashlib.md5(f"{warehouse}::{item_code}".encode()).hexdigest()
+
+
+def rebuild_pending_pos_qty():
+	"""Recompute the whole counter from the unconsolidated submitted POS Invoices."""
+	frappe.db.delete("Mart POS Pending Qty")
+	write_pending_pos_qty(
+		get_pending_pos_qty_rows({}, "p.docstatus = 1 AND IFNULL(p.consolidated_invoice, '') = ''")
+	)
+
+
+def verify_pending_pos_qty(warehouse=None, fix=False):
+	"""Compare the counter with ERPNext's `get_pos_reserved_qty` and return the differences.
+
+	Checks every pair that has a counter row or an unconsolidated POS Invoice
+	line. With `fix`, the counter is rebuilt when anything differs. Runs daily
+	with `fix`; also usable as
+	`bench --site <site> execute minimart_pos.api.verify_pending_pos_qty`.
+	"""
+	condition = "p.docstatus = 1 AND IFNULL(p.consolidated_invoice, '') = ''"
+	pairs = {(item_code, wh) for item_code, wh, qty in get_pending_pos_qty_rows({}, condition)}
+	counters = {
+		(row.item_code, row.warehouse): flt(row.pending_qty)
+		for row in frappe.get_all(
+			"Mart POS Pending Qty",
+			fields=["item_code", "warehouse", "pending_qty"],
+			limit_page_length=0,
+		)
+	}
+	pairs.update(counters)
+
+	mismatches = []
+	for item_code, wh in sorted(pairs):
+		if warehouse and wh != warehouse:
+			continue
+		expected = flt(get_pos_reserved_qty(item_code, wh))
+		counted = counters.get((item_code, wh), 0)
+		if abs(expected - counted) > 1e-6:
+			mismatches.append({"item_code": item_code, "warehouse": wh, "expected": expected, "counter": counted})
+
+	if mismatches:
+		frappe.logger("minimart_pos").warning(f"Pending POS qty differs for {len(mismatches)} items: {mismatches[:20]}")
+		if is_truthy(fix):
+			rebuild_pending_pos_qty()
+	return mismatches
+
+
+def daily_verify_pending_pos_qty():
+	verify_pending_pos_qty(fix=True)
+
+
+CATALOG_UOM_SQL = "COALESCE(ip.uom, i.stock_uom)"
+CATALOG_CONVERSION_FACTOR_SQL = f"""
+	CASE
+		WHEN {CATALOG_UOM_SQL} = i.stock_uom THEN 1
+		ELSE COALESCE(iu.conversion_factor, 1)
+	END
+"""
+
+
+def get_catalog_rows(
+	profile,
+	item_code=None,
+	search_term=None,
+	item_group=None,
+	limit_page_length=None,
+	in_stock_only=True,
+	scan_code=None,
+	cursor=None,
+	order_by=None,
+	velocity_days=None,
+	with_sort_keys=False,
+	item_codes=None,
+):
+	"""Return priced catalog rows for the POS profile.
+
+	Rows are ordered by `get_catalog_sort_keys`. Passing the `cursor` of the last
+	row of a page continues after it (keyset pagination), so deep pages cost the
+	same as the first one. `order_by="velocity"` puts the best sellers of the
+	last `velocity_days` first. `with_sort_keys` adds the computed sort columns
+	(`sort_*`) that `get_catalog_cursor` needs.
+	"""
 	pricing_date = get_current_pricing_date()
 	conditions = [
 		"i.disabled = 0",
 		"i.has_variants = 0",
 		"i.is_sales_item = 1",
-		"(i.is_stock_item = 1 OR EXISTS (SELECT 1 FROM `tabProduct Bundle` pb WHERE pb.name = i.name AND pb.disabled = 0))",
 	]
-	values = [profile.selling_price_list, pricing_date, pricing_date, pricing_date, pricing_date]
+	stock_join = ""
+	stock_join_values = []
+	join_values = [profile.selling_price_list, pricing_date, pricing_date, pricing_date, pricing_date]
+	values = []
 
 	warehouse = (profile.warehouse or "").strip()
 	if in_stock_only and warehouse:
-		conditions.append("EXISTS (SELECT 1 FROM `tabBin` b WHERE b.item_code = i.name AND b.warehouse = %s AND b.actual_qty > 0)")
-		values.append(warehouse)
+		# Only stock items with stock and bundles that can be made are in this set.
+		stock_join = "INNER JOIN `tabMart POS In Stock Item` st ON st.item_code = i.name AND st.warehouse = %s"
+		stock_join_values.append(warehouse)
+	else:
+		conditions.append(
+			"(i.is_stock_item = 1 OR EXISTS (SELECT 1 FROM `tabProduct Bundle` pb WHERE pb.name = i.name AND pb.disabled = 0))"
+		)
 
 	if item_code:
 		conditions.append("i.name = %s")
 		values.append(item_code)
 
+	if item_codes is not None:
+		conditions.append("i.name IN %s")
+		values.append(tuple(item_codes) or ("",))
+
+	if scan_code:
+		# Resolved to item codes first: an IN subquery inside an OR cannot use
+		# the Item primary key, and would scan the whole table on every scan.
+		conditions.append("i.name IN %s")
+		values.append(
+			(scan_code, *frappe.get_all("Item Barcode", filters={"barcode": scan_code}, pluck="parent"))
+		)
+
 	if item_group:
-		conditions.append("i.item_group = %s")
-		values.append(item_group)
+		# Nested-set range: the group itself and every group below it.
+		bounds = frappe.db.get_value("Item Group", item_group, ["lft", "rgt"])
+		conditions.append(
+			"i.item_group IN (SELECT ig.name FROM `tabItem Group` ig WHERE ig.lft >= %s AND ig.rgt <= %s)"
+		)
+		values.extend(bounds or [0, -1])
 
 	if search_term:
 		like_query = f"%{search_term}%"
@@ -339,20 +765,36 @@ def get_catalog_rows(profile, item_code=None, search_term=None, item_group=None,
 		)
 		values.extend([search_term, like_query, like_query, search_term])
 
-	order_by = "i.item_name ASC, conversion_factor ASC"
-	if search_term:
-		like_query = f"%{search_term}%"
-		values.extend([search_term, search_term, like_query])
-		order_by = """
-			CASE
-				WHEN i.name = %s THEN 0
-				WHEN i.item_name = %s THEN 1
-				WHEN i.name LIKE %s THEN 2
-				ELSE 3
-			END,
-			i.item_name ASC,
-			conversion_factor ASC
+	velocity_join = ""
+	if order_by == "velocity":
+		velocity_join = """
+			LEFT JOIN (
+				SELECT sd.item_code, SUM(sd.stock_qty) as units
+				FROM `tabMart POS Item Sales Daily` sd
+				WHERE sd.warehouse = %s AND sd.sales_date >= %s
+				GROUP BY sd.item_code
+			) sv ON sv.item_code = i.name
 		"""
+		join_values.extend([warehouse, add_days(pricing_date, -get_velocity_days(velocity_days))])
+
+	sort_keys = get_catalog_sort_keys(search_term, order_by)
+	if cursor:
+		cursor_values = decode_catalog_cursor(cursor, len(sort_keys))
+		condition, condition_values = get_keyset_condition(sort_keys, cursor_values)
+		conditions.append(condition)
+		values.extend(condition_values)
+
+	order_by_sql = ", ".join(f"{expression} ASC" for expression, _expression_values, _field in sort_keys)
+	for _expression, expression_values, _field in sort_keys:
+		values.extend(expression_values)
+
+	select_sort_keys = ""
+	select_values = []
+	if with_sort_keys:
+		for expression, expression_values, field in sort_keys:
+			if field.startswith("sort_"):
+				select_sort_keys += f"{expression} as {field},"
+				select_values.extend(expression_values)
 
 	limit_clause = ""
 	if limit_page_length:
@@ -362,17 +804,16 @@ def get_catalog_rows(profile, item_code=None, search_term=None, item_group=None,
 	return frappe.db.sql(
 		f"""
 		SELECT
+			{select_sort_keys}
 			i.name as item_code,
 			i.item_name,
 			i.image,
 			i.item_group,
-			COALESCE(ip.uom, i.stock_uom) as uom,
-			CASE
-				WHEN COALESCE(ip.uom, i.stock_uom) = i.stock_uom THEN 1
-				ELSE COALESCE(iu.conversion_factor, 1)
-			END as conversion_factor,
+			{CATALOG_UOM_SQL} as uom,
+			{CATALOG_CONVERSION_FACTOR_SQL} as conversion_factor,
 			COALESCE(ip.price_list_rate, 0) as price
 		FROM `tabItem` i
+		{stock_join}
 		LEFT JOIN `tabItem Price` ip
 			ON ip.item_code = i.name
 			AND ip.price_list = %s
@@ -400,15 +841,111 @@ def get_catalog_rows(profile, item_code=None, search_term=None, item_group=None,
 					)
 			)
 		LEFT JOIN `tabUOM Conversion Detail` iu ON iu.parent = i.name AND iu.uom = ip.uom
+		{velocity_join}
 		WHERE {" AND ".join(conditions)}
-		ORDER BY {order_by}
+		ORDER BY {order_by_sql}
 		{limit_clause}
 		""",
-		values,
+		select_values + stock_join_values + join_values + values,
 		as_dict=1,
 	)
 
 
+def get_catalog_sort_keys(search_term=None, order_by=None):
+	"""Return the catalog ORDER BY keys as (sql, values, row field) triples, all ascending.
+
+	The last two keys (item code, UOM) make every row's key unique, which keyset
+	pagination relies on. Keys computed only for sorting use `sort_*` fields.
+	"""
+	sort_keys = []
+	if search_term:
+		sort_keys.append(
+			(
+				"""CASE
+					WHEN i.name = %s THEN 0
+					WHEN i.item_name = %s THEN 1
+					WHEN i.name LIKE %s THEN 2
+					ELSE 3
+				END""",
+				[search_term, search_term, f"%{search_term}%"],
+				"sort_search_rank",
+			)
+		)
+	if order_by == "velocity":
+		sort_keys.append(("-COALESCE(sv.units, 0)", [], "sort_velocity"))
+	sort_keys.extend(
+		[
+			("i.item_name", [], "item_name"),
+			(CATALOG_CONVERSION_FACTOR_SQL, [], "conversion_factor"),
+			("i.name", [], "item_code"),
+			(CATALOG_UOM_SQL, [], "uom"),
+		]
+	)
+	return sort_keys
+
+
+def get_keyset_condition(sort_keys, cursor_values):
+	"""Build `(k1, k2, ...) > (v1, v2, ...)` for ascending keys.
+
+	Spelled out as OR-ed prefixes rather than a row constructor so each key can be
+	an expression. When the item name leads, a plain `>=` on it is added so the
+	database can seek on its index instead of scanning from the start.
+	"""
+	clauses = []
+	values = []
+	for position in range(len(sort_keys)):
+		parts = []
+		for expression, expression_values, _field in sort_keys[:position]:
+			parts.append(f"{expression} = %s")
+			values.extend(expression_values)
+			values.append(cursor_values[len(parts) - 1])
+		expression, expression_values, _field = sort_keys[position]
+		parts.append(f"{expression} > %s")
+		values.extend(expression_values)
+		values.append(cursor_values[position])
+		clauses.append("(" + " AND ".join(parts) + ")")
+
+	condition = "(" + " OR ".join(clauses) + ")"
+	if sort_keys[0][0] == "i.item_name":
+		condition = f"(i.item_name >= %s AND {condition})"
+		values.insert(0, cursor_values[0])
+	return condition, values
+
+
+def get_catalog_cursor(row, sort_keys):
+	"""Return the opaque cursor pointing just after this catalog row."""
+	key = [
+		row[field] if isinstance(row[field], str) else flt(row[field])
+		for _expression, _expression_values, field in sort_keys
+	]
+	return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode()
+
+
+def decode_catalog_cursor(cursor, key_count):
+	try:
+		cursor_values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+	except (ValueError, TypeError):
+		cursor_values = None
+	if not isinstance(cursor_values, list) or len(cursor_values) != key_count:
+		frappe.throw(_("Invalid product page cursor. Reload the product list."))
+	return cursor_values
+
+
+def get_catalog_page(profile, page_length, cursor=None, **filters):
+	"""Return one page of catalog rows and the cursor for the next page (None on the last page)."""
+	rows = get_catalog_rows(
+		profile, limit_page_length=page_length + 1, cursor=cursor, with_sort_keys=True, **filters
+	)
+	sort_keys = get_catalog_sort_keys(filters.get("search_term"), filters.get("order_by"))
+	next_cursor = get_catalog_cursor(rows[page_length - 1], sort_keys) if len(rows) > page_length else None
+	rows = rows[:page_length]
+	for row in rows:
+		for _expression, _expression_values, field in sort_keys:
+			if field.startswith("sort_"):
+				row.pop(field, None)
+	return rows, next_cursor
+
+
 def validate_shift_stock(opening_entry):
 	"""Fail early with a clean message if closing the shift would create negative stock."""
 	# Reuse ERPNext POS invoice selection logic.
@@ -486,11 +1023,8 @@ def validate_shift_stock(opening_entry):
 # --- SHIFT MANAGEMENT ---
 
 
-@frappe.whitelist()
-def check_pos_opening():
-	"""Checks active shift and returns profile configuration."""
-	profile = get_assigned_pos_profile()
-	opening_entry = frappe.db.get_value(
+def get_open_opening_entry(profile):
+	return frappe.db.get_value(
 		"POS Opening Entry",
 		{
 			"pos_profile": profile.name,
@@ -501,6 +1035,9 @@ def check_pos_opening():
 		"name",
 	)
 
+
+def get_shift_context(profile):
+	opening_entry = get_open_opening_entry(profile)
 	payment_methods = [p.mode_of_payment for p in profile.payments]
 
 	opening_doc = frappe.get_doc("POS Opening Entry", opening_entry) if opening_entry else None
@@ -523,6 +1060,388 @@ def check_pos_opening():
 	}
 
 
+@frappe.whitelist()
+def check_pos_opening():
+	"""Checks active shift and returns profile configuration."""
+	return get_shift_context(get_assigned_pos_profile())
+
+
+def get_payment_modes(profile):
+	modes = [p.mode_of_payment for p in profile.payments]
+	if not modes:
+		return []
+
+	mode_types = dict(
+		frappe.get_all(
+			"Mode of Payment",
+			filters={"name": ["in", modes]},
+			fields=["name", "type"],
+			as_list=True,
+		)
+	)
+	return [
+		{
+			"mode_of_payment": p.mode_of_payment,
+			"default": p.default,
+			"type": mode_types.get(p.mode_of_payment),
+		}
+		for p in profile.payments
+	]
+
+
+@frappe.whitelist()
+def get_pos_item_groups():
+	"""Return the Item Groups offered in the Mart POS group filter."""
+	return get_item_group_options(get_assigned_pos_profile())
+
+
+# --- ITEM GROUP TREE ---
+
+ITEM_GROUP_TREE_CACHE_KEY = "minimart_pos_item_group_tree"
+ITEM_GROUP_DIRTY_CACHE_KEY = "minimart_pos_item_group_dirty"
+
+
+def get_item_group_options(profile):
+	"""Return the group filter options in tree order with in-stock item counts.
+
+	Parent groups are included so a whole branch can be picked. With a POS
+	warehouse, groups without in-stock items are left out.
+	"""
+	warehouse = (profile.warehouse or "").strip()
+	tree = get_item_group_tree(warehouse)
+	options = []
+	for group in tree["groups"]:
+		if not group["parent_item_group"]:
+			continue
+		item_count = tree["counts"].get(group["name"], 0)
+		if warehouse and not item_count:
+			continue
+		options.append(
+			{
+				"name": group["name"],
+				"depth": group["depth"],
+				"item_count": item_count if warehouse else None,
+			}
+		)
+	return options
+
+
+def get_item_group_tree(warehouse):
+	"""Return the cached Item Group tree for a warehouse.
+
+	Items touched by stock movements since the last read are re-checked in one
+	query and the counts adjusted; the tree is only rebuilt from scratch when the
+	cache is empty (Item Group or Item master changes clear it).
+	"""
+	cache = frappe.cache()
+	tree_key = f"{ITEM_GROUP_TREE_CACHE_KEY}:{warehouse}"
+	dirty_key = f"{ITEM_GROUP_DIRTY_CACHE_KEY}:{warehouse}"
+
+	tree = cache.get_value(tree_key)
+	if tree is None:
+		cache.delete_value(dirty_key)
+		tree = {
+			"groups": get_item_group_rows(),
+			"in_stock": get_in_stock_item_groups(warehouse),
+		}
+	else:
+		dirty = [frappe.safe_decode(item_code) for item_code in cache.smembers(dirty_key)]
+		if not dirty:
+			return tree
+		cache.srem(dirty_key, *dirty)
+		in_stock = {
+			item_code: item_group
+			for item_code, item_group in tree["in_stock"].items()
+			if item_code not in dirty
+		}
+		in_stock.update(get_in_stock_item_groups(warehouse, dirty))
+		tree["in_stock"] = in_stock
+
+	tree["counts"] = get_item_group_counts(tree["groups"], tree["in_stock"])
+	cache.set_value(tree_key, tree)
+	return tree
+
+
+def get_item_group_rows():
+	groups = frappe.get_all(
+		"Item Group",
+		fields=["name", "parent_item_group", "lft", "rgt", "is_group"],
+		order_by="lft asc",
+	)
+	# In lft order every group follows its ancestors, so depth falls out of a stack of open ranges.
+	open_groups = []
+	for group in groups:
+		while open_groups and open_groups[-1]["rgt"] < group["lft"]:
+			open_groups.pop()
+		group["depth"] = len(open_groups)
+		open_groups.append(group)
+	return groups
+
+
+def get_in_stock_item_groups(warehouse, item_codes=None):
+	"""Return {item_code: item_group} for catalog items in the warehouse's in-stock set."""
+	if not warehouse:
+		return {}
+
+	conditions = ""
+	values = [warehouse]
+	if item_codes is not None:
+		if not item_codes:
+			return {}
+		conditions = "AND i.name IN %s"
+		values.append(tuple(item_codes))
+
+	return dict(
+		frappe.db.sql(
+			f"""
+			SELECT i.name, i.item_group
+			FROM `tabItem` i
+			INNER JOIN `tabMart POS In Stock Item` st ON st.item_code = i.name AND st.warehouse = %s
+			WHERE i.disabled = 0
+				AND i.has_variants = 0
+				AND i.is_sales_item = 1
+				{conditions}
+			""",
+			values,
+		)
+	)
+
+
+def get_item_group_counts(groups, in_stock):
+	"""Count in-stock items per group, including everything in its subtree."""
+	parents = {group["name"]: group["parent_item_group"] for group in groups}
+	counts = {}
+	for item_group in in_stock.values():
+		while item_group:
+			counts[item_group] = counts.get(item_group, 0) + 1
+			item_group = parents.get(item_group)
+	return counts
+
+
+def clear_item_group_tree_cache(doc=None, method=None, *args, **kwargs):
+	frappe.cache().delete_keys(ITEM_GROUP_TREE_CACHE_KEY)
+
+
+def mark_item_groups_dirty(warehouse, item_codes):
+	if item_codes:
+		frappe.cache().sadd(f"{ITEM_GROUP_DIRTY_CACHE_KEY}:{warehouse}", *item_codes)
+
+
+# --- IN-STOCK ITEMS ---
+
+# `Mart POS In Stock Item` holds, per warehouse, the stock items with stock and
+# the active bundles whose components can all be fulfilled. The in-stock
+# catalog joins it instead of checking Bin and Product Bundle per row.
+IN_STOCK_ITEM_BATCH_SIZE = 1000
+
+
+def on_stock_ledger_entry_submit(doc, method=None):
+	"""Collect the stock changes of this transaction and refresh them once it commits.
+
+	Bin quantities are final only after commit, and one refresh job per
+	transaction covers every line of a large stock entry.
+	"""
+	pending = frappe.flags.mart_pos_stock_changes
+	if pending is None:
+		pending = frappe.flags.mart_pos_stock_changes = {}
+		frappe.db.after_commit.add(enqueue_in_stock_refresh)
+		frappe.db.after_rollback.add(lambda: frappe.flags.pop("mart_pos_stock_changes", None))
+	pending.setdefault(doc.warehouse, set()).add(doc.item_code)
+
+
+def enqueue_in_stock_refresh():
+	pending = frappe.flags.pop("mart_pos_stock_changes", None) or {}
+	for warehouse, item_codes in pending.items():
+		frappe.enqueue(
+			"minimart_pos.api.refresh_in_stock_items",
+			queue="short",
+			warehouse=warehouse,
+			item_codes=sorted(item_codes),
+		)
+
+
+def on_product_bundle_change(doc, method=None):
+	"""Product Bundle hook: re-check the bundle in every warehouse that has it or its components."""
+	frappe.enqueue(
+		"minimart_pos.api.refresh_bundle_in_stock",
+		queue="short",
+		bundle=doc.name,
+		enqueue_after_commit=True,
+	)
+
+
+def refresh_bundle_in_stock(bundle):
+	warehouses = set(
+		frappe.get_all("Mart POS In Stock Item", filters={"item_code": bundle}, pluck="warehouse")
+	)
+	components = frappe.get_all("Product Bundle Item", filters={"parent": bundle}, pluck="item_code")
+	if components:
+		warehouses.update(
+			frappe.get_all(
+				"Bin",
+				filters={"item_code": ["in", components], "actual_qty": [">", 0]},
+				pluck="warehouse",
+				distinct=True,
+			)
+		)
+	for warehouse in warehouses:
+		refresh_in_stock_items(warehouse, [bundle])
+
+
+def refresh_in_stock_items(warehouse, item_codes):
+	"""Re-check the given items, and the bundles built from them, in one warehouse."""
+	item_codes = set(item_codes)
+	if not warehouse or not item_codes:
+		return
+
+	item_codes.update(
+		frappe.get_all(
+			"Product Bundle Item",
+			filters={"item_code": ["in", list(item_codes)]},
+			pluck="parent",
+			distinct=True,
+		)
+	)
+	in_stock = get_in_stock_items(warehouse, item_codes)
+	write_in_stock_items(warehouse, in_stock, item_codes)
+	mark_item_groups_dirty(warehouse, item_codes)
+
+
+def rebuild_in_stock_items(warehouse=None):
+	"""Recompute the in-stock set of one warehouse, or of every warehouse with stock or a POS Profile.
+
+	Used to fill the table on migrate and daily to repair anything the hooks
+	missed (stock changed by SQL, cancellations, Item master edits).
+	"""
+	if warehouse:
+		warehouses = [warehouse]
+	else:
+		warehouses = set(
+			frappe.get_all("Bin", filters={"actual_qty": [">", 0]}, pluck="warehouse", distinct=True)
+		)
+		warehouses.update(frappe.get_all("Mart POS In Stock Item", pluck="warehouse", distinct=True))
+		warehouses = sorted(warehouses)
+
+	for warehouse in warehouses:
+		write_in_stock_items(warehouse, get_in_stock_items(warehouse))
+		frappe.db.commit()
+	clear_item_group_tree_cache()
+
+
+def get_in_stock_items(warehouse, item_codes=None):
+	"""Return {item_code: is_bundle} for stock items with stock and fulfillable active bundles.
+
+	A bundle counts when every stock component has at least its bundle quantity
+	available, which is when `get_bundle_available_qty` is 1 or more.
+	"""
+	bin_filters = {"warehouse": warehouse, "actual_qty": [">", 0]}
+	bundle_filters = {"disabled": 0}
+	if item_codes is not None:
+		bin_filters["item_code"] = ["in", list(item_codes)]
+		bundle_filters["name"] = ["in", list(item_codes)]
+
+	in_stock = dict.fromkeys(frappe.get_all("Bin", filters=bin_filters, pluck="item_code", limit_page_length=0), 0)
+
+	bundle_names = frappe.get_all("Product Bundle", filters=bundle_filters, pluck="name", limit_page_length=0)
+	bundle_components = get_bundle_component_map(bundle_names)
+	component_codes = {component["item_code"] for components in bundle_components.values() for component in components}
+	stock_qty_map = get_stock_qty_map(component_codes, warehouse)
+	for bundle_name, components in bundle_components.items():
+		for component in components:
+			component["available_qty"] = flt(stock_qty_map.get(component["item_code"], 0))
+		if get_bundle_available_qty(components) >= 1:
+			in_stock[bundle_name] = 1
+	return in_stock
+
+
+def write_in_stock_items(warehouse, in_stock, item_codes=None):
+	"""Make the table match `in_stock` for `item_codes`, or for the whole warehouse when None."""
+	if item_codes is None:
+		# Readers keep seeing the committed rows until the rebuild commits.
+		frappe.db.delete("Mart POS In Stock Item", {"warehouse": warehouse})
+	else:
+		stale = set(item_codes) - set(in_stock)
+		if stale:
+			frappe.db.delete("Mart POS In Stock Item", {"warehouse": warehouse, "item_code": ["in", list(stale)]})
+
+	now = now_datetime()
+	rows = [
+		(get_in_stock_item_name(warehouse, item_code), now, now, "Administrator", "Administrator", warehouse, item_code, is_bundle)
+		for item_code, is_bundle in in_stock.items()
+	]
+	for start in range(0, len(rows), IN_STOCK_ITEM_BATCH_SIZE):
+		batch = rows[start : start + IN_STOCK_ITEM_BATCH_SIZE]
+		placeholders = ", ".join(["(%s, %s, %s, %s, %s, 0, 0, %s, %s, %s)"] * len(batch))
+		frappe.db.sql(
+			f"""
+			INSERT INTO `tabMart POS In Stock Item`
+				(name, creation, modified, modified_by, owner, docstatus, idx,
+				warehouse, item_code, is_bundle)
+			VALUES {placeholders}
+			ON DUPLICATE KEY UPDATE
+				is_bundle = VALUES(is_bundle)
+			""",
+			[value for row in batch for value in row],
+		)
+
+
+def get_in_stock_item_name(warehouse, item_code):
+	return hashlib.md5(f"{warehouse}::{item_code}".encode()).hexdigest()
+
+
+def get_held_sale_count(profile):
+	return frappe.db.count(
+		"Mart POS Held Sale",
+		{
+			"status": "Held",
+			"cashier": frappe.session.user,
+			"company": profile.company,
+			"warehouse": profile.warehouse,
+		},
+	)
+
+
+def get_section_etag(data):
+	return hashlib.md5(frappe.as_json(data).encode()).hexdigest()
+
+
+@frappe.whitelist()
+def bootstrap(etags=None, product_limit=20):
+	"""Return everything the Mart POS page needs to start in one response.
+
+	Each section carries an ETag. When the client sends back the ETag it cached
+	for a section and the data is unchanged, only `not_modified` is returned for it.
+	"""
+	if isinstance(etags, str):
+		etags = json.loads(etags or "{}")
+	etags = etags or {}
+
+	profile = get_assigned_pos_profile()
+	shift = get_shift_context(profile)
+	data = {
+		"shift": shift,
+		"payment_modes": get_payment_modes(profile),
+	}
+	if shift["opening_entry"]:
+		data["item_groups"] = get_item_group_options(profile)
+		rows, next_cursor = get_catalog_page(profile, int(product_limit or 20), order_by="velocity")
+		data["product_page"] = {
+			"products": build_pos_products(rows, profile.warehouse),
+			"next_cursor": next_cursor,
+		}
+		data["recent_invoices"] = get_shift_invoices(profile, shift["opening_entry"])
+		data["held_sale_count"] = get_held_sale_count(profile)
+
+	sections = {}
+	for key, value in data.items():
+		etag = get_section_etag(value)
+		if etags.get(key) == etag:
+			sections[key] = {"etag": etag, "not_modified": 1}
+		else:
+			sections[key] = {"etag": etag, "data": value}
+
+	return {"sections": sections}
+
 
 @frappe.whitelist()
 def create_opening_entry(pos_profile, amounts=None):
@@ -530,6 +1449,7 @@ def create_opening_entry(pos_profile, amounts=None):
 
 	amounts: dict of mode_of_payment -> opening_amount. Missing modes default to 0.
 	"""
+	mark_recent_write()
 	doc = frappe.new_doc("POS Opening Entry")
 
 	doc.pos_profile = pos_profile
@@ -561,26 +1481,557 @@ def create_opening_entry(pos_profile, amounts=None):
 	return doc.name
 
 
-# --- CORE TRANSACTION LOGIC ---
+# --- SALES ROLLUP ---
 
+SALES_ROLLUP_WATERMARK_KEY = "minimart_pos_sales_rollup_watermark"
+SALES_ROLLUP_BATCH_SIZE = 500
+# Invoices committed late can carry a `modified` just before the watermark;
+# each run re-reads this window. Recomputing a bucket twice is harmless.
+SALES_ROLLUP_OVERLAP_MINUTES = 5
+TOP_SELLERS_CACHE_KEY = "minimart_pos_top_sellers"
+DEFAULT_VELOCITY_DAYS = 30
 
-@frappe.whitelist()
-def get_products(search_term=None, item_group=None, limit_page_length=20, in_stock_only=True):
-	"""Fetches saleable POS items, including product bundles with computed availability."""
-	if isinstance(in_stock_only, str):
-		in_stock_only = in_stock_only.strip().lower() in {"1", "true", "yes", "y", "on"}
 
-	profile = get_assigned_pos_profile()
-	search_term = (search_term or "").strip()
-	item_group = (item_group or "").strip()
-	limit_page_length = int(limit_page_length or 20)
-	rows = get_catalog_rows(
-		profile,
-		search_term=search_term or None,
-		item_group=item_group or None,
-		limit_page_length=limit_page_length,
-		in_stock_only=in_stock_only,
+def get_velocity_days(days=None):
+	return min(max(cint(days) or DEFAULT_VELOCITY_DAYS, 1), 365)
+
+
+def update_item_sales_rollup():
+	"""Fold POS Invoices changed since the last run into Mart POS Item Sales Daily.
+
+	Runs from the scheduler. Invoices are paged in (`modified`, `name`) order from
+	the stored watermark, so a batch boundary inside a run of equal `modified`
+	values skips nothing. Every (date, warehouse, item, UOM) bucket they touch is
+	recomputed from all submitted POS Invoice Items, so cancellations and returns
+	net out.
+	"""
+	watermark = frappe.db.get_global(SALES_ROLLUP_WATERMARK_KEY)
+	since = None
+	after_name = ""
+	if watermark:
+		since = get_datetime(watermark) - datetime.timedelta(minutes=SALES_ROLLUP_OVERLAP_MINUTES)
+
+	updated = False
+	while True:
+		invoices = frappe.db.sql(
+			f"""
+			SELECT name, modified
+			FROM `tabPOS Invoice`
+			WHERE docstatus IN (1, 2)
+				{"AND modified >= %(since)s AND (modified > %(since)s OR name > %(after_name)s)" if since else ""}
+			ORDER BY modified ASC, name ASC
+			LIMIT %(batch_size)s
+			""",
+			{"since": since, "after_name": after_name, "batch_size": SALES_ROLLUP_BATCH_SIZE},
+			as_dict=1,
+		)
+		if not invoices:
+			break
+
+		buckets = frappe.db.sql(
+			"""
+			SELECT DISTINCT pi.posting_date, pii.warehouse, pii.item_code, pii.uom
+			FROM `tabPOS Invoice Item` pii
+			INNER JOIN `tabPOS Invoice` pi ON pi.name = pii.parent
+			WHERE pi.name IN %(invoices)s
+			""",
+			{"invoices": tuple(row.name for row in invoices)},
+		)
+		recompute_item_sales_buckets(buckets)
+		updated = True
+
+		since, after_name = invoices[-1].modified, invoices[-1].name
+		frappe.db.set_global(SALES_ROLLUP_WATERMARK_KEY, str(since))
+		frappe.db.commit()
+		if len(invoices) < SALES_ROLLUP_BATCH_SIZE:
+			break
+
+	if updated:
+		frappe.cache().delete_keys(TOP_SELLERS_CACHE_KEY)
+
+
+def recompute_item_sales_buckets(buckets):
+	"""Rewrite the rollup rows for the given (date, warehouse, item, UOM) buckets."""
+	if not buckets:
+		return
+
+	totals = get_item_sales_bucket_totals(buckets)
+	now = now_datetime()
+	rows = []
+	for bucket in buckets:
+		sales_date, warehouse, item_code, uom = bucket
+		qty, stock_qty, amount = totals.get(tuple(bucket), (0, 0, 0))
+		rows.append(
+			(
+				get_item_sales_bucket_name(sales_date, warehouse, item_code, uom),
+				now,
+				now,
+				"Administrator",
+				"Administrator",
+				sales_date,
+				warehouse,
+				item_code,
+				uom,
+				flt(qty),
+				flt(stock_qty),
+				flt(amount),
+			)
+		)
+
+	placeholders = ", ".join(["(%s, %s, %s, %s, %s, 0, 0, %s, %s, %s, %s, %s, %s, %s)"] * len(rows))
+	frappe.db.sql(
+		f"""
+		INSERT INTO `tabMart POS Item Sales Daily`
+			(name, creation, modified, modified_by, owner, docstatus, idx,
+			sales_date, warehouse, item_code, uom, qty, stock_qty, amount)
+		VALUES {placeholders}
+		ON DUPLICATE KEY UPDATE
+			qty = VALUES(qty),
+			stock_qty = VALUES(stock_qty),
+			amount = VALUES(amount),
+			modified = VALUES(modified)
+		""",
+		[value for row in rows for value in row],
+	)
+
+
+def get_item_sales_bucket_totals(buckets):
+	"""Return {(date, warehouse, item, UOM): (qty, stock_qty, amount)} over submitted POS Invoice Items.
+
+	The bucket columns come from two tables, so no index can serve the tuple IN
+	by itself. The item code list reaches POS Invoice Item through its item_code
+	index and the invoice by primary key; the tuple IN only filters those rows.
+	"""
+	return {
+		tuple(row[:4]): row[4:]
+		for row in frappe.db.sql(
+			"""
+			SELECT pi.posting_date, pii.warehouse, pii.item_code, pii.uom,
+				SUM(pii.qty), SUM(pii.stock_qty), SUM(pii.base_net_amount)
+			FROM `tabPOS Invoice Item` pii
+			INNER JOIN `tabPOS Invoice` pi ON pi.name = pii.parent
+			WHERE pi.docstatus = 1
+				AND pii.item_code IN %(item_codes)s
+				AND pi.posting_date IN %(dates)s
+				AND (pi.posting_date, pii.warehouse, pii.item_code, pii.uom) IN %(buckets)s
+			GROUP BY pi.posting_date, pii.warehouse, pii.item_code, pii.uom
+			""",
+			{
+				"item_codes": tuple({bucket[2] for bucket in buckets}),
+				"dates": tuple({bucket[0] for bucket in buckets}),
+				"buckets": tuple(tuple(bucket) for bucket in buckets),
+			},
+		)
+	}
+
+
+def get_item_sales_bucket_name(sales_date, warehouse, item_code, uom):
+	# Item codes and warehouse names can each be 140 characters, so the bucket
+	# key is hashed to fit the name column.
+	key = f"{sales_date}::{warehouse}::{item_code}::{uom}"
+	return hashlib.md5(key.encode()).hexdigest()
+
+
+@frappe.whitelist()
+def get_top_sellers(days=7, limit=12):
+	"""Return the best-selling items of the POS warehouse over the last `days` days.
+
+	Read from the daily rollup and cached until the next rollup run.
+	"""
+	profile = get_assigned_pos_profile()
+	return get_warehouse_top_sellers(profile.warehouse, days, limit)
+
+
+def get_warehouse_top_sellers(warehouse, days=7, limit=12):
+	warehouse = (warehouse or "").strip()
+	days = get_velocity_days(days)
+	limit = min(max(cint(limit) or 12, 1), 100)
+
+	cache_key = f"{TOP_SELLERS_CACHE_KEY}:{warehouse}:{days}:{limit}"
+	top_sellers = frappe.cache().get_value(cache_key)
+	if top_sellers is None:
+		top_sellers = frappe.db.sql(
+			"""
+			SELECT sd.item_code, i.item_name, i.stock_uom,
+				SUM(sd.stock_qty) as stock_qty, SUM(sd.amount) as amount
+			FROM `tabMart POS Item Sales Daily` sd
+			INNER JOIN `tabItem` i ON i.name = sd.item_code
+			WHERE sd.warehouse = %s AND sd.sales_date >= %s
+			GROUP BY sd.item_code, i.item_name, i.stock_uom
+			HAVING SUM(sd.stock_qty) > 0
+			ORDER BY SUM(sd.stock_qty) DESC, sd.item_code ASC
+			LIMIT %s
+			""",
+			(warehouse, add_days(get_current_pricing_date(), -days), limit),
+			as_dict=1,
+		)
+		frappe.cache().set_value(cache_key, top_sellers, expires_in_sec=6 * 60 * 60)
+	return top_sellers
+
+
+# --- REORDER SUGGESTIONS ---
+
+
+@frappe.whitelist()
+def get_reorder_suggestions(pos_profile=None, lookback_days=30, lead_time_days=3, cover_days=7):
+	"""Suggest restock quantities for a POS Profile warehouse.
+
+	Velocity is units sold per day over `lookback_days` (Product Bundle sales count
+	as demand for their components). Items are suggested when stock plus open
+	purchase orders will not last `lead_time_days + cover_days`.
+	"""
+	if pos_profile:
+		profile = frappe.get_doc("POS Profile", pos_profile)
+		profile.check_permission("read")
+	else:
+		profile = get_assigned_pos_profile()
+
+	warehouse = (profile.warehouse or "").strip()
+	if not warehouse:
+		frappe.throw(_("POS Profile {0} has no warehouse.").format(profile.name))
+
+	lookback_days = min(max(cint(lookback_days) or 30, 1), 365)
+	since = add_days(get_current_pricing_date(), -lookback_days)
+
+	items = frappe.db.sql(
+		"""
+		SELECT i.name, i.item_name, i.stock_uom,
+			COALESCE(b.actual_qty, 0), COALESCE(b.ordered_qty, 0)
+		FROM `tabItem` i
+		LEFT JOIN `tabBin` b ON b.item_code = i.name AND b.warehouse = %s
+		WHERE i.is_stock_item = 1 AND i.disabled = 0 AND i.has_variants = 0
+		""",
+		warehouse,
+	)
+	sales = frappe.db.sql(
+		"""
+		SELECT item_code, SUM(stock_qty)
+		FROM `tabMart POS Item Sales Daily`
+		WHERE warehouse = %s AND sales_date > %s
+		GROUP BY item_code
+		""",
+		(warehouse, since),
+	)
+	bundle_links = frappe.db.sql(
+		"""
+		SELECT pbi.parent, pbi.item_code, pbi.qty
+		FROM `tabProduct Bundle Item` pbi
+		INNER JOIN `tabProduct Bundle` pb ON pb.name = pbi.parent AND pb.disabled = 0
+		"""
+	)
+
+	return build_reorder_suggestions(
+		items,
+		sales,
+		bundle_links,
+		lookback_days=lookback_days,
+		lead_time_days=flt(lead_time_days),
+		cover_days=flt(cover_days),
 	)
+
+
+def build_reorder_suggestions(items, sales, bundle_links, lookback_days, lead_time_days, cover_days):
+	"""Compute reorder suggestions for the whole catalog at once.
+
+	items: (item_code, item_name, stock_uom, actual_qty, ordered_qty) rows.
+	sales: (item_code, qty sold in stock UOM) rows, bundles included.
+	bundle_links: (bundle, component item_code, component qty per bundle) rows.
+	"""
+	import numpy as np
+
+	count = len(items)
+	index = {row[0]: position for position, row in enumerate(items)}
+	actual_qty = np.fromiter((flt(row[3]) for row in items), dtype=float, count=count)
+	ordered_qty = np.fromiter((flt(row[4]) for row in items), dtype=float, count=count)
+
+	# Direct sales and bundle sales both land on the stock item that ships.
+	demand = np.zeros(count)
+	sold = {item_code: flt(qty) for item_code, qty in sales}
+	add_item_demand(
+		demand,
+		np.fromiter((index.get(item_code, -1) for item_code in sold), dtype=np.int64, count=len(sold)),
+		np.fromiter(sold.values(), dtype=float, count=len(sold)),
+	)
+	add_item_demand(
+		demand,
+		np.fromiter(
+			(index.get(component, -1) for bundle, component, qty in bundle_links),
+			dtype=np.int64,
+			count=len(bundle_links),
+		),
+		np.fromiter(
+			(flt(qty) * sold.get(bundle, 0) for bundle, component, qty in bundle_links),
+			dtype=float,
+			count=len(bundle_links),
+		),
+	)
+
+	velocity = demand / lookback_days
+	with np.errstate(divide="ignore", invalid="ignore"):
+		days_of_cover = np.where(velocity > 0, np.maximum(actual_qty, 0) / velocity, np.inf)
+	target_qty = velocity * (lead_time_days + cover_days)
+	suggested_qty = np.ceil(np.maximum(target_qty - np.maximum(actual_qty, 0) - ordered_qty, 0))
+
+	selected = np.flatnonzero(suggested_qty > 0)
+	selected = selected[np.argsort(days_of_cover[selected], kind="stable")]
+	return [
+		{
+			"item_code": items[position][0],
+			"item_name": items[position][1],
+			"stock_uom": items[position][2],
+			"actual_qty": float(actual_qty[position]),
+			"ordered_qty": float(ordered_qty[position]),
+			"sold_qty": float(demand[position]),
+			"daily_velocity": round(float(velocity[position]), 3),
+			"days_of_cover": round(float(days_of_cover[position]), 1),
+			"suggested_qty": float(suggested_qty[position]),
+		}
+		for position in selected.tolist()
+	]
+
+
+def add_item_demand(demand, positions, qty):
+	"""Add `qty` to `demand` at `positions`, skipping -1 (not a catalog stock item)."""
+	import numpy as np
+
+	known = positions >= 0
+	np.add.at(demand, positions[known], qty[known])
+
+
+# --- COMPACT RESPONSES ---
+
+
+def encode_compact_table(rows, strings, string_index):
+	"""Encode a list of dicts column-wise.
+
+	Plain columns are value lists. String columns with many repeats (item_group,
+	uom, ...) become `{"d": [...]}` indexes into the shared `strings` list, and
+	nested lists of dicts (bundle components, UOMs) become `{"n": [...]}` tables.
+	"""
+	keys = []
+	for row in rows:
+		for key in row:
+			if key not in keys:
+				keys.append(key)
+
+	columns = {}
+	for key in keys:
+		values = [row.get(key) for row in rows]
+		if any(isinstance(value, list) for value in values):
+			columns[key] = {
+				"n": [
+					encode_compact_table(value, strings, string_index) if value else value
+					for value in values
+				]
+			}
+		elif values and all(isinstance(value, str) for value in values) and len(set(values)) * 2 <= len(values):
+			refs = []
+			for value in values:
+				if value not in string_index:
+					string_index[value] = len(strings)
+					strings.append(value)
+				refs.append(string_index[value])
+			columns[key] = {"d": refs}
+		else:
+			columns[key] = values
+
+	return {"length": len(rows), "columns": columns}
+
+
+def make_compact_response(rows, single=False, meta=None):
+	"""Return catalog rows in the compact columnar format, gzipped when the client accepts it.
+
+	`meta` (e.g. the next page cursor) is passed through untouched.
+	"""
+	strings = []
+	payload = {
+		"compact": 1,
+		"single": 1 if single else 0,
+		"strings": strings,
+		"table": encode_compact_table([rows] if single else rows, strings, {}),
+	}
+	if meta:
+		payload["meta"] = meta
+	body = frappe.as_json({"message": payload}, indent=None, separators=(",", ":")).encode()
+
+	headers = {"Vary": "Accept-Encoding"}
+	accepts_gzip = "gzip" in (frappe.get_request_header("Accept-Encoding") or "")
+	compressed = gzip.compress(body, compresslevel=5) if accepts_gzip else None
+
+	logger = frappe.logger("minimart_pos")
+	if logger.isEnabledFor(logging.DEBUG):
+		plain = frappe.as_json(rows, indent=None, separators=(",", ":")).encode()
+		logger.debug(
+			"Compact catalog payload sizes: "
+			f"json={len(plain)}, json_gzip={len(gzip.compress(plain, compresslevel=5))}, "
+			f"compact={len(body)}, compact_gzip={len(compressed) if compressed else None}"
+		)
+
+	if compressed:
+		headers["Content-Encoding"] = "gzip"
+		body = compressed
+
+	return Response(body, status=200, mimetype="application/json", headers=headers)
+
+
+# --- CORE TRANSACTION LOGIC ---
+
+
+# --- PRODUCT THUMBNAILS ---
+
+THUMBNAIL_FOLDER = "mart_pos_thumbs"
+THUMBNAIL_SIZE = (160, 160)
+THUMBNAIL_CACHE_KEY = "minimart_pos_thumbnails"
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def get_public_image_path(image_url):
+	"""Return the local path of a public `/files/...` image, or None for private/external images."""
+	if not image_url or not image_url.startswith("/files/"):
+		return None
+
+	public_files = os.path.realpath(frappe.get_site_path("public", "files"))
+	path = os.path.realpath(frappe.get_site_path("public", image_url.split("?", 1)[0].lstrip("/")))
+	if not path.startswith(public_files + os.sep) or not os.path.isfile(path):
+		return None
+	return path
+
+
+def generate_item_thumbnail(image_url):
+	"""Write a small WebP (or JPEG) copy of an Item image, named by its content hash."""
+	from PIL import Image, ImageOps, features
+
+	source_path = get_public_image_path(image_url)
+	if not source_path:
+		return None
+
+	with open(source_path, "rb") as f:
+		content = f.read()
+
+	try:
+		image = ImageOps.exif_transpose(Image.open(io.BytesIO(content)))
+		image.thumbnail(THUMBNAIL_SIZE)
+	except Exception:
+		frappe.logger("minimart_pos").warning(f"Could not create thumbnail for {image_url}", exc_info=True)
+		return None
+
+	extension = "webp" if features.check("webp") else "jpg"
+	file_name = f"{hashlib.sha1(content).hexdigest()[:20]}-{THUMBNAIL_SIZE[0]}.{extension}"
+	folder = frappe.get_site_path("public", "files", THUMBNAIL_FOLDER)
+	path = os.path.join(folder, file_name)
+
+	if not os.path.exists(path):
+		os.makedirs(folder, exist_ok=True)
+		buffer = io.BytesIO()
+		if extension == "webp":
+			image.save(buffer, format="WEBP", quality=75, method=4)
+		else:
+			image.convert("RGB").save(buffer, format="JPEG", quality=80, optimize=True)
+		with open(path, "wb") as f:
+			f.write(buffer.getvalue())
+
+	thumbnail_url = f"/files/{THUMBNAIL_FOLDER}/{file_name}"
+	frappe.cache().hset(THUMBNAIL_CACHE_KEY, image_url, thumbnail_url)
+	return thumbnail_url
+
+
+def attach_thumbnail_urls(products):
+	"""Set `thumbnail` on product rows.
+
+	Public images point at `item_thumbnail`, with the content-hashed thumbnail name
+	as `v` once it is known, so the browser can cache it for good. Private and
+	external images are passed through unchanged.
+	"""
+	if not any(product.get("image") for product in products):
+		return products
+
+	# Only this page's images. hmget is plain redis, so it takes make_key() and
+	# unpickles what RedisWrapper.hset stored.
+	images = list({product["image"] for product in products if (product.get("image") or "").startswith("/files/")})
+	thumbnails = {}
+	if images:
+		cache = frappe.cache()
+		thumbnails = {
+			image: pickle.loads(url)
+			for image, url in zip(images, cache.hmget(cache.make_key(THUMBNAIL_CACHE_KEY), images), strict=True)
+			if url is not None
+		}
+	for product in products:
+		image = product.get("image")
+		if not image:
+			product["thumbnail"] = None
+		elif image.startswith("/files/"):
+			product["thumbnail"] = get_item_thumbnail_url(product["item_code"], thumbnails.get(image))
+		else:
+			product["thumbnail"] = image
+	return products
+
+
+def get_item_thumbnail_url(item_code, thumbnail_url=None):
+	url = f"/api/method/minimart_pos.api.item_thumbnail?item_code={quote(item_code)}"
+	if thumbnail_url:
+		url += f"&v={quote(os.path.basename(thumbnail_url))}"
+	return url
+
+
+@frappe.whitelist()
+def item_thumbnail(item_code, v=None):
+	"""Serve the thumbnail of an Item's image, creating it on first request.
+
+	Only the Item's own image is read, and only when it is a public File attached
+	to that Item. When `v` names the current thumbnail the response can never
+	change, so it is sent as immutable.
+	"""
+	image = frappe.db.get_value("Item", item_code, "image")
+	if not (
+		image
+		and image.startswith("/files/")
+		and frappe.db.exists(
+			"File",
+			{"file_url": image, "attached_to_doctype": "Item", "attached_to_name": item_code, "is_private": 0},
+		)
+	):
+		raise frappe.DoesNotExistError
+
+	thumbnail_url = frappe.cache().hget(THUMBNAIL_CACHE_KEY, image)
+	path = get_public_image_path(thumbnail_url)
+	if not path:
+		thumbnail_url = generate_item_thumbnail(image)
+		path = get_public_image_path(thumbnail_url)
+	if not path:
+		# Pillow could not read the image; send the Item's own file instead.
+		return Response(status=302, headers={"Location": image, "Cache-Control": "no-cache"})
+
+	if v == os.path.basename(path):
+		cache_control = f"public, max-age={THUMBNAIL_MAX_AGE}, immutable"
+	else:
+		cache_control = "no-cache"
+	with open(path, "rb") as f:
+		return Response(
+			f.read(),
+			mimetype="image/webp" if path.endswith(".webp") else "image/jpeg",
+			headers={"Cache-Control": cache_control},
+		)
+
+
+def on_item_update(doc, method=None):
+	if any(
+		doc.has_value_changed(fieldname)
+		for fieldname in ("item_group", "disabled", "has_variants", "is_sales_item")
+	):
+		frappe.db.after_commit.add(clear_item_group_tree_cache)
+
+	if doc.image and doc.has_value_changed("image"):
+		frappe.enqueue(
+			"minimart_pos.api.generate_item_thumbnail",
+			queue="short",
+			image_url=doc.image,
+			enqueue_after_commit=True,
+		)
+
+
+def build_pos_products(rows, warehouse):
+	"""Turn catalog rows into product-card rows with a fixed number of stock and bundle queries."""
 	if not rows:
 		return []
 
@@ -592,7 +2043,7 @@ def get_products(search_term=None, item_group=None, limit_page_length=20, in_sto
 		for components in bundle_components.values()
 		for component in components
 	}
-	stock_qty_map = get_stock_qty_map(item_codes | component_item_codes, profile.warehouse)
+	stock_qty_map = get_available_qty_map(item_codes | component_item_codes, warehouse)
 	bundle_components = get_bundle_component_map(bundle_names, stock_qty_map=stock_qty_map)
 
 	products = []
@@ -608,11 +2059,62 @@ def get_products(search_term=None, item_group=None, limit_page_length=20, in_sto
 		)
 		products.append(product)
 
-	return products
+	return attach_thumbnail_urls(products)
+
+
+@frappe.whitelist()
+@replica_read
+def get_products(
+	search_term=None,
+	item_group=None,
+	limit_page_length=20,
+	in_stock_only=True,
+	compact=False,
+	cursor=None,
+	paged=False,
+	order_by=None,
+	velocity_days=None,
+):
+	"""Fetches saleable POS items, including product bundles with computed availability.
+
+	With `paged` (or a `cursor` from a previous page) the response is
+	`{"products": [...], "next_cursor": ...}`; pass `next_cursor` back to get the
+	following page. `next_cursor` is null on the last page.
+
+	`order_by="velocity"` ranks items by units sold in the last `velocity_days`
+	(from the daily sales rollup) before the usual name order.
+	"""
+	in_stock_only = is_truthy(in_stock_only)
+
+	profile = get_assigned_pos_profile()
+	search_term = (search_term or "").strip()
+	item_group = (item_group or "").strip()
+	limit_page_length = int(limit_page_length or 20)
+	filters = {
+		"search_term": search_term or None,
+		"item_group": item_group or None,
+		"in_stock_only": in_stock_only,
+		"order_by": "velocity" if order_by == "velocity" else None,
+		"velocity_days": velocity_days,
+	}
+
+	if not (cursor or is_truthy(paged)):
+		rows = get_catalog_rows(profile, limit_page_length=limit_page_length, **filters)
+		products = build_pos_products(rows, profile.warehouse)
+		if is_truthy(compact):
+			return make_compact_response(products)
+		return products
+
+	rows, next_cursor = get_catalog_page(profile, limit_page_length, cursor=cursor, **filters)
+	products = build_pos_products(rows, profile.warehouse)
+	if is_truthy(compact):
+		return make_compact_response(products, meta={"next_cursor": next_cursor})
+	return {"products": products, "next_cursor": next_cursor}
 
 
 @frappe.whitelist()
-def get_item_by_barcode(barcode):
+@replica_read
+def get_item_by_barcode(barcode, compact=False):
 	"""Searches for an item with its current stock level and group."""
 	item_code = frappe.db.get_value("Item Barcode", {"barcode": barcode}, "parent")
 
@@ -627,12 +2129,15 @@ def get_item_by_barcode(barcode):
 			return None
 
 		item = enrich_pos_item(item_data[0], profile.warehouse)
+		if is_truthy(compact):
+			return make_compact_response(item, single=True)
 		return item
 	return None
 
 
 @frappe.whitelist()
-def search_item(query):
+@replica_read
+def search_item(query, compact=False):
 	"""Find the first POS item by exact code or partial name/code match."""
 	query = (query or "").strip()
 	if not query:
@@ -641,10 +2146,39 @@ def search_item(query):
 	profile = get_assigned_pos_profile()
 	items = get_catalog_rows(profile, search_term=query, in_stock_only=False)
 	for row in items:
-		return enrich_pos_item(row, profile.warehouse)
+		item = enrich_pos_item(row, profile.warehouse)
+		if is_truthy(compact):
+			return make_compact_response(item, single=True)
+		return item
 	return None
 
 
+@frappe.whitelist()
+def scan(code, compact=False):
+	"""Resolve a scanned barcode, item code, or search text to one card-ready POS row.
+
+	Barcode and item code are matched in one catalog query, after an indexed
+	barcode lookup; only a miss falls back to the ranked search. The row carries its UOMs and prices so the page can add
+	it to the cart without another round trip.
+	"""
+	code = (code or "").strip()
+	if not code:
+		return None
+
+	profile = get_assigned_pos_profile()
+	rows = get_catalog_rows(profile, scan_code=code, in_stock_only=False)
+	if not rows:
+		rows = get_catalog_rows(profile, search_term=code, in_stock_only=False, limit_page_length=1)
+	if not rows:
+		return None
+
+	item = build_pos_products(rows[:1], profile.warehouse)[0]
+	item["uoms"] = get_item_uoms_and_prices(item["item_code"])
+	if is_truthy(compact):
+		return make_compact_response(item, single=True)
+	return item
+
+
 def parse_cart_data(cart_data):
 	if isinstance(cart_data, str):
 		return json.loads(cart_data or "[]")
@@ -654,6 +2188,7 @@ def parse_cart_data(cart_data):
 @frappe.whitelist()
 def hold_sale(cart, customer=None, grand_total=0, remarks=None, held_sale_name=None):
 	"""Save or update a suspended cart without creating stock or accounting entries."""
+	mark_recent_write()
 	profile = get_assigned_pos_profile()
 	items = parse_cart_data(cart)
 	if not items:
@@ -688,6 +2223,7 @@ def hold_sale(cart, customer=None, grand_total=0, remarks=None, held_sale_name=N
 
 
 @frappe.whitelist()
+@replica_read
 def get_held_sales():
     """Return active held sales for the current cashier and POS profile."""
     profile = get_assigned_pos_profile()
@@ -764,6 +2300,7 @@ def mark_held_sale_completed(held_sale_name, invoice_name=None):
 
 @frappe.whitelist()
 def complete_held_sale(held_sale_name, invoice_name=None):
+	mark_recent_write()
 	mark_held_sale_completed(held_sale_name, invoice_name)
 	return held_sale_name
 
@@ -771,6 +2308,7 @@ def complete_held_sale(held_sale_name, invoice_name=None):
 @frappe.whitelist()
 def add_item_price_history(item_code, uom=None, price=0, price_list=None):
 	"""Append a new selling Item Price row for POS manual pricing and return refreshed UOM prices."""
+	mark_recent_write()
 	if not item_code:
 		frappe.throw(_("Item Code is required."))
 
@@ -786,7 +2324,7 @@ def add_item_price_history(item_code, uom=None, price=0, price_list=None):
 
 	current_price_name = frappe.db.sql(
 		"""
-		SELECT ip.name
+		SELECT ip.name, ip.price_list_rate
 		FROM `tabItem Price` ip
 		WHERE ip.item_code = %s
 			AND ip.price_list = %s
@@ -814,6 +2352,22 @@ def add_item_price_history(item_code, uom=None, price=0, price_list=None):
 	item_price.flags.ignore_permissions = True
 	item_price.insert()
 
+	queue_pos_events(
+		profile,
+		[
+			{
+				"event_type": "price_override",
+				"item_code": item_code,
+				"uom": uom,
+				"amount": price,
+				"details": _("Price List {0}: {1} -> {2}").format(
+					price_list, flt(current_price_name[0][1]) if current_price_name else "-", price
+				),
+			}
+		],
+		after_commit=True,
+	)
+
 	return {
 		"item_code": item_code,
 		"uom": uom,
@@ -828,10 +2382,9 @@ def get_utang_credit_details(customer, company, amount=0):
 	if not customer or customer == "Guest" or not frappe.db.exists("Customer", customer):
 		frappe.throw(_("Utang is only available for registered customers."))
 
-	credit_limit = flt(get_credit_limit(customer, company))
-	current_outstanding = flt(
-		get_customer_outstanding(customer, company, ignore_outstanding_sales_order=True)
-	)
+	exposure = get_credit_exposure(customer, company)
+	credit_limit = exposure["credit_limit"]
+	current_outstanding = exposure["current_outstanding"]
 	projected_outstanding = current_outstanding + flt(amount)
 
 	return {
@@ -846,6 +2399,7 @@ def get_utang_credit_details(customer, company, amount=0):
 
 
 @frappe.whitelist()
+@replica_read
 def get_utang_credit_status(customer, amount=0):
 	profile = get_assigned_pos_profile()
 	return get_utang_credit_details(customer, profile.company, amount)
@@ -867,6 +2421,281 @@ def validate_utang_credit(customer, company, amount):
 	return details
 
 
+# --- CREDIT EXPOSURE CACHE ---
+
+CREDIT_EXPOSURE_CACHE_KEY = "minimart_pos_credit_exposure"
+CREDIT_EXPOSURE_VERSION_CACHE_KEY = "minimart_pos_credit_exposure_version"
+
+
+def get_credit_exposure(customer, company):
+	"""Return the customer's credit limit and outstanding for a company from cache.
+
+	A cached record is used only while its version matches the one the ledger
+	hooks bump after each commit; otherwise it is recomputed with ERPNext's
+	`get_credit_limit` / `get_customer_outstanding` and stored again.
+	"""
+	cache = frappe.cache()
+	field = f"{company}::{customer}"
+	version = cache.hget(CREDIT_EXPOSURE_VERSION_CACHE_KEY, field)
+	exposure = cache.hget(CREDIT_EXPOSURE_CACHE_KEY, field)
+	if exposure and exposure.get("version") == version:
+		return exposure
+
+	exposure = compute_credit_exposure(customer, company, version)
+	if not is_reading_from_replica():
+		# A lagging replica may not have the ledger entry that bumped the version yet.
+		cache.hset(CREDIT_EXPOSURE_CACHE_KEY, field, exposure)
+	return exposure
+
+
+def compute_credit_exposure(customer, company, version=None):
+	return {
+		"credit_limit": flt(get_credit_limit(customer, company)),
+		"current_outstanding": flt(
+			get_customer_outstanding(customer, company, ignore_outstanding_sales_order=True)
+		),
+		"version": version,
+	}
+
+
+def mark_credit_exposure_changed(customer, company):
+	"""Invalidate the cached exposure once the current transaction commits, then refresh it in the background."""
+	field = f"{company}::{customer}"
+	frappe.db.after_commit.add(
+		lambda: frappe.cache().hset(
+			CREDIT_EXPOSURE_VERSION_CACHE_KEY, field, frappe.generate_hash(length=10)
+		)
+	)
+	frappe.enqueue(
+		"minimart_pos.api.get_credit_exposure",
+		queue="short",
+		customer=customer,
+		company=company,
+		enqueue_after_commit=True,
+	)
+
+
+def on_customer_ledger_change(doc, method=None):
+	"""doc_events hook for POS Invoice, Sales Invoice and Payment Entry submit/cancel."""
+	if doc.doctype == "Payment Entry":
+		customer = doc.party if doc.party_type == "Customer" else None
+	else:
+		customer = doc.customer
+	if customer and doc.company:
+		mark_credit_exposure_changed(customer, doc.company)
+
+
+def on_customer_update(doc, method=None):
+	update_customer_index(doc)
+
+	# Credit limits live on the Customer; invalidate every company cached for it.
+	suffix = f"::{doc.name}"
+	for field in frappe.cache().hgetall(CREDIT_EXPOSURE_CACHE_KEY):
+		field = frappe.safe_decode(field)
+		if field.endswith(suffix):
+			mark_credit_exposure_changed(doc.name, field[: -len(suffix)])
+
+
+def reconcile_credit_exposure():
+	"""Daily check of every cached exposure against ERPNext's own computation.
+
+	Mismatches (ledger changes from documents without hooks, such as Journal
+	Entries, or Customer Group limit changes) are logged and corrected.
+	"""
+	cache = frappe.cache()
+	logger = frappe.logger("minimart_pos")
+	for field, exposure in cache.hgetall(CREDIT_EXPOSURE_CACHE_KEY).items():
+		field = frappe.safe_decode(field)
+		company, customer = field.split("::", 1)
+		if not frappe.db.exists("Customer", customer):
+			cache.hdel(CREDIT_EXPOSURE_CACHE_KEY, field)
+			continue
+
+		actual = compute_credit_exposure(
+			customer, company, cache.hget(CREDIT_EXPOSURE_VERSION_CACHE_KEY, field)
+		)
+		if (
+			abs(flt(exposure.get("credit_limit")) - actual["credit_limit"]) > 0.005
+			or abs(flt(exposure.get("current_outstanding")) - actual["current_outstanding"]) > 0.005
+		):
+			logger.warning(
+				f"Credit exposure cache for {customer} ({company}) was "
+				f"{exposure.get('credit_limit')}/{exposure.get('current_outstanding')}, "
+				f"ERPNext computes {actual['credit_limit']}/{actual['current_outstanding']}"
+			)
+		cache.hset(CREDIT_EXPOSURE_CACHE_KEY, field, actual)
+
+
+# --- CUSTOMER SEARCH ---
+
+CUSTOMER_INDEX_CACHE_KEY = "minimart_pos_customer_index"
+RECENT_CUSTOMERS_CACHE_KEY = "minimart_pos_recent_customers"
+RECENT_CUSTOMERS_LIMIT = 20
+
+# RedisWrapper adds the site prefix itself in exists() and the list methods,
+# but not in sorted-set commands or pipelines: only those take make_key().
+
+
+@frappe.whitelist()
+def search_customers(query=None, limit=8):
+	"""Find customers by prefix of ID, name, any word of the name, or mobile number.
+
+	Customers recently sold to on this POS Profile come first, and an empty query
+	returns just those. Each row carries the credit limit and outstanding for the
+	profile's company, so utang can be checked without another call.
+	"""
+	profile = get_assigned_pos_profile()
+	limit = min(max(cint(limit) or 8, 1), 50)
+	query = (query or "").strip().lower()
+	recent = get_recent_customers(profile.name)
+
+	if query:
+		matches = find_customers_by_prefix(query, limit * 5)
+		recent_rank = {customer: position for position, customer in enumerate(recent)}
+		matches.sort(key=lambda customer: recent_rank.get(customer, len(recent_rank)))
+	else:
+		matches = recent
+	matches = matches[:limit]
+	if not matches:
+		return []
+
+	details = {
+		row.name: row
+		for row in frappe.get_all(
+			"Customer",
+			filters={"name": ["in", matches], "disabled": 0},
+			fields=["name", "customer_name", "mobile_no"],
+		)
+	}
+	results = []
+	for customer in matches:
+		row = details.get(customer)
+		if not row:
+			continue
+		exposure = get_credit_exposure(customer, profile.company)
+		results.append(
+			{
+				"name": row.name,
+				"customer_name": row.customer_name,
+				"mobile_no": row.mobile_no,
+				"recent": 1 if customer in recent else 0,
+				"company": profile.company,
+				"credit_limit": exposure["credit_limit"],
+				"current_outstanding": exposure["current_outstanding"],
+				"available_credit": exposure["credit_limit"] - exposure["current_outstanding"],
+			}
+		)
+	return results
+
+
+def get_customer_index_terms(customer):
+	"""Return the lowercase terms whose prefixes find this customer."""
+	terms = {customer.name.lower()}
+	customer_name = (customer.customer_name or "").strip().lower()
+	if customer_name:
+		terms.add(customer_name)
+		terms.update(customer_name.split())
+
+	mobile_no = "".join(character for character in customer.mobile_no or "" if character.isdigit())
+	if mobile_no:
+		terms.add(mobile_no)
+		# +63 917... is dialled locally as 0917...
+		if mobile_no.startswith("63"):
+			terms.add("0" + mobile_no[2:])
+	return terms
+
+
+def get_customer_index_members(customer):
+	return [f"{term}\x00{customer.name}" for term in get_customer_index_terms(customer)]
+
+
+def find_customers_by_prefix(prefix, limit):
+	"""Read customer names from the sorted-set prefix index (built on first use)."""
+	cache = frappe.cache()
+	key = cache.make_key(CUSTOMER_INDEX_CACHE_KEY)
+	if not cache.exists(CUSTOMER_INDEX_CACHE_KEY):
+		build_customer_index()
+
+	prefix = prefix.encode()
+	members = cache.zrangebylex(key, b"[" + prefix, b"[" + prefix + b"\xff", start=0, num=limit)
+	customers = []
+	for member in members:
+		customer = frappe.safe_decode(member).split("\x00", 1)[1]
+		if customer not in customers:
+			customers.append(customer)
+	return customers
+
+
+def build_customer_index():
+	cache = frappe.cache()
+	key = cache.make_key(CUSTOMER_INDEX_CACHE_KEY)
+	building_key = cache.make_key(f"{CUSTOMER_INDEX_CACHE_KEY}_building")
+
+	members = {}
+	for customer in frappe.get_all(
+		"Customer",
+		filters={"disabled": 0},
+		fields=["name", "customer_name", "mobile_no"],
+		limit_page_length=0,
+	):
+		for member in get_customer_index_members(customer):
+			members[member] = 0
+	if not members:
+		return
+
+	# Built aside and renamed into place so readers never see a partial index.
+	pipeline = cache.pipeline()
+	pipeline.delete(building_key)
+	member_list = list(members)
+	for start in range(0, len(member_list), 5000):
+		pipeline.zadd(building_key, dict.fromkeys(member_list[start : start + 5000], 0))
+	pipeline.rename(building_key, key)
+	pipeline.execute()
+
+
+def update_customer_index(doc, method=None):
+	"""Keep the customer prefix index in step with Customer saves and deletes, after commit."""
+	if method == "on_trash":
+		removed, added = set(get_customer_index_members(doc)), set()
+	else:
+		previous = doc.get_doc_before_save()
+		removed = set(get_customer_index_members(previous)) if previous else set()
+		added = set() if doc.disabled else set(get_customer_index_members(doc))
+
+	def apply():
+		cache = frappe.cache()
+		key = cache.make_key(CUSTOMER_INDEX_CACHE_KEY)
+		if not cache.exists(CUSTOMER_INDEX_CACHE_KEY):
+			return
+		if removed - added:
+			cache.zrem(key, *(removed - added))
+		if added:
+			cache.zadd(key, dict.fromkeys(added, 0))
+
+	frappe.db.after_commit.add(apply)
+
+
+def clear_customer_index(doc=None, method=None, *args, **kwargs):
+	cache = frappe.cache()
+	cache.delete(cache.make_key(CUSTOMER_INDEX_CACHE_KEY))
+
+
+def get_recent_customers(pos_profile):
+	key = f"{RECENT_CUSTOMERS_CACHE_KEY}:{pos_profile}"
+	customers = frappe.cache().lrange(key, 0, RECENT_CUSTOMERS_LIMIT - 1)
+	return [frappe.safe_decode(customer) for customer in customers]
+
+
+def remember_recent_customer(pos_profile, customer):
+	cache = frappe.cache()
+	key = cache.make_key(f"{RECENT_CUSTOMERS_CACHE_KEY}:{pos_profile}")
+	pipeline = cache.pipeline()
+	pipeline.lrem(key, 0, customer)
+	pipeline.lpush(key, customer)
+	pipeline.ltrim(key, 0, RECENT_CUSTOMERS_LIMIT - 1)
+	pipeline.execute()
+
+
 def reconcile_pos_invoice_payments(invoice, mode_of_payment, received_amount):
 	"""Mirror ERPNext POS' payment totals before server-side submit."""
 	received_amount = flt(received_amount)
@@ -965,40 +2794,9 @@ def set_normal_pos_sale_item_fields(item, warehouse):
 		item.against_sales_order = None
 
 
-@frappe.whitelist()
-def create_invoice(
-	cart,
-	customer=None,
-	mode_of_payment="Cash",
-	amount_paid=0,
-	total_payable=None,
-	held_sale_name=None,
-	payment_due_date=None,
-):
-	"""Create an ERPNext POS Invoice using ERPNext's POS payment structure.
-
-	Important: we must NOT manually create `payments` child rows.
-	ERPNext initializes `payments` from the POS Profile via POSInvoice.set_pos_fields()
-	(through update_multi_mode_option). Mart must then only set the `amount` on
-	the appropriate existing payment row.
-	"""
-	profile = get_assigned_pos_profile()
-
-
-	opening_entry = frappe.db.get_value(
-		"POS Opening Entry",
-		{"pos_profile": profile.name, "user": frappe.session.user, "status": "Open", "docstatus": 1},
-		"name",
-	)
-
-	if not opening_entry:
-		frappe.throw(_("Please open a POS shift first."))
-
-
-	selected_customer = customer or profile.customer or "Guest"
+def build_pos_invoice(profile, items, selected_customer, total_payable=None):
+	"""Build and price an unsaved POS Invoice for cart rows (no payments yet)."""
 	invoice = frappe.new_doc("POS Invoice")
-
-
 	invoice.pos_profile = profile.name
 
 	# Link the invoice to the currently open POS Opening Entry for this user + POS Profile.
@@ -1029,7 +2827,6 @@ def create_invoice(
 
 	invoice.flags.ignore_permissions = True
 
-	items = json.loads(cart)
 	for i in items:
 		item_price = flt(i.get("price"))
 		discount_pct = flt(i.get("discount_pct"))
@@ -1084,6 +2881,130 @@ def create_invoice(
 			invoice.discount_amount = flt(invoice.grand_total - total_payable)
 			invoice.calculate_taxes_and_totals()
 
+	return invoice
+
+
+# --- CHECKOUT QUOTES ---
+
+CHECKOUT_QUOTE_CACHE_KEY = "minimart_pos_checkout_quote"
+CHECKOUT_QUOTE_TTL = 5 * 60
+
+
+def get_cart_hash(items):
+	return hashlib.md5(json.dumps(items, sort_keys=True, default=str).encode()).hexdigest()
+
+
+@frappe.whitelist()
+def quote_cart(cart, customer=None, total_payable=None):
+	"""Build and price the invoice for a cart when the payment dialog opens.
+
+	The prepared invoice is cached for a few minutes under the returned
+	`quote_token`; passing it to `create_invoice` skips building and pricing again.
+	"""
+	profile = get_assigned_pos_profile()
+	opening_entry = get_open_opening_entry(profile)
+	if not opening_entry:
+		frappe.throw(_("Please open a POS shift first."))
+
+	selected_customer = customer or profile.customer or "Guest"
+	items = json.loads(cart)
+	invoice = build_pos_invoice(profile, items, selected_customer, total_payable)
+
+	quote_token = frappe.generate_hash(length=16)
+	frappe.cache().set_value(
+		f"{CHECKOUT_QUOTE_CACHE_KEY}:{quote_token}",
+		{
+			"user": frappe.session.user,
+			"pos_profile": profile.name,
+			"opening_entry": opening_entry,
+			"customer": selected_customer,
+			"cart_hash": get_cart_hash(items),
+			"total_payable": flt(total_payable) if total_payable is not None else None,
+			"posting_date": str(invoice.posting_date),
+			"invoice": invoice.as_dict(),
+		},
+		expires_in_sec=CHECKOUT_QUOTE_TTL,
+	)
+	return {
+		"quote_token": quote_token,
+		"net_total": flt(invoice.net_total),
+		"total_taxes_and_charges": flt(invoice.total_taxes_and_charges),
+		"discount_amount": flt(invoice.discount_amount),
+		"grand_total": flt(invoice.grand_total),
+		"rounded_total": flt(invoice.rounded_total),
+	}
+
+
+def get_quoted_invoice(quote_token, profile, items, selected_customer, total_payable):
+	"""Return the quoted invoice if the token still matches this checkout, else None.
+
+	A quote is used once. Any difference (cart, customer, total, shift, or a new
+	day) means the caller builds the invoice from scratch as before.
+	"""
+	if not quote_token:
+		return None
+
+	cache_key = f"{CHECKOUT_QUOTE_CACHE_KEY}:{quote_token}"
+	quote = frappe.cache().get_value(cache_key)
+	frappe.cache().delete_value(cache_key)
+	if not quote:
+		return None
+
+	if (
+		quote["user"] != frappe.session.user
+		or quote["pos_profile"] != profile.name
+		or quote["opening_entry"] != get_open_opening_entry(profile)
+		or quote["customer"] != selected_customer
+		or quote["cart_hash"] != get_cart_hash(items)
+		or quote["total_payable"] != (flt(total_payable) if total_payable is not None else None)
+		or quote["posting_date"] != str(now_datetime().date())
+	):
+		return None
+
+	invoice = frappe.get_doc(quote["invoice"])
+	invoice.flags.ignore_permissions = True
+	return invoice
+
+
+@frappe.whitelist()
+def create_invoice(
+	cart,
+	customer=None,
+	mode_of_payment="Cash",
+	amount_paid=0,
+	total_payable=None,
+	held_sale_name=None,
+	payment_due_date=None,
+	quote_token=None,
+):
+	"""Create an ERPNext POS Invoice using ERPNext's POS payment structure.
+
+	Important: we must NOT manually create `payments` child rows.
+	ERPNext initializes `payments` from the POS Profile via POSInvoice.set_pos_fields()
+	(through update_multi_mode_option). Mart must then only set the `amount` on
+	the appropriate existing payment row.
+
+	With a `quote_token` from `quote_cart` for the same cart, customer and total,
+	the priced invoice is taken from the quote instead of being built again.
+	"""
+	mark_recent_write()
+	started = time.perf_counter()
+	profile = get_assigned_pos_profile()
+
+
+	opening_entry = get_open_opening_entry(profile)
+
+	if not opening_entry:
+		frappe.throw(_("Please open a POS shift first."))
+
+
+	selected_customer = customer or profile.customer or "Guest"
+	items = json.loads(cart)
+	invoice = get_quoted_invoice(quote_token, profile, items, selected_customer, total_payable)
+	checkout_path = "quoted" if invoice else "full"
+	if not invoice:
+		invoice = build_pos_invoice(profile, items, selected_customer, total_payable)
+
 	total_to_pay = flt(invoice.grand_total)
 	received = flt(amount_paid)
 	if received < 0:
@@ -1122,9 +3043,776 @@ def create_invoice(
 	mark_held_sale_completed(held_sale_name, invoice.name)
 
 	frappe.db.commit()
+	if selected_customer not in {"Guest", profile.customer}:
+		remember_recent_customer(profile.name, selected_customer)
+
+	frappe.logger("minimart_pos").info(
+		f"create_invoice {invoice.name} ({checkout_path} path) took "
+		f"{(time.perf_counter() - started) * 1000:.0f} ms"
+	)
 	return invoice.name
 
 
+# --- POS EVENT JOURNAL ---
+
+POS_EVENT_TYPES = {
+	"scan",
+	"line_removed",
+	"price_override",
+	"item_discount",
+	"sale_discount",
+	"cart_cleared",
+	"held_sale_deleted",
+	"sale_returned",
+}
+POS_EVENT_FIELDS = (
+	"event_time",
+	"event_type",
+	"pos_profile",
+	"pos_opening_entry",
+	"cashier",
+	"item_code",
+	"uom",
+	"qty",
+	"amount",
+	"reference",
+	"details",
+)
+MAX_POS_EVENTS_PER_CALL = 500
+
+
+@frappe.whitelist(methods=["POST"])
+def log_pos_events(events):
+	"""Accept a batch of page events for the journal and return at once.
+
+	The rows are written by a background job, so a slow or failing insert never
+	holds up the till.
+	"""
+	if isinstance(events, str):
+		events = json.loads(events or "[]")
+	events = (events or [])[:MAX_POS_EVENTS_PER_CALL]
+	profile = get_assigned_pos_profile()
+	queue_pos_events(profile, events)
+	return {"queued": len(events)}
+
+
+def queue_pos_events(profile, events, after_commit=False):
+	"""Normalise events for the current cashier and shift and enqueue their insert."""
+	cashier = frappe.session.user
+	opening_entry = get_open_opening_entry(profile)
+	rows = []
+	for event in events:
+		if not isinstance(event, dict) or event.get("event_type") not in POS_EVENT_TYPES:
+			continue
+		try:
+			event_time = get_datetime(event.get("event_time")) or now_datetime()
+		except Exception:
+			event_time = now_datetime()
+		rows.append(
+			{
+				"event_time": event_time,
+				"event_type": event["event_type"],
+				"pos_profile": profile.name,
+				"pos_opening_entry": opening_entry,
+				"cashier": cashier,
+				"item_code": str(event.get("item_code") or "")[:140] or None,
+				"uom": str(event.get("uom") or "")[:140] or None,
+				"qty": flt(event.get("qty")),
+				"amount": flt(event.get("amount")),
+				"reference": str(event.get("reference") or "")[:140] or None,
+				"details": str(event.get("details") or "")[:1000] or None,
+			}
+		)
+
+	if rows:
+		frappe.enqueue(
+			"minimart_pos.api.insert_pos_events",
+			queue="short",
+			rows=rows,
+			enqueue_after_commit=after_commit,
+		)
+
+
+def insert_pos_events(rows):
+	"""Append journal rows with one multi-row INSERT per chunk."""
+	now = now_datetime()
+	values = [
+		(
+			frappe.generate_hash(length=12),
+			now,
+			now,
+			row["cashier"],
+			row["cashier"],
+			*(row.get(fieldname) for fieldname in POS_EVENT_FIELDS),
+		)
+		for row in rows
+	]
+	frappe.db.bulk_insert(
+		"Mart POS Event",
+		("name", "creation", "modified", "owner", "modified_by", *POS_EVENT_FIELDS),
+		values,
+	)
+
+
+@frappe.whitelist()
+def get_pos_events(opening_entry=None, cashier=None, event_type=None, limit=500):
+	"""Return journal events, newest first, filtered by shift, cashier and type."""
+	frappe.only_for(["System Manager", "Accounts Manager"])
+	filters = {}
+	if opening_entry:
+		filters["pos_opening_entry"] = opening_entry
+	if cashier:
+		filters["cashier"] = cashier
+	if event_type:
+		filters["event_type"] = event_type
+
+	return frappe.get_all(
+		"Mart POS Event",
+		filters=filters,
+		fields=["name", *POS_EVENT_FIELDS],
+		order_by="event_time desc",
+		limit_page_length=min(max(cint(limit) or 500, 1), 5000),
+	)
+
+
+@frappe.whitelist()
+def get_pos_event_summary(opening_entry=None, cashier=None):
+	"""Count journal events and their amounts per cashier and type."""
+	frappe.only_for(["System Manager", "Accounts Manager"])
+	filters = {}
+	if opening_entry:
+		filters["pos_opening_entry"] = opening_entry
+	if cashier:
+		filters["cashier"] = cashier
+
+	return frappe.get_all(
+		"Mart POS Event",
+		filters=filters,
+		fields=["cashier", "event_type", "count(name) as events", "sum(amount) as amount"],
+		group_by="cashier, event_type",
+		order_by="cashier asc, event_type asc",
+	)
+
+
+# --- HOT PATH INDEXES ---
+
+# Composite indexes the POS queries rely on. Stock ERPNext already has some of
+# them (e.g. the unique Item Barcode.barcode, the child-table `parent` index);
+# `ensure_hot_path_indexes` skips any that an existing index already covers.
+HOT_PATH_INDEXES = (
+	("Item Price", ("item_code", "price_list", "uom", "valid_from", "creation")),
+	("Item Barcode", ("barcode",)),
+	("Bin", ("warehouse", "item_code", "actual_qty")),
+	("POS Invoice", ("pos_profile", "posting_date", "posting_time", "creation")),
+	("POS Invoice", ("pos_opening_entry",)),
+	("POS Invoice", ("posting_date",)),
+	("POS Invoice Item", ("item_code",)),
+	("POS Invoice Item", ("parent", "idx")),
+	("Product Bundle Item", ("parent", "idx")),
+	("Item", ("item_name",)),
+)
+
+
+def ensure_hot_path_indexes():
+	"""Create the missing `HOT_PATH_INDEXES`. Safe to run any number of times."""
+	for doctype, columns in HOT_PATH_INDEXES:
+		if get_covering_index(doctype, columns):
+			continue
+		frappe.db.add_index(doctype, list(columns), index_name=f"mart_pos_{'_'.join(columns)}")
+
+
+def get_covering_index(doctype, columns):
+	"""Return the name of an index whose leading columns are `columns`, if there is one."""
+	indexes = {}
+	for row in frappe.db.sql(f"SHOW INDEX FROM `tab{doctype}`", as_dict=True):
+		indexes.setdefault(row.Key_name, []).append((cint(row.Seq_in_index), row.Column_name))
+	for name, index_columns in indexes.items():
+		leading = tuple(column for seq, column in sorted(index_columns))[: len(columns)]
+		if leading == tuple(columns):
+			return name
+	return None
+
+
+# --- WARM-UP ---
+
+POS_WARM_UP_JOB_ID = "minimart_pos_warm_up"
+POS_WARM_UP_CACHE_KEY = "minimart_pos_warmed_up"
+POS_WARM_UP_TIME_LIMIT = 120
+POS_WARM_UP_CATALOG_PAGES = 20
+POS_WARM_UP_PAGE_LENGTH = 60
+# Sites this process has already compared with the warm-up marker.
+pos_warm_up_checked_sites = set()
+
+
+def enqueue_pos_warm_up():
+	"""after_migrate hook: warm the POS caches in the background."""
+	try:
+		frappe.enqueue(
+			"minimart_pos.api.warm_up_pos_caches",
+			queue="long",
+			job_id=POS_WARM_UP_JOB_ID,
+			deduplicate=True,
+			timeout=POS_WARM_UP_TIME_LIMIT * 2,
+		)
+	except Exception:
+		frappe.logger("minimart_pos").warning("Could not enqueue POS warm-up", exc_info=True)
+
+
+def warm_up_pos_caches_on_boot():
+	"""before_request hook: warm up once after each web server start.
+
+	`bench restart` keeps Redis, so a plain marker survives it. The marker holds
+	the host and gunicorn master pid that last queued a warm-up; the first
+	request a worker process serves for a site compares it with its own master,
+	which is new after every restart. Later requests only check a set.
+	"""
+	if frappe.local.site in pos_warm_up_checked_sites:
+		return
+	pos_warm_up_checked_sites.add(frappe.local.site)
+
+	boot_id = f"{socket.gethostname()}:{os.getppid()}"
+	cache = frappe.cache()
+	if cache.get_value(POS_WARM_UP_CACHE_KEY) != boot_id:
+		cache.set_value(POS_WARM_UP_CACHE_KEY, boot_id)
+		enqueue_pos_warm_up()
+
+
+def warm_up_pos_caches_if_cold():
+	"""Scheduler job: warm up again when the warm-up marker is gone (Redis flushed or restarted)."""
+	cache = frappe.cache()
+	if not cache.get_value(POS_WARM_UP_CACHE_KEY):
+		cache.set_value(POS_WARM_UP_CACHE_KEY, "scheduler")
+		enqueue_pos_warm_up()
+
+
+def warm_up_pos_caches(time_limit=POS_WARM_UP_TIME_LIMIT):
+	"""Prefetch what the first sales of the day need for every active POS Profile.
+
+	Reads the first catalog pages (which pulls Item, Item Price, Bin and UOM
+	pages into the MariaDB buffer pool), the price list, the barcode map and
+	bundle components, and fills the Redis caches the page reads: item group
+	tree, top sellers, thumbnails and the customer index. Stops at `time_limit`
+	seconds and logs how far it got.
+	"""
+	started = time.monotonic()
+	deadline = started + cint(time_limit)
+
+	steps = 0
+	profiles = frappe.get_all("POS Profile", filters={"disabled": 0}, pluck="name")
+	for name in profiles:
+		profile = frappe.get_cached_doc("POS Profile", name)
+		for step in get_warm_up_steps(profile, deadline):
+			if time.monotonic() > deadline:
+				frappe.logger("minimart_pos").warning(
+					f"POS warm-up stopped at its {time_limit}s limit after {steps} steps"
+				)
+				return
+			try:
+				step()
+			except Exception:
+				frappe.logger("minimart_pos").warning(f"POS warm-up step failed for {name}", exc_info=True)
+			steps += 1
+
+	if not frappe.cache().exists(CUSTOMER_INDEX_CACHE_KEY):
+		build_customer_index()
+
+	frappe.logger("minimart_pos").info(
+		f"POS warm-up finished in {time.monotonic() - started:.1f}s "
+		f"for {len(profiles)} POS Profiles ({steps} steps)"
+	)
+
+
+def get_warm_up_steps(profile, deadline):
+	warehouse = (profile.warehouse or "").strip()
+
+	def warm_catalog():
+		cursor = None
+		for page in range(POS_WARM_UP_CATALOG_PAGES):
+			rows, cursor = get_catalog_page(profile, POS_WARM_UP_PAGE_LENGTH, cursor=cursor, order_by="velocity")
+			if page == 0:
+				# The first page is what the till shows on open: build it fully, thumbnails included.
+				for product in build_pos_products(rows, warehouse):
+					if (product.get("thumbnail") or "").startswith("/api/method/"):
+						generate_item_thumbnail(product["image"])
+			if not cursor or time.monotonic() > deadline:
+				break
+
+	def warm_prices():
+		frappe.db.sql(
+			"""
+			SELECT item_code, uom, valid_from, price_list_rate
+			FROM `tabItem Price`
+			WHERE price_list = %s
+			""",
+			profile.selling_price_list,
+		)
+
+	def warm_barcodes():
+		frappe.db.sql("SELECT barcode, parent FROM `tabItem Barcode`")
+
+	def warm_bundles():
+		bundle_names = frappe.get_all("Product Bundle", filters={"disabled": 0}, pluck="name", limit_page_length=0)
+		get_bundle_component_map(bundle_names)
+
+	steps = [warm_catalog, warm_prices, warm_barcodes, warm_bundles]
+	if warehouse:
+		steps += [lambda: get_item_group_tree(warehouse), lambda: get_warehouse_top_sellers(warehouse)]
+	return steps
+
+
+# --- SHELF LABELS ---
+
+LABEL_ITEM_BATCH_SIZE = 500
+LABELS_PER_PAGE = 24
+LABEL_SHEET_CSS = """
+@page { size: A4; margin: 8mm; }
+body { margin: 0; font-family: sans-serif; }
+.sheet { display: grid; grid-template-columns: repeat(3, 1fr); gap: 2mm; page-break-after: always; }
+.label { border: 1px dashed #999; height: 33mm; padding: 2mm; box-sizing: border-box; overflow: hidden; }
+.name { font-size: 9pt; height: 2.4em; overflow: hidden; }
+.price { font-size: 18pt; font-weight: bold; }
+.uom { font-size: 8pt; color: #555; }
+.barcode svg { width: 100%; height: 9mm; display: block; }
+.code { font-size: 7pt; text-align: center; }
+@media screen { .sheet { margin-bottom: 8mm; } }
+"""
+
+CODE128_PATTERNS = (
+	"212222", "222122", "222221", "121223", "121322", "131222", "122213", "122312", "132212", "221213",
+	"221312", "231212", "112232", "122132", "122231", "113222", "123122", "123221", "223211", "221132",
+	"221231", "213212", "223112", "312131", "311222", "321122", "321221", "312212", "322112", "322211",
+	"212123", "212321", "232121", "111323", "131123", "131321", "112313", "132113", "132311", "211313",
+	"231113", "231311", "112133", "112331", "132131", "113123", "113321", "133121", "313121", "211331",
+	"231131", "213113", "213311", "213131", "311123", "311321", "331121", "312113", "312311", "332111",
+	"314111", "221411", "431111", "111224", "111422", "121124", "121421", "141122", "141221", "112214",
+	"112412", "122114", "122411", "142112", "142211", "241211", "221114", "413111", "241112", "134111",
+	"111242", "121142", "121241", "114212", "124112", "124211", "411212", "421112", "421211", "212141",
+	"214121", "412121", "111143", "111341", "131141", "114113", "114311", "411113", "411311", "113141",
+	"114131", "311141", "411131", "211412", "211214", "211232", "2331112",
+)
+CODE128_START_B = 104
+CODE128_START_C = 105
+CODE128_CODE_B = 100
+CODE128_CODE_C = 99
+CODE128_STOP = 106
+
+
+def encode_code128(data):
+	"""Return the Code 128 symbol values for `data`, with start code and checksum, or None.
+
+	Digits use code set C (two per symbol); anything else uses code set B, which
+	covers printable ASCII.
+	"""
+	if not data or any(not 32 <= ord(char) <= 126 for char in data):
+		return None
+
+	if data.isdigit() and len(data) >= 4:
+		values = [CODE128_START_C]
+		even = len(data) - len(data) % 2
+		values += [int(data[i : i + 2]) for i in range(0, even, 2)]
+		if even < len(data):
+			values += [CODE128_CODE_B, ord(data[-1]) - 32]
+	else:
+		values = [CODE128_START_B, *(ord(char) - 32 for char in data)]
+
+	checksum = values[0] + sum(position * value for position, value in enumerate(values[1:], 1))
+	return [*values, checksum % 103, CODE128_STOP]
+
+
+def get_code128_svg(data, height=40, quiet_zone=10):
+	"""Return an inline SVG Code 128 barcode for `data`, or "" if it cannot be encoded."""
+	values = encode_code128(data)
+	if not values:
+		return ""
+
+	x = quiet_zone
+	bars = []
+	for value in values:
+		for position, width in enumerate(CODE128_PATTERNS[value]):
+			width = int(width)
+			if position % 2 == 0:
+				bars.append(f"M{x} 0h{width}v{height}h-{width}z")
+			x += width
+	width = x + quiet_zone
+	return (
+		f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" '
+		f'preserveAspectRatio="none"><path d="{"".join(bars)}"/></svg>'
+	)
+
+
+@frappe.whitelist()
+def label_sheet(item_group=None, price_changed_since=None, items=None, labels_per_page=LABELS_PER_PAGE):
+	"""Stream a printable HTML sheet of shelf labels with prices and Code 128 barcodes.
+
+	Pick items by `item_group` (including sub-groups), by price rows created
+	since `price_changed_since` in the POS Profile price list, or by an explicit
+	`items` list (JSON or comma separated). Prices and barcodes are resolved in
+	batches of `LABEL_ITEM_BATCH_SIZE` items as the client reads the sheet, and
+	the HTML is written one page at a time, so only one batch of rows and one
+	page of labels are held in memory. Print it from the browser, or save it as
+	PDF there.
+	"""
+	profile = get_assigned_pos_profile()
+	item_codes = get_label_item_codes(profile, item_group, price_changed_since, items)
+	labels_per_page = min(max(cint(labels_per_page) or LABELS_PER_PAGE, 1), 100)
+	title = frappe.utils.escape_html(_("Shelf Labels"))
+
+	def generate():
+		# Frappe closes the request's connection before the body is read, so the
+		# batches are resolved on a connection of their own, as in the sales export.
+		frappe.connect(set_admin_as_user=False)
+		try:
+			yield f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{title}</title>"
+			yield f"<style>{LABEL_SHEET_CSS}</style></head><body>"
+			page = []
+			for start in range(0, len(item_codes), LABEL_ITEM_BATCH_SIZE):
+				for row in get_label_rows(profile, item_codes[start : start + LABEL_ITEM_BATCH_SIZE]):
+					page.append(render_shelf_label(row))
+					if len(page) == labels_per_page:
+						yield f'<section class="sheet">{"".join(page)}</section>'
+						page = []
+			if page:
+				yield f'<section class="sheet">{"".join(page)}</section>'
+			yield "</body></html>"
+		finally:
+			frappe.db.close()
+
+	return Response(generate(), mimetype="text/html", direct_passthrough=True)
+
+
+def get_label_item_codes(profile, item_group=None, price_changed_since=None, items=None):
+	"""Return the item codes to label, in catalog (item name) order."""
+	if items:
+		if isinstance(items, str):
+			try:
+				items = json.loads(items)
+			except ValueError:
+				items = items.split(",")
+		item_codes = [str(item_code).strip() for item_code in items if str(item_code).strip()]
+	elif price_changed_since:
+		item_codes = frappe.get_all(
+			"Item Price",
+			filters={
+				"price_list": profile.selling_price_list,
+				"creation": [">=", get_datetime(price_changed_since)],
+			},
+			pluck="item_code",
+			distinct=True,
+			limit_page_length=0,
+		)
+	elif item_group:
+		bounds = frappe.db.get_value("Item Group", item_group, ["lft", "rgt"])
+		if not bounds:
+			frappe.throw(_("Item Group {0} not found.").format(item_group))
+		item_groups = frappe.get_all(
+			"Item Group", filters={"lft": [">=", bounds[0]], "rgt": ["<=", bounds[1]]}, pluck="name"
+		)
+		item_codes = frappe.get_all(
+			"Item",
+			filters={"item_group": ["in", item_groups], "disabled": 0},
+			pluck="name",
+			order_by="item_name asc",
+			limit_page_length=0,
+		)
+	else:
+		frappe.throw(_("Choose an Item Group, a price change date, or items to print labels for."))
+
+	if item_codes and (price_changed_since or items):
+		# Catalog order, so explicit lists and price changes print like group sheets.
+		item_codes = frappe.get_all(
+			"Item",
+			filters={"name": ["in", item_codes]},
+			pluck="name",
+			order_by="item_name asc",
+			limit_page_length=0,
+		)
+	return item_codes
+
+
+def get_label_rows(profile, item_codes):
+	"""Resolve current price and barcode for a batch of items with two queries."""
+	if not item_codes:
+		return []
+
+	rows = get_catalog_rows(profile, item_codes=item_codes, in_stock_only=False)
+	barcodes = {}
+	for row in frappe.get_all(
+		"Item Barcode",
+		filters={"parent": ["in", item_codes]},
+		fields=["parent", "barcode", "uom"],
+		order_by="idx asc",
+		limit_page_length=0,
+	):
+		barcodes.setdefault((row.parent, row.uom or None), row.barcode)
+		barcodes.setdefault((row.parent, None), row.barcode)
+
+	currency = profile.currency
+	label_rows = []
+	for row in rows:
+		if flt(row.price) <= 0:
+			continue
+		label_rows.append(
+			(
+				row.item_code,
+				row.item_name,
+				row.uom,
+				frappe.utils.fmt_money(row.price, currency=currency),
+				barcodes.get((row.item_code, row.uom)) or barcodes.get((row.item_code, None)) or row.item_code,
+			)
+		)
+	return label_rows
+
+
+def render_shelf_label(row):
+	item_code, item_name, uom, price, barcode = row
+	escape = frappe.utils.escape_html
+	return (
+		f'<div class="label"><div class="name">{escape(item_name or item_code)}</div>'
+		f'<div class="price">{escape(price)} <span class="uom">/ {escape(uom or "")}</span></div>'
+		f'<div class="barcode">{get_code128_svg(barcode)}</div>'
+		f'<div class="code">{escape(barcode)}</div></div>'
+	)
+
+
+# --- STOCK COUNT ---
+
+# Counts at or below this many item rows become a Stock Reconciliation inside
+# the request; bigger counts are handed to a background job.
+STOCK_COUNT_SYNC_LIMIT = 100
+OPEN_STOCK_COUNT_STATUSES = ("Draft", "Queued", "Failed")
+
+
+@frappe.whitelist()
+def start_stock_count():
+	"""Return the cashier's open stock count for the POS Profile warehouse, starting one if needed."""
+	profile = get_assigned_pos_profile()
+	name = frappe.db.get_value(
+		"Mart POS Stock Count",
+		{
+			"pos_profile": profile.name,
+			"counted_by": frappe.session.user,
+			"status": ["in", OPEN_STOCK_COUNT_STATUSES],
+		},
+		"name",
+	)
+	if name:
+		doc = frappe.get_doc("Mart POS Stock Count", name)
+	else:
+		doc = frappe.new_doc("Mart POS Stock Count")
+		doc.pos_profile = profile.name
+		doc.company = profile.company
+		doc.warehouse = profile.warehouse
+		doc.counted_by = frappe.session.user
+		doc.status = "Draft"
+		doc.counts = "[]"
+		doc.flags.ignore_permissions = True
+		doc.insert()
+	return get_stock_count_state(doc, with_counts=True)
+
+
+@frappe.whitelist(methods=["POST"])
+def save_stock_count(stock_count, deltas, batch, scan_count=0):
+	"""Add a batch of count deltas, `[[item_code, uom, qty], ...]`, to a draft stock count.
+
+	`batch` increases with every save from the page; a batch that was already
+	applied (a retried request) is ignored.
+	"""
+	mark_recent_write()
+	doc = get_open_stock_count(stock_count)
+	if doc.status != "Draft":
+		frappe.throw(_("Stock Count {0} is already being submitted.").format(doc.name))
+	apply_stock_count_deltas(doc, deltas, batch, scan_count)
+	doc.save()
+	return get_stock_count_state(doc)
+
+
+@frappe.whitelist(methods=["POST"])
+def submit_stock_count(stock_count, deltas=None, batch=None, scan_count=0):
+	"""Apply the last deltas and turn the count into one Stock Reconciliation.
+
+	Small counts are reconciled in this request. Larger ones are queued; poll
+	`get_stock_count_status` for the result.
+	"""
+	mark_recent_write()
+	doc = get_open_stock_count(stock_count)
+	if doc.status == "Queued":
+		return get_stock_count_state(doc)
+	if deltas:
+		apply_stock_count_deltas(doc, deltas, batch, scan_count)
+	if not json.loads(doc.counts or "[]"):
+		frappe.throw(_("Nothing has been counted yet."))
+
+	doc.status = "Queued"
+	doc.error = None
+	doc.save()
+	# Keep the counts even if the reconciliation below fails and rolls back.
+	frappe.db.commit()
+
+	if len(json.loads(doc.counts)) > STOCK_COUNT_SYNC_LIMIT:
+		frappe.enqueue(
+			"minimart_pos.api.make_stock_count_reconciliation",
+			queue="long",
+			timeout=1800,
+			stock_count=doc.name,
+			enqueue_after_commit=True,
+		)
+	else:
+		make_stock_count_reconciliation(doc.name)
+		doc.reload()
+	return get_stock_count_state(doc)
+
+
+@frappe.whitelist()
+def get_stock_count_status(stock_count):
+	doc = frappe.get_doc("Mart POS Stock Count", stock_count)
+	if doc.counted_by != frappe.session.user:
+		frappe.throw(_("You can only view your own stock counts."))
+	return get_stock_count_state(doc)
+
+
+@frappe.whitelist(methods=["POST"])
+def cancel_stock_count(stock_count):
+	doc = get_open_stock_count(stock_count)
+	if doc.status == "Queued":
+		frappe.throw(_("Stock Count {0} is already being submitted.").format(doc.name))
+	doc.status = "Cancelled"
+	doc.save()
+	return get_stock_count_state(doc)
+
+
+def get_open_stock_count(stock_count):
+	doc = frappe.get_doc("Mart POS Stock Count", stock_count, for_update=True)
+	if doc.counted_by != frappe.session.user:
+		frappe.throw(_("You can only update your own stock counts."))
+	if doc.status not in OPEN_STOCK_COUNT_STATUSES:
+		frappe.throw(_("Stock Count {0} is already {1}.").format(doc.name, _(doc.status)))
+	if doc.status == "Failed":
+		# Counting may continue after a failed submit; it is a draft again.
+		doc.status = "Draft"
+	doc.flags.ignore_permissions = True
+	return doc
+
+
+def apply_stock_count_deltas(doc, deltas, batch, scan_count):
+	if isinstance(deltas, str):
+		deltas = json.loads(deltas or "[]")
+	if batch is not None:
+		if cint(batch) <= cint(doc.last_batch):
+			return
+		doc.last_batch = cint(batch)
+
+	counts = {(item_code, uom): flt(qty) for item_code, uom, qty in json.loads(doc.counts or "[]")}
+	for item_code, uom, qty in deltas or []:
+		key = (item_code, uom or None)
+		counts[key] = counts.get(key, 0) + flt(qty)
+	doc.counts = json.dumps(
+		[[item_code, uom, qty] for (item_code, uom), qty in counts.items() if qty > 0],
+		separators=(",", ":"),
+	)
+	doc.scan_count = cint(doc.scan_count) + cint(scan_count)
+
+
+def get_stock_count_state(doc, with_counts=False):
+	state = {
+		"name": doc.name,
+		"status": doc.status,
+		"warehouse": doc.warehouse,
+		"scan_count": cint(doc.scan_count),
+		"last_batch": cint(doc.last_batch),
+		"stock_reconciliation": doc.stock_reconciliation,
+		"skipped_items": doc.skipped_items,
+		"error": doc.error,
+	}
+	if with_counts:
+		state["counts"] = json.loads(doc.counts or "[]")
+	return state
+
+
+def make_stock_count_reconciliation(stock_count):
+	"""Create and submit one Stock Reconciliation for a queued stock count.
+
+	Runs as the user who submitted the count, so Stock Reconciliation
+	permissions apply. On failure the count goes back to the cashier as Failed,
+	with its counts kept.
+	"""
+	doc = frappe.get_doc("Mart POS Stock Count", stock_count)
+	if doc.status != "Queued":
+		return
+
+	try:
+		totals, skipped = get_stock_count_totals(json.loads(doc.counts or "[]"))
+		if not totals:
+			frappe.throw(_("None of the counted items can be reconciled."))
+
+		reconciliation = frappe.new_doc("Stock Reconciliation")
+		reconciliation.company = doc.company
+		reconciliation.purpose = "Stock Reconciliation"
+		reconciliation.set_warehouse = doc.warehouse
+		reconciliation.remarks = _("Mart POS stock count {0}").format(doc.name)
+		for item_code, qty in totals.items():
+			reconciliation.append("items", {"item_code": item_code, "warehouse": doc.warehouse, "qty": qty})
+		reconciliation.insert()
+		reconciliation.submit()
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error(title=f"Mart POS stock count {stock_count} failed")
+		doc.db_set({"status": "Failed", "error": str(e)[:1000]})
+		frappe.db.commit()
+		return
+
+	doc.db_set(
+		{
+			"status": "Submitted",
+			"stock_reconciliation": reconciliation.name,
+			"skipped_items": ", ".join(skipped) or None,
+		}
+	)
+
+
+def get_stock_count_totals(counts):
+	"""Convert [[item_code, uom, qty], ...] to {item_code: stock qty} with two queries.
+
+	Items that are not stock items, use batches or serial numbers, or were
+	counted in a UOM without a conversion factor are left out and returned.
+	"""
+	item_codes = list({item_code for item_code, uom, qty in counts})
+	items = {
+		row.name: row
+		for row in frappe.get_all(
+			"Item",
+			filters={"name": ["in", item_codes]},
+			fields=["name", "stock_uom", "is_stock_item", "has_batch_no", "has_serial_no"],
+			limit_page_length=0,
+		)
+	}
+	factors = {
+		(row.parent, row.uom): flt(row.conversion_factor)
+		for row in frappe.get_all(
+			"UOM Conversion Detail",
+			filters={"parenttype": "Item", "parent": ["in", item_codes]},
+			fields=["parent", "uom", "conversion_factor"],
+			limit_page_length=0,
+		)
+	}
+
+	totals = {}
+	skipped = set()
+	for item_code, uom, qty in counts:
+		item = items.get(item_code)
+		if not item or not item.is_stock_item or item.has_batch_no or item.has_serial_no:
+			skipped.add(item_code)
+			continue
+		factor = 1 if not uom or uom == item.stock_uom else factors.get((item_code, uom))
+		if not factor:
+			skipped.add(item_code)
+			continue
+		totals[item_code] = totals.get(item_code, 0) + flt(qty) * factor
+
+	for item_code in skipped:
+		totals.pop(item_code, None)
+	return totals, sorted(skipped)
+
+
 # --- VOID / CANCEL LOGIC ---
 
 
@@ -1139,12 +3827,603 @@ def void_invoice(invoice_name):
 	)
 
 
+# --- RETURNS ---
+
+# `Mart POS Returned Qty` holds, per original POS Invoice Item row (named after
+# it), the quantity already taken back by submitted return POS Invoices. The
+# return dialog reads it with the invoice lines in one primary-key join instead
+# of summing every return made against the invoice.
+
+
+@frappe.whitelist()
+def get_returnable_invoice(invoice):
+	"""Find a POS Invoice by name, receipt barcode or short number (#00012) with its returnable lines."""
+	profile = get_assigned_pos_profile()
+	name = resolve_return_invoice_name(invoice, profile)
+	if not name:
+		frappe.throw(
+			_("No submitted POS Invoice {0} found for POS Profile {1}.").format(
+				frappe.bold(invoice), frappe.bold(profile.name)
+			)
+		)
+
+	original = get_return_source_invoice(name, profile)
+	lines = get_return_lines(name)
+	return {
+		"name": original.name,
+		"customer": original.customer,
+		"posting_date": original.posting_date,
+		"grand_total": flt(original.grand_total),
+		"default_mode_of_payment": get_default_refund_mode(original),
+		"lines": lines,
+		"has_returnable_qty": any(line.returnable_qty > 0 for line in lines),
+	}
+
+
+@frappe.whitelist(methods=["POST"])
+def create_return_invoice(invoice, items, mode_of_payment=None):
+	"""Create and submit a return POS Invoice for part or all of a sale.
+
+	`items` is `[{"pos_invoice_item": <original row name>, "qty": <qty to return>}, ...]`.
+	The refund is paid out through `mode_of_payment` (default: how the sale was
+	paid), or credited to the customer's balance for "Utang".
+	"""
+	mark_recent_write()
+	started = time.perf_counter()
+	profile = get_assigned_pos_profile()
+	opening_entry = get_open_opening_entry(profile)
+	if not opening_entry:
+		frappe.throw(_("Please open a POS shift first."))
+
+	if isinstance(items, str):
+		items = json.loads(items or "[]")
+	requested = {}
+	for row in items or []:
+		qty = flt(row.get("qty"))
+		if qty > 0 and row.get("pos_invoice_item"):
+			requested[row["pos_invoice_item"]] = requested.get(row["pos_invoice_item"], 0) + qty
+	if not requested:
+		frappe.throw(_("Select at least one item to return."))
+
+	# Lock the sale so two tills cannot return the same lines at the same time.
+	frappe.db.get_value("POS Invoice", invoice, "name", for_update=True)
+	original = get_return_source_invoice(invoice, profile)
+	lines = {line.name: line for line in get_return_lines(original.name)}
+	for row_name, qty in requested.items():
+		line = lines.get(row_name)
+		if not line:
+			frappe.throw(_("Row {0} is not part of POS Invoice {1}.").format(row_name, original.name))
+		if qty > line.returnable_qty + 1e-9:
+			frappe.throw(
+				_("Only {0} {1} of {2} can still be returned.").format(
+					line.returnable_qty, line.uom, frappe.bold(line.item_name)
+				)
+			)
+
+	return_invoice = make_sales_return(original.name)
+	return_invoice.set("items", [row for row in return_invoice.items if row.pos_invoice_item in requested])
+	for idx, row in enumerate(return_invoice.items, 1):
+		row.idx = idx
+		row.qty = -requested[row.pos_invoice_item]
+		row.stock_qty = row.qty * flt(row.conversion_factor or 1)
+
+	# A sale-level discount is given back in proportion to the value returned.
+	if flt(original.discount_amount) and flt(original.total):
+		returned_value = sum(
+			flt(lines[row_name].amount) * qty / flt(lines[row_name].qty)
+			for row_name, qty in requested.items()
+			if flt(lines[row_name].qty)
+		)
+		return_invoice.discount_amount = -flt(
+			original.discount_amount * returned_value / flt(original.total),
+			return_invoice.precision("discount_amount"),
+		)
+
+	return_invoice.pos_opening_entry = opening_entry
+	return_invoice.set_posting_time = 1
+	return_invoice.posting_date = now_datetime().date()
+	return_invoice.posting_time = nowtime()
+	return_invoice.due_date = return_invoice.posting_date
+	return_invoice.flags.ignore_permissions = True
+	return_invoice.calculate_taxes_and_totals()
+
+	mode_of_payment = mode_of_payment or get_default_refund_mode(original)
+	refund = 0 if mode_of_payment == "Utang" else flt(return_invoice.rounded_total or return_invoice.grand_total)
+	reconcile_pos_invoice_payments(return_invoice, mode_of_payment, refund)
+	return_invoice.insert()
+	reconcile_pos_invoice_payments(return_invoice, mode_of_payment, refund)
+	return_invoice.submit()
+
+	queue_pos_events(
+		profile,
+		[
+			{
+				"event_type": "sale_returned",
+				"qty": -sum(flt(row.qty) for row in return_invoice.items),
+				"amount": -flt(return_invoice.grand_total),
+				"reference": return_invoice.name,
+				"details": f"Return against {original.name} ({mode_of_payment})",
+			}
+		],
+		after_commit=True,
+	)
+	frappe.db.commit()
+
+	frappe.logger("minimart_pos").info(
+		f"create_return_invoice {return_invoice.name} against {original.name} took "
+		f"{(time.perf_counter() - started) * 1000:.0f} ms"
+	)
+	return {
+		"name": return_invoice.name,
+		"return_against": original.name,
+		"grand_total": flt(return_invoice.grand_total),
+		"mode_of_payment": mode_of_payment,
+	}
+
+
+def resolve_return_invoice_name(invoice, profile):
+	value = (invoice or "").strip().lstrip("#")
+	if not value:
+		return None
+	if frappe.db.exists("POS Invoice", value):
+		return value
+	if not value.isdigit():
+		return None
+
+	candidates = get_pos_invoice_number_candidates(value)
+	if not candidates:
+		return None
+	return frappe.db.get_value(
+		"POS Invoice",
+		{"name": ["in", candidates], "pos_profile": profile.name, "docstatus": 1, "is_return": 0},
+		"name",
+		order_by="creation desc",
+	)
+
+
+def get_pos_invoice_number_candidates(number):
+	"""Return the POS Invoice names a short receipt number can stand for.
+
+	A number like 12 is matched as 00012 against every POS Invoice naming
+	series prefix that has been used (one `tabSeries` row per prefix, e.g.
+	per year), so the lookup is a handful of primary-key reads.
+	"""
+	options = (frappe.get_meta("POS Invoice").get_options("naming_series") or "").split("\n")
+	candidates = []
+	for option in filter(None, (option.strip() for option in options)):
+		prefix = option.split(".")[0]
+		digits = option.count("#") or 5
+		for (series,) in frappe.db.sql(
+			"SELECT name FROM `tabSeries` WHERE name LIKE %s",
+			(prefix.replace("%", "\\%").replace("_", "\\_") + "%",),
+		):
+			candidates.append(f"{series}{number.zfill(digits)}")
+	return candidates
+
+
+def get_return_source_invoice(name, profile):
+	original = frappe.get_doc("POS Invoice", name)
+	if original.docstatus != 1 or original.is_return:
+		frappe.throw(_("POS Invoice {0} is not a submitted sale.").format(frappe.bold(name)))
+	if original.pos_profile != profile.name:
+		frappe.throw(
+			_("POS Invoice {0} was sold on POS Profile {1}. Return it there.").format(
+				frappe.bold(name), frappe.bold(original.pos_profile)
+			)
+		)
+	return original
+
+
+def get_return_lines(invoice):
+	"""Return the lines of a POS Invoice with the quantity already returned and still returnable."""
+	lines = frappe.db.sql(
+		"""
+		SELECT
+			pii.name, pii.item_code, pii.item_name, pii.uom, pii.qty, pii.rate, pii.amount,
+			COALESCE(rq.returned_qty, 0) AS returned_qty
+		FROM `tabPOS Invoice Item` pii
+		LEFT JOIN `tabMart POS Returned Qty` rq ON rq.name = pii.name
+		WHERE pii.parent = %s AND pii.parenttype = 'POS Invoice'
+		ORDER BY pii.idx
+		""",
+		invoice,
+		as_dict=True,
+	)
+	for line in lines:
+		line.returnable_qty = max(flt(line.qty) - flt(line.returned_qty), 0)
+	return lines
+
+
+def get_default_refund_mode(invoice):
+	paid = [payment for payment in invoice.get("payments") or [] if flt(payment.amount) > 0]
+	if not paid:
+		return "Utang"
+	return max(paid, key=lambda payment: flt(payment.amount)).mode_of_payment
+
+
+def update_returned_qty(doc, method=None):
+	"""POS Invoice on_submit/on_cancel: count a return's lines against the lines of the original sale."""
+	if not doc.get("is_return") or not doc.get("return_against"):
+		return
+
+	sign = -1 if method == "on_cancel" else 1
+	rows = {}
+	for item in doc.get("items") or []:
+		if item.get("pos_invoice_item"):
+			# Return rows carry negative quantities.
+			rows[item.pos_invoice_item] = rows.get(item.pos_invoice_item, 0) - flt(item.qty)
+	write_returned_qty([(doc.return_against, row_name, sign * qty) for row_name, qty in rows.items()])
+
+
+def write_returned_qty(rows):
+	"""Add each (original invoice, original row name, qty) delta to the returned quantities."""
+	rows = [row for row in rows if row[2]]
+	if not rows:
+		return
+
+	now = now_datetime()
+	placeholders = ", ".join(["(%s, %s, %s, %s, %s, 0, 0, %s, %s)"] * len(rows))
+	frappe.db.sql(
+		f"""
+		INSERT INTO `tabMart POS Returned Qty`
+			(name, creation, modified, modified_by, owner, docstatus, idx,
+			pos_invoice, returned_qty)
+		VALUES {placeholders}
+		ON DUPLICATE KEY UPDATE
+			returned_qty = returned_qty + VALUES(returned_qty),
+			modified = VALUES(modified)
+		""",
+		[
+			value
+			for pos_invoice, row_name, qty in rows
+			for value in (row_name, now, now, "Administrator", "Administrator", pos_invoice, qty)
+		],
+	)
+
+
+def rebuild_returned_qty():
+	"""Recompute every returned quantity from the submitted return POS Invoices."""
+	frappe.db.delete("Mart POS Returned Qty")
+	rows = frappe.db.sql(
+		"""
+		SELECT r.return_against, ri.pos_invoice_item, -SUM(ri.qty)
+		FROM `tabPOS Invoice Item` ri
+		INNER JOIN `tabPOS Invoice` r ON r.name = ri.parent
+		WHERE r.docstatus = 1 AND r.is_return = 1
+			AND IFNULL(r.return_against, '') != ''
+			AND IFNULL(ri.pos_invoice_item, '') != ''
+		GROUP BY r.return_against, ri.pos_invoice_item
+		"""
+	)
+	for start in range(0, len(rows), 1000):
+		write_returned_qty(rows[start : start + 1000])
+
+
+# --- SALES EXPORT ---
+
+SALES_EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+SALES_EXPORT_FETCH_SIZE = 2000
+# (column, SQL) for every exported line, in output order.
+SALES_EXPORT_COLUMNS = (
+	("pos_invoice", "p.name"),
+	("posting_date", "p.posting_date"),
+	("posting_time", "p.posting_time"),
+	("company", "p.company"),
+	("pos_profile", "p.pos_profile"),
+	("pos_opening_entry", "p.pos_opening_entry"),
+	("cashier", "p.owner"),
+	("customer", "p.customer"),
+	("is_return", "p.is_return"),
+	("return_against", "p.return_against"),
+	("invoice_grand_total", "p.grand_total"),
+	(
+		"mode_of_payment",
+		"COALESCE(pay.mode_of_payment, IF(p.outstanding_amount != 0, 'Utang', NULL))",
+	),
+	("line", "pii.idx"),
+	("item_code", "pii.item_code"),
+	("item_name", "pii.item_name"),
+	("item_group", "pii.item_group"),
+	("warehouse", "pii.warehouse"),
+	("uom", "pii.uom"),
+	("qty", "pii.qty"),
+	("conversion_factor", "pii.conversion_factor"),
+	("stock_qty", "pii.stock_qty"),
+	("price_list_rate", "pii.price_list_rate"),
+	("discount_percentage", "pii.discount_percentage"),
+	("discount_amount", "pii.discount_amount"),
+	("rate", "pii.rate"),
+	("amount", "pii.amount"),
+	("net_amount", "pii.net_amount"),
+)
+
+
+@frappe.whitelist()
+def export_sales_lines(pos_opening_entry=None, pos_profile=None, from_date=None, to_date=None, export_format="csv"):
+	"""Stream submitted POS Invoice lines as CSV or NDJSON, one row per item line.
+
+	Filter by shift (`pos_opening_entry`), `pos_profile`, a posting date range,
+	or any combination. Rows are read through an unbuffered (server-side)
+	cursor and written as they arrive, so memory use does not depend on the
+	number of lines exported.
+	"""
+	frappe.only_for(["System Manager", "Accounts Manager", "Accounts User"])
+	if export_format not in SALES_EXPORT_FORMATS:
+		frappe.throw(_("Export format must be one of {0}.").format(", ".join(SALES_EXPORT_FORMATS)))
+	if not (pos_opening_entry or pos_profile or from_date or to_date):
+		frappe.throw(_("Choose a shift, a POS Profile or a date range to export."))
+
+	# `{0}` is the POS Invoice alias, so the same filters apply to the payment
+	# aggregate below and to the outer query.
+	conditions = ["{0}.docstatus = 1"]
+	values = {}
+	if pos_opening_entry:
+		conditions.append("{0}.pos_opening_entry = %(pos_opening_entry)s")
+		values["pos_opening_entry"] = pos_opening_entry
+	if pos_profile:
+		conditions.append("{0}.pos_profile = %(pos_profile)s")
+		values["pos_profile"] = pos_profile
+	if from_date:
+		conditions.append("{0}.posting_date >= %(from_date)s")
+		values["from_date"] = getdate(from_date)
+	if to_date:
+		conditions.append("{0}.posting_date <= %(to_date)s")
+		values["to_date"] = getdate(to_date)
+	where = " AND ".join(conditions)
+
+	# Payment modes are aggregated once per invoice in a derived table instead
+	# of a correlated subquery evaluated for every exported line.
+	query = f"""
+		SELECT {", ".join(sql for column, sql in SALES_EXPORT_COLUMNS)}
+		FROM `tabPOS Invoice` p
+		INNER JOIN `tabPOS Invoice Item` pii ON pii.parent = p.name AND pii.parenttype = 'POS Invoice'
+		LEFT JOIN (
+			SELECT
+				sip.parent,
+				GROUP_CONCAT(sip.mode_of_payment ORDER BY sip.idx SEPARATOR ', ') AS mode_of_payment
+			FROM `tabSales Invoice Payment` sip
+			INNER JOIN `tabPOS Invoice` pp ON pp.name = sip.parent
+			WHERE sip.parenttype = 'POS Invoice' AND sip.amount != 0 AND {where.format("pp")}
+			GROUP BY sip.parent
+		) pay ON pay.parent = p.name
+		WHERE {where.format("p")}
+		ORDER BY p.posting_date, p.posting_time, p.name, pii.idx
+	"""
+	columns = [column for column, sql in SALES_EXPORT_COLUMNS]
+	filename = "mart-pos-sales-{}.{}".format(
+		"-".join(str(value) for value in (pos_opening_entry, pos_profile, from_date, to_date) if value),
+		export_format,
+	)
+	frappe.logger("minimart_pos").info(f"export_sales_lines {filename} by {frappe.session.user}")
+
+	return Response(
+		iter_sales_export(get_export_connection_settings(), query, values, columns, export_format),
+		mimetype=SALES_EXPORT_FORMATS[export_format],
+		headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"},
+		direct_passthrough=True,
+	)
+
+
+def get_export_connection_settings():
+	"""Connection settings for a separate export connection to the site database.
+
+	Frappe closes the request's connection before the response body is read,
+	so the streamed export opens its own. Dates, times and decimals are decoded
+	straight to strings and floats by the driver, ready to write.
+	"""
+	settings = frappe.db.get_connection_settings()
+	conv = dict(conversions)
+	for field_type in (FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL):
+		conv[field_type] = float
+	for field_type in (FIELD_TYPE.DATE, FIELD_TYPE.TIME, FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP):
+		conv[field_type] = str
+	settings["conv"] = conv
+	settings["cursorclass"] = pymysql.cursors.SSCursor
+	return settings
+
+
+def iter_sales_export(settings, query, values, columns, export_format):
+	"""Run `query` on a new unbuffered connection and yield it encoded, `SALES_EXPORT_FETCH_SIZE` rows at a time."""
+	connection = pymysql.connect(**settings)
+	try:
+		with connection.cursor() as cursor:
+			cursor.execute(query, values)
+			if export_format == "csv":
+				yield encode_sales_export_rows([columns], "csv")
+			while True:
+				rows = cursor.fetchmany(SALES_EXPORT_FETCH_SIZE)
+				if not rows:
+					break
+				yield encode_sales_export_rows(rows, export_format, columns)
+	finally:
+		connection.close()
+
+
+def encode_sales_export_rows(rows, export_format, columns=None):
+	if export_format == "csv":
+		buffer = io.StringIO()
+		csv.writer(buffer).writerows(rows)
+		return buffer.getvalue()
+	return "".join(json.dumps(dict(zip(columns, row, strict=True)), separators=(",", ":")) + "\n" for row in rows)
+
+
+# --- ESC/POS RECEIPTS ---
+
+RECEIPT_CACHE_KEY = "minimart_pos_receipt"
+RECEIPT_CACHE_TTL = 24 * 60 * 60
+RECEIPT_FORMATS = ("escpos", "text")
+# Characters per line in font A: 32 on 58 mm paper, 48 on 80 mm; 12 dots each.
+RECEIPT_WIDTH = 32
+RECEIPT_DOTS_PER_CHAR = 12
+
+ESC_POS_INIT = b"\x1b@"
+ESC_POS_ALIGN = {"left": b"\x1ba\x00", "center": b"\x1ba\x01", "right": b"\x1ba\x02"}
+ESC_POS_BOLD = (b"\x1bE\x00", b"\x1bE\x01")
+ESC_POS_SIZE = (b"\x1d!\x00", b"\x1d!\x11")
+# Feed past the tear bar, then a partial cut (ignored by printers without a cutter).
+ESC_POS_CUT = b"\x1bd\x04\x1dV\x01"
+
+
+@frappe.whitelist()
+def get_receipt(invoice, receipt_format="escpos", width=RECEIPT_WIDTH):
+	"""Render a POS Invoice receipt as ESC/POS commands (base64) or plain text.
+
+	Receipts are cached per invoice and `modified`, so printing again after
+	checkout, or reprinting later, reuses the first render until the invoice
+	changes.
+	"""
+	frappe.has_permission("POS Invoice", "print", invoice, throw=True)
+	if receipt_format not in RECEIPT_FORMATS:
+		frappe.throw(_("Receipt format must be one of {0}.").format(", ".join(RECEIPT_FORMATS)))
+	width = min(max(cint(width) or RECEIPT_WIDTH, 24), 64)
+
+	modified = frappe.db.get_value("POS Invoice", invoice, "modified")
+	cache_key = f"{RECEIPT_CACHE_KEY}:{invoice}:{modified}:{receipt_format}:{width}"
+	data = frappe.cache().get_value(cache_key)
+	cached = data is not None
+	started = time.perf_counter()
+	if not cached:
+		data = render_receipt(frappe.get_doc("POS Invoice", invoice), receipt_format, width)
+		frappe.cache().set_value(cache_key, data, expires_in_sec=RECEIPT_CACHE_TTL)
+
+	return {
+		"invoice": invoice,
+		"format": receipt_format,
+		"data": data,
+		"cached": cached,
+		"render_ms": round((time.perf_counter() - started) * 1000, 2),
+	}
+
+
+def render_receipt(doc, receipt_format="escpos", width=RECEIPT_WIDTH):
+	"""Return the receipt as base64 ESC/POS bytes or as plain text."""
+	lines = get_receipt_lines(doc, width)
+	if receipt_format == "text":
+		return "\n".join(get_receipt_text_line(line, width) for line in lines) + "\n"
+	return base64.b64encode(encode_escpos_receipt(lines, doc.name, width)).decode()
+
+
+def get_receipt_lines(doc, width):
+	"""Lay out a POS Invoice as (text, align, bold, large) receipt lines."""
+
+	def line(text="", align="left", bold=False, large=False):
+		return (receipt_text(text), align, int(bold), int(large))
+
+	def columns(left, right, bold=False):
+		right = receipt_text(right)[:width]
+		room = width - len(right)
+		return line(receipt_text(left)[: max(room - 1, 0)].ljust(room) + right, bold=bold)
+
+	def money(value):
+		return f"{flt(value):,.2f}"
+
+	rule = line("-" * width)
+	company_name = frappe.get_cached_value("Company", doc.company, "company_name") or doc.company
+	lines = [line(company_name[: width // 2], "center", bold=True, large=True)]
+	if doc.is_return:
+		lines.append(line(_("RETURN"), "center", bold=True))
+	lines += [
+		rule,
+		columns(_("Receipt"), doc.name),
+		columns(_("Date"), f"{doc.posting_date} {str(doc.posting_time or '')[:8]}"),
+		columns(_("Cashier"), (doc.owner or "").split("@")[0]),
+	]
+	if doc.customer and doc.customer != frappe.get_cached_value("POS Profile", doc.pos_profile, "customer"):
+		lines.append(columns(_("Customer"), doc.customer_name or doc.customer))
+	if doc.is_return and doc.return_against:
+		lines.append(columns(_("Against"), doc.return_against))
+	lines.append(rule)
+
+	for item in doc.items:
+		lines += [line(part) for part in textwrap.wrap(receipt_text(item.item_name or item.item_code), width)]
+		if flt(item.discount_percentage):
+			lines.append(line(f"  {money(item.price_list_rate)} less {flt(item.discount_percentage):g}%"))
+		lines.append(columns(f"  {flt(item.qty):g} {item.uom} x {money(item.rate)}", money(item.amount)))
+	lines.append(rule)
+
+	if flt(doc.discount_amount) or flt(doc.total_taxes_and_charges):
+		lines.append(columns(_("Subtotal"), money(doc.total)))
+	if flt(doc.discount_amount):
+		lines.append(columns(_("Discount"), money(-flt(doc.discount_amount))))
+	for tax in doc.get("taxes") or []:
+		if flt(tax.tax_amount):
+			lines.append(columns(tax.description or tax.account_head, money(tax.tax_amount)))
+	lines.append(columns(_("TOTAL"), money(doc.rounded_total or doc.grand_total), bold=True))
+
+	for payment in doc.get("payments") or []:
+		if flt(payment.amount):
+			lines.append(columns(payment.mode_of_payment, money(payment.amount)))
+	if flt(doc.change_amount):
+		lines.append(columns(_("Change"), money(doc.change_amount)))
+	if flt(doc.outstanding_amount) > 0:
+		lines.append(columns(_("Balance (Utang)"), money(doc.outstanding_amount), bold=True))
+		lines.append(columns(_("Due"), str(doc.due_date or "")))
+
+	lines += [line(), line(_("Thank you!"), "center")]
+	return lines
+
+
+def receipt_text(value):
+	"""Fold text to ASCII, which every ESC/POS code page prints the same way."""
+	value = unicodedata.normalize("NFKD", str(value or ""))
+	return "".join(char for char in value if not unicodedata.combining(char)).encode("ascii", "replace").decode()
+
+
+def get_receipt_text_line(line, width):
+	text, align, _bold, _large = line
+	if align == "center":
+		return text.center(width).rstrip()
+	if align == "right":
+		return text.rjust(width)
+	return text
+
+
+def encode_escpos_receipt(lines, barcode, width):
+	"""Encode receipt lines as ESC/POS, sending style commands only when the style changes."""
+	out = bytearray(ESC_POS_INIT)
+	style = (None, None, None)
+	for text, align, bold, large in lines:
+		if align != style[0]:
+			out += ESC_POS_ALIGN[align]
+		if bold != style[1]:
+			out += ESC_POS_BOLD[bold]
+		if large != style[2]:
+			out += ESC_POS_SIZE[large]
+		style = (align, bold, large)
+		out += text.encode("ascii") + b"\n"
+
+	out += get_escpos_barcode(barcode, width)
+	out += ESC_POS_CUT
+	return bytes(out)
+
+
+def get_escpos_barcode(data, width):
+	"""Code 128 (set B) of the invoice name, so the return dialog can scan the receipt.
+
+	Bars are two dots wide when the symbol fits the paper, else one.
+	"""
+	data = receipt_text(data).encode("ascii")
+	if not data or len(data) > 250:
+		return b""
+	modules = 11 * (len(data) + 3) + 2
+	module_width = 2 if modules * 2 <= width * RECEIPT_DOTS_PER_CHAR else 1
+	return (
+		ESC_POS_ALIGN["center"]
+		+ b"\x1dh\x50"  # 80 dots high
+		+ b"\x1dw" + bytes([module_width])
+		+ b"\x1dH\x02"  # human-readable text below
+		+ b"\x1dk\x49" + bytes([len(data) + 2]) + b"{B" + data
+		+ b"\n"
+	)
+
+
 # --- RECENT ORDERS & CLOSING ---
 
 
 @frappe.whitelist()
 def delete_held_sales(names):
 	"""Delete held sales by name, enforcing ownership to the current POS profile + cashier."""
+	mark_recent_write()
 	if not names:
 		return {"deleted": 0}
 
@@ -1183,6 +4462,11 @@ def delete_held_sales(names):
 		# Delete only the allowed/owned names
 		for name in allowed:
 			frappe.delete_doc("Mart POS Held Sale", name, ignore_permissions=True)
+		queue_pos_events(
+			profile,
+			[{"event_type": "held_sale_deleted", "reference": name} for name in allowed],
+			after_commit=True,
+		)
 
 
 
@@ -1197,6 +4481,7 @@ def delete_held_sales(names):
 @frappe.whitelist()
 def delete_all_held_sales():
 	"""Delete all held sales owned by the current POS profile + current cashier."""
+	mark_recent_write()
 	profile = get_assigned_pos_profile()
 	cashier = frappe.session.user
 
@@ -1216,6 +4501,11 @@ def delete_all_held_sales():
 	if rows:
 		for name in rows:
 			frappe.delete_doc("Mart POS Held Sale", name)
+		queue_pos_events(
+			profile,
+			[{"event_type": "held_sale_deleted", "reference": name} for name in rows],
+			after_commit=True,
+		)
 
 	frappe.db.commit()
 	return {"deleted": len(rows)}
@@ -1226,24 +4516,19 @@ def delete_all_held_sales():
 
 
 @frappe.whitelist()
+@replica_read
 def get_recent_invoices(opening_entry=None):
+	profile = get_assigned_pos_profile()
 	if not opening_entry or str(opening_entry).strip().strip("\"'[]").lower() in ("", "none", "null"):
-		profile = get_assigned_pos_profile()
-		opening_entry = frappe.db.get_value(
-			"POS Opening Entry",
-			{
-				"pos_profile": profile.name,
-				"user": frappe.session.user,
-				"status": "Open",
-				"docstatus": 1,
-			},
-			"name",
-		)
+		opening_entry = get_open_opening_entry(profile)
 
 	if not opening_entry:
 		return []
 
-	profile = get_assigned_pos_profile()
+	return get_shift_invoices(profile, opening_entry)
+
+
+def get_shift_invoices(profile, opening_entry):
 	opening_doc = frappe.get_doc("POS Opening Entry", opening_entry)
 
 	if (
@@ -1254,44 +4539,11 @@ def get_recent_invoices(opening_entry=None):
 		return []
 
 	period_end_date = now_datetime()
-	filters = {
-		"start": opening_doc.period_start_date,
-		"end": period_end_date,
-		"pos_profile": opening_doc.pos_profile,
-	}
-	owner_condition = ""
-	if opening_doc.user == frappe.session.user:
-		owner_condition = "AND owner = %(user)s"
-		filters["user"] = opening_doc.user
-
-	invoices = frappe.db.sql(
-		f"""
-		SELECT
-			name,
-			customer,
-			grand_total,
-			paid_amount,
-			outstanding_amount,
-			status,
-			posting_date,
-			posting_time,
-			is_return,
-			return_against,
-			owner,
-			pos_profile,
-			docstatus,
-			IFNULL(consolidated_invoice, '') AS consolidated_invoice
-		FROM `tabPOS Invoice`
-		WHERE docstatus = 1
-			AND pos_profile = %(pos_profile)s
-			AND IFNULL(consolidated_invoice, '') = ''
-			AND TIMESTAMP(posting_date, posting_time) BETWEEN %(start)s AND %(end)s
-			{owner_condition}
-		ORDER BY TIMESTAMP(posting_date, posting_time) DESC, creation DESC
-		LIMIT 20
-		""",
-		filters,
-		as_dict=1,
+	invoices = get_shift_invoice_rows(
+		opening_doc.pos_profile,
+		opening_doc.period_start_date,
+		period_end_date,
+		user=opening_doc.user if opening_doc.user == frappe.session.user else None,
 	)
 
 	frappe.logger("minimart_pos").debug(
@@ -1325,6 +4577,58 @@ def get_recent_invoices(opening_entry=None):
 	]
 
 
+def get_shift_invoice_rows(pos_profile, start, end, user=None, limit=20):
+	"""Return the latest unconsolidated POS Invoices of a profile posted between two datetimes.
+
+	The `posting_date` range lets MariaDB use the (pos_profile, posting_date,
+	posting_time, creation) index; the TIMESTAMP check then trims the edges.
+	"""
+	start, end = get_datetime(start), get_datetime(end)
+	filters = {
+		"start": start,
+		"end": end,
+		"start_date": start.date(),
+		"end_date": end.date(),
+		"pos_profile": pos_profile,
+		"limit": cint(limit),
+	}
+	owner_condition = ""
+	if user:
+		owner_condition = "AND owner = %(user)s"
+		filters["user"] = user
+
+	return frappe.db.sql(
+		f"""
+		SELECT
+			name,
+			customer,
+			grand_total,
+			paid_amount,
+			outstanding_amount,
+			status,
+			posting_date,
+			posting_time,
+			is_return,
+			return_against,
+			owner,
+			pos_profile,
+			docstatus,
+			IFNULL(consolidated_invoice, '') AS consolidated_invoice
+		FROM `tabPOS Invoice`
+		WHERE docstatus = 1
+			AND pos_profile = %(pos_profile)s
+			AND posting_date BETWEEN %(start_date)s AND %(end_date)s
+			AND TIMESTAMP(posting_date, posting_time) BETWEEN %(start)s AND %(end)s
+			AND IFNULL(consolidated_invoice, '') = ''
+			{owner_condition}
+		ORDER BY posting_date DESC, posting_time DESC, creation DESC
+		LIMIT %(limit)s
+		""",
+		filters,
+		as_dict=1,
+	)
+
+
 @frappe.whitelist()
 def get_recent_orders(opening_entry=None):
 	if not opening_entry or str(opening_entry).strip().strip("\"'[]").lower() in ("", "none", "null"):
@@ -1350,6 +4654,7 @@ def get_recent_orders(opening_entry=None):
 @frappe.whitelist()
 def close_pos_shift(opening_entry):
 	"""Create and submit a POS Closing Entry for an open shift."""
+	mark_recent_write()
 	opening_doc = frappe.get_doc("POS Opening Entry", opening_entry)
 	if opening_doc.status != "Open":
 		frappe.throw(_("Shift is already closed."))
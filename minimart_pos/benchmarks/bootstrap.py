@@ -0,0 +1,70 @@
+import time
+
+import frappe
+from frappe.utils import cint, flt
+
+from minimart_pos.api import bootstrap, check_pos_opening, get_products, get_recent_invoices
+
+
+def run(user=None, rtt_ms=150, repeat=10):
+	"""Compare the Mart POS page startup calls before and after `bootstrap`.
+
+	"before" replays what the page did before the endpoint existed: it called
+	`check_pos_opening` and then, in parallel, the Item Group list, a
+	200-product `get_products` and `get_recent_invoices`. The scan input was
+	usable once the products arrived, so time to first scan was two round
+	trips plus the server time of `check_pos_opening` and `get_products`.
+	"after" is one `bootstrap` round trip, first with no cached sections and
+	then with the ETags of the first response. `rtt_ms` is the round trip
+	added per sequential request; the default is a busy store Wi-Fi.
+
+	`user` must have an open POS shift. Run with
+	`bench --site <site> execute minimart_pos.benchmarks.bootstrap.run --kwargs "{'user': 'cashier@example.com'}"`.
+	"""
+	if user:
+		frappe.set_user(user)
+	repeat = max(cint(repeat), 1)
+	rtt_ms = flt(rtt_ms)
+	shift = check_pos_opening()
+	if not shift["opening_entry"]:
+		frappe.throw(f"{frappe.session.user} has no open POS shift")
+
+	def timed(fn):
+		started = time.perf_counter()
+		for _i in range(repeat):
+			result = fn()
+		return (time.perf_counter() - started) * 1000 / repeat, result
+
+	opening_ms, _shift = timed(check_pos_opening)
+	item_groups_ms, _groups = timed(
+		lambda: frappe.get_list("Item Group", filters={"is_group": 0}, fields=["name"], limit_page_length=100)
+	)
+	products_ms, _products = timed(
+		lambda: get_products(search_term="", limit_page_length=200, in_stock_only=True)
+	)
+	recent_ms, _invoices = timed(lambda: get_recent_invoices(shift["opening_entry"]))
+	# The page asks for MiniMartPOS.product_page_length products.
+	bootstrap_ms, response = timed(lambda: bootstrap(product_limit=60))
+	etags = {key: section["etag"] for key, section in response["sections"].items()}
+	cached_ms, _response = timed(lambda: bootstrap(etags=etags, product_limit=60))
+
+	before_ms = opening_ms + products_ms + 2 * rtt_ms
+	after_ms = bootstrap_ms + rtt_ms
+	return {
+		"user": frappe.session.user,
+		"rtt_ms": rtt_ms,
+		"before_requests": 4,
+		"before_server_ms": {
+			"check_pos_opening": round(opening_ms, 2),
+			"item_groups": round(item_groups_ms, 2),
+			"get_products": round(products_ms, 2),
+			"get_recent_invoices": round(recent_ms, 2),
+		},
+		"before_first_scan_ms": round(before_ms, 1),
+		"after_requests": 1,
+		"after_server_ms": round(bootstrap_ms, 2),
+		"after_cached_server_ms": round(cached_ms, 2),
+		"after_first_scan_ms": round(after_ms, 1),
+		"after_cached_first_scan_ms": round(cached_ms + rtt_ms, 1),
+		"speedup": round(before_ms / after_ms, 1) if after_ms else None,
+	}
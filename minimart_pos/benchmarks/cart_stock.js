@@ -0,0 +1,190 @@
+// Time a cart +/- press against the product grid, before and after cart
+// stock reservations were indexed by item code.
+//
+// Loads MiniMartPOS from the page script into a jsdom window, renders a
+// 500-card grid (one in ten cards a three-component bundle) and a 150-line
+// cart, then presses + on every line and - again. "before" re-sums the cart
+// for every card and repaints the whole grid on each press, as the page did;
+// "after" is the page as shipped. Only the stock sync is timed, not
+// render_cart(). Run from the app directory with
+//
+//   npm install --no-save jsdom jquery
+//   node minimart_pos/benchmarks/cart_stock.js [cards] [cart_lines] [rounds]
+
+const fs = require("fs");
+const path = require("path");
+const vm = require("vm");
+const { performance } = require("perf_hooks");
+const { JSDOM } = require("jsdom");
+
+const PAGE_SCRIPT = path.join(
+	__dirname,
+	"..",
+	"minimart_pos",
+	"page",
+	"martpos_page",
+	"martpos_page.js",
+);
+
+function load_pos_class(window) {
+	let $ = require("jquery")(window);
+	let context = vm.createContext({
+		window,
+		document: window.document,
+		$,
+		performance,
+		console,
+		flt: (value) => parseFloat(value) || 0,
+		__: (text) => text,
+		frappe: {
+			pages: { martpos_page: {} },
+			utils: { get_random: () => Math.random().toString(36).slice(2, 12) },
+		},
+	});
+	let source = fs.readFileSync(PAGE_SCRIPT, "utf8");
+	vm.runInContext(`${source}\n;this.MiniMartPOS = MiniMartPOS;`, context);
+	return context.MiniMartPOS;
+}
+
+function make_products(card_count) {
+	let products = [];
+	for (let n = 0; n < card_count; n++) {
+		if (n % 10 === 9) {
+			// Bundles draw on three of the plain items shown elsewhere in the grid.
+			products.push({
+				item_code: `BUNDLE-${n}`,
+				uom: "Nos",
+				is_product_bundle: 1,
+				conversion_factor: 1,
+				bundle_components: [1, 2, 3].map((offset) => ({
+					item_code: `ITEM-${(n * 7 + offset * 11) % card_count}`,
+					qty: offset,
+					available_qty: 100,
+				})),
+			});
+		} else {
+			products.push({
+				item_code: `ITEM-${n}`,
+				uom: "Nos",
+				conversion_factor: 1,
+				actual_qty: 50 + (n % 200),
+			});
+		}
+	}
+	return products;
+}
+
+function make_cart(products, line_count) {
+	let cart = [];
+	for (let n = 0; n < line_count; n++) {
+		let item = products[(n * 3) % products.length];
+		cart.push({
+			item_code: item.item_code,
+			uom: item.uom,
+			qty: 1 + (n % 4),
+			uoms: [{ uom: item.uom, conversion_factor: 1 }],
+			bundle_components: item.bundle_components || [],
+		});
+	}
+	return cart;
+}
+
+function make_pos(PosClass, window, products, cart_lines) {
+	let pos = Object.create(PosClass.prototype);
+	let grid = window.document.createElement("div");
+	window.document.body.replaceChildren(grid);
+
+	pos.set_products(products);
+	pos.rendered_cards = new Map();
+	pos.products.forEach((item) => {
+		let card = window.document.createElement("div");
+		card.className = "pos-item-card";
+		card.innerHTML = `<span class="stock-badge badge"></span>`;
+		card.pos_item = item;
+		grid.appendChild(card);
+		pos.rendered_cards.set(pos.get_product_key(item), card);
+	});
+	pos.set_cart(make_cart(products, cart_lines));
+	return { pos, grid };
+}
+
+function make_before_class(PosClass) {
+	return class extends PosClass {
+		get_reserved_stock_qty(item_code) {
+			let reserved = 0;
+			this.cart.forEach((cart_item) => {
+				let stock_units = this.get_cart_item_stock_units(cart_item);
+				if (cart_item.item_code === item_code) reserved += stock_units;
+				(cart_item.bundle_components || []).forEach((component) => {
+					if (component.item_code === item_code) {
+						reserved += stock_units * flt_value(component.qty);
+					}
+				});
+			});
+			return reserved;
+		}
+
+		sync_grid_stock() {
+			this.refresh_all_card_stock_displays();
+		}
+	};
+}
+
+function flt_value(value) {
+	return parseFloat(value) || 0;
+}
+
+function press_every_line(pos, rounds) {
+	let presses = 0;
+	let started = performance.now();
+	for (let round = 0; round < rounds; round++) {
+		[1, -1].forEach((delta) => {
+			pos.cart.forEach((item) => {
+				item.qty = flt_value(item.qty) + delta;
+				pos.sync_grid_stock(pos.reserve_cart_line(item));
+				presses++;
+			});
+		});
+	}
+	return { ms_per_press: (performance.now() - started) / presses, presses };
+}
+
+function badge_texts(grid) {
+	return Array.from(grid.querySelectorAll(".stock-badge"), (badge) => badge.textContent);
+}
+
+function run(card_count = 500, cart_lines = 150, rounds = 3) {
+	let { window } = new JSDOM("<!DOCTYPE html><body></body>");
+	let PosClass = load_pos_class(window);
+	let products = make_products(card_count);
+
+	let results = {};
+	let badges = {};
+	[
+		["before", make_before_class(PosClass)],
+		["after", PosClass],
+	].forEach(([label, cls]) => {
+		let { pos, grid } = make_pos(cls, window, products, cart_lines);
+		// One untimed round so both paths run warm.
+		press_every_line(pos, 1);
+		results[label] = press_every_line(pos, rounds);
+		badges[label] = badge_texts(grid);
+	});
+
+	return {
+		cards: card_count,
+		cart_lines,
+		presses: results.after.presses,
+		before_ms_per_press: +results.before.ms_per_press.toFixed(3),
+		after_ms_per_press: +results.after.ms_per_press.toFixed(3),
+		speedup: +(results.before.ms_per_press / results.after.ms_per_press).toFixed(1),
+		badges_match: badges.before.join() === badges.after.join(),
+	};
+}
+
+module.exports = { run };
+
+if (require.main === module) {
+	let [cards, lines, rounds] = process.argv.slice(2).map(Number);
+	console.log(JSON.stringify(run(cards || 500, lines || 150, rounds || 3), null, 2));
+}
@@ -0,0 +1,92 @@
+import time
+
+import frappe
+from frappe.utils import cint, now_datetime
+
+from minimart_pos.api import get_catalog_page
+
+PRICE_LIST = "_Bench Catalog Price List"
+
+
+def run(item_count=50000, page_length=60, deep_page=200, repeat=5):
+	"""Time the first and a deep catalog page in name order and in search order, then roll back.
+
+	Seeds `item_count` priced Items, follows `get_catalog_page` cursors out to
+	`deep_page`, and times fetching page 1 and page `deep_page` again from
+	their cursors. Keyset paging should keep the two close. Run with
+	`bench --site <site> execute minimart_pos.benchmarks.catalog_pages.run`.
+	"""
+	item_count = cint(item_count)
+	page_length = cint(page_length) or 60
+	deep_page = max(min(cint(deep_page), item_count // page_length), 1)
+	repeat = max(cint(repeat), 1)
+	seed_catalog(item_count)
+	profile = frappe._dict(name=None, warehouse=None, selling_price_list=PRICE_LIST)
+
+	def timed(filters):
+		# Follow the cursors up to the one that leads to the deep page.
+		deep_cursor = None
+		for _page in range(deep_page - 1):
+			_rows, deep_cursor = get_catalog_page(profile, page_length, cursor=deep_cursor, **filters)
+
+		timings = {}
+		for label, page_cursor in (("first_page_ms", None), ("deep_page_ms", deep_cursor)):
+			started = time.perf_counter()
+			for _i in range(repeat):
+				rows, _next_cursor = get_catalog_page(profile, page_length, cursor=page_cursor, **filters)
+			timings[label] = round((time.perf_counter() - started) * 1000 / repeat, 2)
+			timings[label.replace("_ms", "_rows")] = len(rows)
+		timings["deep_to_first"] = (
+			round(timings["deep_page_ms"] / timings["first_page_ms"], 2) if timings["first_page_ms"] else None
+		)
+		return timings
+
+	try:
+		result = {
+			"items": item_count,
+			"page_length": page_length,
+			"deep_page": deep_page,
+			"name_order": timed({"in_stock_only": False}),
+			"search_order": timed({"in_stock_only": False, "search_term": "bench item"}),
+		}
+	finally:
+		frappe.db.rollback()
+	return result
+
+
+def seed_catalog(item_count):
+	"""Bulk insert stock Items with one selling price each.
+
+	Every item name matches the search term. One in ten item codes does too,
+	so the search rank sort key has more than one value.
+	"""
+	now = now_datetime()
+	codes = [f"BENCH ITEM {n:06d}" if n % 10 == 0 else f"BENCH-{n:06d}" for n in range(item_count)]
+	frappe.db.bulk_insert(
+		"Item",
+		[
+			"name",
+			"item_code",
+			"item_name",
+			"item_group",
+			"stock_uom",
+			"is_stock_item",
+			"is_sales_item",
+			"has_variants",
+			"disabled",
+			"creation",
+			"modified",
+		],
+		[
+			(code, code, f"Bench Item {n:06d}", "All Item Groups", "Nos", 1, 1, 0, 0, now, now)
+			for n, code in enumerate(codes)
+		],
+	)
+	frappe.db.bulk_insert(
+		"Item Price",
+		["name", "item_code", "price_list", "uom", "price_list_rate", "selling", "creation", "modified"],
+		[
+			(f"{code}-price", code, PRICE_LIST, "Nos", 10 + n % 90, 1, now, now)
+			for n, code in enumerate(codes)
+		],
+	)
@@ -0,0 +1,28 @@
+import time
+
+from frappe.utils import cint
+
+from minimart_pos.api import render_shelf_label
+
+
+def run(count=1000, repeat=3):
+	"""Time rendering `count` labels (barcode encoding and HTML), without the database.
+
+	`bench --site <site> execute minimart_pos.benchmarks.label_sheet.run --kwargs "{'count': 5000}"`
+	"""
+	rows = [
+		(f"ITEM-{i:05d}", f"Sample item {i}", "Nos", f"PHP {i % 500}.00", f"48000{i:08d}")
+		for i in range(cint(count))
+	]
+	timings = []
+	for _run in range(cint(repeat)):
+		started = time.perf_counter()
+		size = sum(len(render_shelf_label(row)) for row in rows)
+		timings.append(time.perf_counter() - started)
+	best = min(timings)
+	return {
+		"labels": len(rows),
+		"best_seconds": round(best, 4),
+		"seconds_per_1000": round(best * 1000 / max(len(rows), 1), 4),
+		"html_bytes": size,
+	}
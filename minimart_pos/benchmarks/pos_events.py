@@ -0,0 +1,46 @@
+import time
+
+import frappe
+from frappe.utils import cint, now_datetime
+
+from minimart_pos.api import insert_pos_events
+
+
+def run(count=10000, batch_size=500):
+	"""Time journal inserts in `batch_size` batches, then roll them back.
+
+	Run with `bench --site <site> execute minimart_pos.benchmarks.pos_events.run`.
+	"""
+	count = cint(count)
+	batch_size = cint(batch_size) or 500
+	now = now_datetime()
+	rows = [
+		{
+			"event_time": now,
+			"event_type": "scan",
+			"pos_profile": None,
+			"pos_opening_entry": None,
+			"cashier": "Administrator",
+			"item_code": f"ITEM-{position % 5000:05d}",
+			"uom": "Nos",
+			"qty": 1,
+			"amount": 10,
+			"reference": None,
+			"details": None,
+		}
+		for position in range(count)
+	]
+
+	started = time.perf_counter()
+	for start in range(0, count, batch_size):
+		insert_pos_events(rows[start : start + batch_size])
+	elapsed = time.perf_counter() - started
+	frappe.db.rollback()
+
+	result = {
+		"events": count,
+		"batch_size": batch_size,
+		"seconds": round(elapsed, 3),
+		"events_per_second": round(count / elapsed) if elapsed else None,
+	}
+	return result
@@ -0,0 +1,42 @@
+import base64
+import time
+
+import frappe
+from frappe.utils import cint
+
+from minimart_pos.api import render_receipt
+
+
+def run(invoice=None, repeat=20):
+	"""Compare rendering a receipt here with rendering the POS Invoice print view.
+
+	Times `render_receipt` (ESC/POS, uncached) and `frappe.get_print`, which
+	renders the same print format HTML that `/printview` serves, on one
+	invoice. The browser's own layout and print dialog come on top of the
+	print view time. Run with
+	`bench --site <site> execute minimart_pos.benchmarks.receipt.run`.
+	"""
+	invoice = invoice or frappe.db.get_value(
+		"POS Invoice", {"docstatus": 1}, "name", order_by="creation desc"
+	)
+	repeat = max(cint(repeat), 1)
+	doc = frappe.get_doc("POS Invoice", invoice)
+
+	def timed(fn):
+		started = time.perf_counter()
+		for _i in range(repeat):
+			result = fn()
+		return (time.perf_counter() - started) * 1000 / repeat, len(result)
+
+	escpos_ms, escpos_size = timed(lambda: base64.b64decode(render_receipt(doc, "escpos")))
+	printview_ms, printview_size = timed(lambda: frappe.get_print("POS Invoice", invoice, doc=doc))
+	result = {
+		"invoice": invoice,
+		"items": len(doc.items),
+		"escpos_ms": round(escpos_ms, 2),
+		"escpos_bytes": escpos_size,
+		"printview_ms": round(printview_ms, 2),
+		"printview_bytes": printview_size,
+		"speedup": round(printview_ms / escpos_ms, 1) if escpos_ms else None,
+	}
+	return result
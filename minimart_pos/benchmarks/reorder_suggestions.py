@@ -0,0 +1,54 @@
+import time
+
+import numpy as np
+from frappe.utils import cint
+
+from minimart_pos.api import build_reorder_suggestions
+
+
+def run(item_count=50000, bundle_count=2000, repeat=5):
+	"""Time `build_reorder_suggestions` on a synthetic catalog.
+
+	Run with `bench --site <site> execute minimart_pos.benchmarks.reorder_suggestions.run`.
+	"""
+	item_count = cint(item_count)
+	bundle_count = cint(bundle_count)
+	rng = np.random.default_rng(7)
+	items = [
+		(f"ITEM-{position:06d}", f"Item {position}", "Nos", float(stock), float(ordered))
+		for position, stock, ordered in zip(
+			range(item_count),
+			rng.integers(0, 200, item_count),
+			rng.integers(0, 20, item_count),
+			strict=True,
+		)
+	]
+	sold_items = rng.choice(item_count, size=item_count // 2, replace=False)
+	sales = [
+		(items[position][0], float(qty))
+		for position, qty in zip(sold_items, rng.integers(1, 500, len(sold_items)), strict=True)
+	]
+	sales += [(f"BUNDLE-{bundle:05d}", float(rng.integers(1, 50))) for bundle in range(bundle_count)]
+	bundle_links = [
+		(f"BUNDLE-{bundle:05d}", items[position][0], float(rng.integers(1, 4)))
+		for bundle in range(bundle_count)
+		for position in rng.integers(0, item_count, 3)
+	]
+
+	timings = []
+	for _run in range(cint(repeat) or 1):
+		started = time.perf_counter()
+		suggestions = build_reorder_suggestions(
+			items, sales, bundle_links, lookback_days=30, lead_time_days=3, cover_days=7
+		)
+		timings.append(time.perf_counter() - started)
+
+	timings.sort()
+	result = {
+		"items": item_count,
+		"bundle_links": len(bundle_links),
+		"suggestions": len(suggestions),
+		"best_seconds": round(timings[0], 4),
+		"median_seconds": round(timings[len(timings) // 2], 4),
+	}
+	return result
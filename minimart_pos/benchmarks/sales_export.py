@@ -0,0 +1,55 @@
+import resource
+import time
+
+from frappe.utils import cint
+
+from minimart_pos.api import SALES_EXPORT_COLUMNS, get_export_connection_settings, iter_sales_export
+
+
+def run(rows=1_000_000, export_format="csv"):
+	"""Time the export path on `rows` synthetic lines generated by MariaDB.
+
+	The lines come from a recursive CTE shaped like the export query, so
+	nothing is written to the site. They go through the same unbuffered
+	connection, driver decoding and encoding as a real export. Reports
+	rows per second, bytes written and how much the process's peak memory
+	grew while streaming. Run with
+	`bench --site <site> execute minimart_pos.benchmarks.sales_export.run`.
+	"""
+	rows = cint(rows)
+	query = """
+		WITH RECURSIVE seq (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %(rows)s)
+		SELECT
+			CONCAT('ACC-PSINV-2026-', LPAD(n DIV 4, 7, '0')), CURDATE(), CAST('12:30:15' AS TIME),
+			'Mart Company', 'Mart POS', 'POS-OPE-2026-00001', 'cashier@example.com', 'Guest',
+			0, NULL, CAST(n MOD 997 AS DECIMAL(21, 9)), 'Cash',
+			n MOD 4 + 1, CONCAT('ITEM-', LPAD(n MOD 5000, 5, '0')), CONCAT('Item ', n MOD 5000),
+			'Products', 'Stores - MC', 'Nos', CAST(1 + n MOD 3 AS DECIMAL(21, 9)), CAST(1 AS DECIMAL(21, 9)),
+			CAST(1 + n MOD 3 AS DECIMAL(21, 9)), CAST(25.5 AS DECIMAL(21, 9)), CAST(0 AS DECIMAL(21, 9)),
+			CAST(0 AS DECIMAL(21, 9)), CAST(25.5 AS DECIMAL(21, 9)), CAST(25.5 * (1 + n MOD 3) AS DECIMAL(21, 9)),
+			CAST(25.5 * (1 + n MOD 3) AS DECIMAL(21, 9))
+		FROM seq
+	"""
+	columns = [column for column, sql in SALES_EXPORT_COLUMNS]
+	settings = get_export_connection_settings()
+	# The CTE recurses once per row, past the server's default limit.
+	settings["init_command"] = f"SET SESSION max_recursive_iterations = {rows + 1}"
+
+	peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	started = time.perf_counter()
+	written = 0
+	for chunk in iter_sales_export(settings, query, {"rows": rows}, columns, export_format):
+		written += len(chunk)
+	elapsed = time.perf_counter() - started
+	peak_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak_before
+
+	result = {
+		"rows": rows,
+		"format": export_format,
+		"seconds": round(elapsed, 2),
+		"rows_per_second": round(rows / elapsed) if elapsed else None,
+		"megabytes": round(written / 1024 / 1024, 1),
+		# ru_maxrss is in kilobytes on Linux.
+		"peak_memory_growth_mb": round(peak_growth / 1024, 1),
+	}
+	return result
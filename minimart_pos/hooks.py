@@ -83,7 +83,8 @@ app_license = "mit"
 # ------------
 
 # before_install = "minimart_pos.install.before_install"
-# after_install = "minimart_pos.install.after_install"
+after_install = "minimart_pos.install.after_install"
+after_migrate = ["minimart_pos.api.ensure_hot_path_indexes", "minimart_pos.api.enqueue_pos_warm_up"]
 
 # Uninstallation
 # ------------
@@ -145,9 +146,68 @@ app_license = "mit"
 # 	}
 # }
 
+doc_events = {
+	"Item": {
+		"on_update": "minimart_pos.api.on_item_update",
+	},
+	"Item Group": {
+		"on_update": "minimart_pos.api.clear_item_group_tree_cache",
+		"on_trash": "minimart_pos.api.clear_item_group_tree_cache",
+		"after_rename": "minimart_pos.api.clear_item_group_tree_cache",
+	},
+	"Stock Ledger Entry": {
+		"on_submit": "minimart_pos.api.on_stock_ledger_entry_submit",
+	},
+	"Product Bundle": {
+		"on_update": "minimart_pos.api.on_product_bundle_change",
+		"on_trash": "minimart_pos.api.on_product_bundle_change",
+	},
+	"POS Invoice": {
+		"on_submit": [
+			"minimart_pos.api.on_customer_ledger_change",
+			"minimart_pos.api.on_pos_invoice_submit",
+			"minimart_pos.api.update_returned_qty",
+		],
+		"on_cancel": [
+			"minimart_pos.api.on_customer_ledger_change",
+			"minimart_pos.api.on_pos_invoice_cancel",
+			"minimart_pos.api.update_returned_qty",
+		],
+	},
+	"POS Invoice Merge Log": {
+		"on_submit": "minimart_pos.api.on_pos_invoice_merge_log_submit",
+		"on_cancel": "minimart_pos.api.on_pos_invoice_merge_log_cancel",
+	},
+	"Sales Invoice": {
+		"on_submit": "minimart_pos.api.on_customer_ledger_change",
+		"on_cancel": "minimart_pos.api.on_customer_ledger_change",
+	},
+	"Payment Entry": {
+		"on_submit": "minimart_pos.api.on_customer_ledger_change",
+		"on_cancel": "minimart_pos.api.on_customer_ledger_change",
+	},
+	"Customer": {
+		"on_update": "minimart_pos.api.on_customer_update",
+		"on_trash": "minimart_pos.api.update_customer_index",
+		"after_rename": "minimart_pos.api.clear_customer_index",
+	},
+}
+
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+	"all": [
+		"minimart_pos.api.update_item_sales_rollup",
+		"minimart_pos.api.warm_up_pos_caches_if_cold",
+	],
+	"daily": [
+		"minimart_pos.api.reconcile_credit_exposure",
+		"minimart_pos.api.rebuild_in_stock_items",
+		"minimart_pos.api.daily_verify_pending_pos_qty",
+	],
+}
+
 # scheduler_events = {
 # 	"all": [
 # 		"minimart_pos.tasks.all"
@@ -199,6 +259,8 @@ app_license = "mit"
 # before_request = ["minimart_pos.utils.before_request"]
 # after_request = ["minimart_pos.utils.after_request"]
 
+before_request = ["minimart_pos.api.warm_up_pos_caches_on_boot"]
+
 # Job Events
 # ----------
 # before_job = ["minimart_pos.utils.before_job"]
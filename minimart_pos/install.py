@@ -0,0 +1,18 @@
+from minimart_pos.api import (
+	ensure_hot_path_indexes,
+	rebuild_in_stock_items,
+	rebuild_pending_pos_qty,
+	rebuild_returned_qty,
+)
+
+
+def after_install():
+	"""Do what the v1_0 patches do on migrate; patches are not run on install.
+
+	The app is usually installed on a site that already has stock, so the
+	side tables are filled here instead of starting empty.
+	"""
+	ensure_hot_path_indexes()
+	rebuild_in_stock_items()
+	rebuild_pending_pos_qty()
+	rebuild_returned_qty()
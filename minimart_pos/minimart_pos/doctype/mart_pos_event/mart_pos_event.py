@@ -0,0 +1,11 @@
+import frappe
+from frappe.model.document import Document
+
+
+class MartPOSEvent(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Mart POS Event", ["pos_opening_entry", "event_time"])
+	frappe.db.add_index("Mart POS Event", ["cashier", "event_time"])
@@ -0,0 +1,10 @@
+import frappe
+from frappe.model.document import Document
+
+
+class MartPOSInStockItem(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Mart POS In Stock Item", ["warehouse", "item_code"])
@@ -0,0 +1,10 @@
+import frappe
+from frappe.model.document import Document
+
+
+class MartPOSItemSalesDaily(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Mart POS Item Sales Daily", ["warehouse", "sales_date", "item_code"])
@@ -0,0 +1,10 @@
+import frappe
+from frappe.model.document import Document
+
+
+class MartPOSPendingQty(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Mart POS Pending Qty", ["item_code", "warehouse"])
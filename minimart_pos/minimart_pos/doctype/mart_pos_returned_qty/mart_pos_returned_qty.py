@@ -0,0 +1,10 @@
+import frappe
+from frappe.model.document import Document
+
+
+class MartPOSReturnedQty(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Mart POS Returned Qty", ["pos_invoice"])
@@ -0,0 +1,10 @@
+import frappe
+from frappe.model.document import Document
+
+
+class MartPOSStockCount(Document):
+	def before_insert(self):
+		if not self.counted_by:
+			self.counted_by = frappe.session.user
+		if not self.status:
+			self.status = "Draft"
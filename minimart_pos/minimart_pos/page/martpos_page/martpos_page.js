@@ -1,23 +1,100 @@
 frappe.pages["martpos_page"].on_page_load = function (wrapper) {
+	const page_load_started = performance.now();
 	let page = frappe.ui.make_app_page({
 		parent: wrapper,
 		title: "Mart POS",
 		single_column: true,
 	});
 
-	// Initial Shift Check
-	frappe.call({
-		method: "minimart_pos.api.check_pos_opening",
-		callback: function (r) {
-			if (!r.message.opening_entry) {
-				show_opening_dialog(r.message);
-			} else {
-				render_pos_ui(page, r.message);
-			}
-		},
+	// Initial Shift Check, together with everything the page needs to start.
+	load_pos_bootstrap().then((boot) => {
+		if (!boot) return;
+		if (!boot.shift.opening_entry) {
+			show_opening_dialog(boot.shift);
+		} else {
+			render_pos_ui(page, boot.shift, boot, page_load_started);
+		}
 	});
 };
 
+function load_pos_bootstrap() {
+	// Sections are cached with their ETag; the server only resends changed ones.
+	const cache_key = `minimart_pos_bootstrap:${frappe.session.user}`;
+	let cached = {};
+	try {
+		cached = JSON.parse(localStorage.getItem(cache_key) || "{}");
+	} catch (e) {
+		cached = {};
+	}
+
+	let etags = {};
+	Object.keys(cached).forEach((key) => {
+		etags[key] = cached[key].etag;
+	});
+
+	return new Promise((resolve) => {
+		frappe.call({
+			method: "minimart_pos.api.bootstrap",
+			args: {
+				etags: JSON.stringify(etags),
+				product_limit: MiniMartPOS.product_page_length,
+			},
+			callback: (r) => {
+				let sections = (r.message && r.message.sections) || {};
+				let boot = {};
+				let next_cache = {};
+				Object.keys(sections).forEach((key) => {
+					let section = sections[key];
+					let entry =
+						section.not_modified && cached[key]
+							? cached[key]
+							: { etag: section.etag, data: section.data };
+					boot[key] = entry.data;
+					next_cache[key] = entry;
+				});
+
+				try {
+					localStorage.setItem(cache_key, JSON.stringify(next_cache));
+				} catch (e) {
+					// Storage full or disabled; the next load just fetches everything.
+				}
+
+				if (boot.shift && boot.payment_modes) {
+					boot.shift.payment_methods = boot.payment_modes.map((row) => row.mode_of_payment);
+				}
+				resolve(boot.shift ? boot : null);
+			},
+			error: () => resolve(null),
+		});
+	});
+}
+
+function decode_compact_payload(payload) {
+	// Reverses minimart_pos.api.make_compact_response(); other payloads pass through.
+	if (!payload || !payload.compact) return payload;
+
+	const decode_table = (table) => {
+		let rows = Array.from({ length: table.length }, () => ({}));
+		Object.keys(table.columns).forEach((key) => {
+			let column = table.columns[key];
+			let values = Array.isArray(column)
+				? column
+				: column.d
+					? column.d.map((ref) => payload.strings[ref])
+					: column.n.map((nested) =>
+							nested && !Array.isArray(nested) ? decode_table(nested) : nested,
+						);
+			rows.forEach((row, index) => {
+				row[key] = values[index];
+			});
+		});
+		return rows;
+	};
+
+	let rows = decode_table(payload.table);
+	return payload.single ? rows[0] || null : rows;
+}
+
 function show_opening_dialog(shift_data) {
 	let profile = shift_data.pos_profile;
 	let d_fields = [];
@@ -88,25 +165,147 @@ function show_opening_dialog(shift_data) {
 	d.show();
 }
 
-function render_pos_ui(page, shift_data) {
+function render_pos_ui(page, shift_data, boot = null, page_load_started = null) {
 	$(frappe.render_template("martpos_page", {})).appendTo(page.main);
-	window.pos_instance = new MiniMartPOS(page, shift_data);
-	window.pos_instance.init();
+	window.pos_instance = new MiniMartPOS(page, shift_data, boot);
 
 	page.set_primary_action(__("Open Drawer"), () => window.pos_instance.trigger_cash_drawer());
 
 	page.add_inner_button(__("Hold Sale"), () => window.pos_instance.hold_sale());
-	page.add_inner_button(__("Held Sales"), () => window.pos_instance.show_held_sales());
+	window.pos_instance.$held_sales_btn = page.add_inner_button(__("Held Sales"), () =>
+		window.pos_instance.show_held_sales(),
+	);
+	page.add_inner_button(__("Shelf Labels"), () => window.pos_instance.print_shelf_labels());
+	page.add_inner_button(__("Stock Count"), () => window.pos_instance.start_stock_count());
+	page.add_inner_button(__("Return Sale"), () => window.pos_instance.prompt_return_sale());
 	page.add_inner_button(__("Close Shift"), () => window.pos_instance.close_shift());
+
+	window.pos_instance.init();
+	if (page_load_started !== null) {
+		window.pos_instance.log_time_to_first_scan(page_load_started);
+	}
+}
+
+class MartPOSCustomerPicker {
+	// Customer search backed by minimart_pos.api.search_customers. Keeps the
+	// get_value()/set_value() interface of the Link control it replaces and
+	// remembers the picked customer's credit figures.
+	static credit_details_ttl = 60 * 1000;
+
+	constructor($parent, { placeholder, onchange }) {
+		this.value = "";
+		this.details = null;
+		this.onchange = onchange;
+		this.results = new Map();
+		this.search_timer = null;
+		this.request_seq = 0;
+
+		this.$input = $(`<input type="text" class="form-control" autocomplete="off">`)
+			.attr("placeholder", placeholder)
+			.appendTo($parent);
+		this.awesomplete = new Awesomplete(this.$input[0], {
+			minChars: 0,
+			maxItems: 50,
+			autoFirst: true,
+			list: [],
+			filter: () => true,
+			sort: false,
+			item: (suggestion) => {
+				let li = document.createElement("li");
+				li.innerHTML = suggestion.label;
+				return li;
+			},
+		});
+
+		this.$input.on("input", () => this.schedule_search());
+		this.$input.on("focus", () => {
+			this.$input.select();
+			this.schedule_search();
+		});
+		this.$input.on("awesomplete-selectcomplete", (e) => {
+			let row = this.results.get(e.originalEvent.text.value);
+			if (row) this.set_value(row.name, row);
+		});
+		this.$input.on("blur", () => {
+			// Typed text that was not picked from the list is discarded.
+			setTimeout(() => this.$input.val(this.value), 200);
+		});
+	}
+
+	get_value() {
+		return this.value;
+	}
+
+	set_value(value, details = null) {
+		let changed = (value || "") !== this.value;
+		this.value = value || "";
+		this.details =
+			details && details.name === this.value ? { ...details, fetched_at: Date.now() } : null;
+		this.$input.val(this.value);
+		if (changed && this.onchange) this.onchange();
+		return Promise.resolve();
+	}
+
+	get_credit_details(customer) {
+		let details = this.details;
+		if (!details || details.name !== customer) return null;
+		if (Date.now() - details.fetched_at > MartPOSCustomerPicker.credit_details_ttl) return null;
+		return details;
+	}
+
+	schedule_search() {
+		clearTimeout(this.search_timer);
+		this.search_timer = setTimeout(() => this.search(this.$input.val()), 150);
+	}
+
+	search(query) {
+		let request_seq = ++this.request_seq;
+		frappe.call({
+			method: "minimart_pos.api.search_customers",
+			args: { query: query || "" },
+			callback: (r) => {
+				if (request_seq !== this.request_seq) return;
+				let rows = r.message || [];
+				this.results = new Map(rows.map((row) => [row.name, row]));
+				this.awesomplete.list = rows.map((row) => ({
+					label: this.get_result_label(row),
+					value: row.name,
+				}));
+				if (document.activeElement === this.$input[0]) this.awesomplete.evaluate();
+			},
+		});
+	}
+
+	get_result_label(row) {
+		let escape = frappe.utils.escape_html;
+		let title = escape(row.customer_name || row.name);
+		let meta = [row.name !== row.customer_name ? escape(row.name) : null, escape(row.mobile_no || "")]
+			.filter(Boolean)
+			.join(" · ");
+		let credit = flt(row.current_outstanding)
+			? `${__("Utang")}: ₱${flt(row.current_outstanding).toFixed(2)}`
+			: "";
+		return `<strong>${title}</strong>${row.recent ? ` <span class="text-muted">${__("Recent")}</span>` : ""}
+			<br><small class="text-muted">${[meta, credit].filter(Boolean).join(" · ")}</small>`;
+	}
 }
 
 class MiniMartPOS {
-	constructor(page, shift_data) {
+	static product_page_length = 60;
+	static stock_count_autosave_interval = 20 * 1000;
+	static stock_count_autosave_scans = 500;
+
+	constructor(page, shift_data, boot = null) {
 		this.page = page;
 		this.shift_data = shift_data;
+		this.boot = boot || {};
+		this.held_sale_count = 0;
 		this.cart = [];
 		this.customer_control = null;
 		this.serialPort = null;
+		this.serial_queue = Promise.resolve();
+		// Characters per line of the receipt printer: 32 on 58 mm paper, 48 on 80 mm.
+		this.receipt_width = cint(localStorage.getItem("mart_pos_receipt_width")) || 32;
 		this.active_held_sale_name = null;
 		// keep track of the currently open payment dialog wrapper
 		this.$payment_wrapper = null;
@@ -114,6 +313,7 @@ class MiniMartPOS {
 		// Modal State
 		this.current_payment_total = 0;
 		this.current_utang_allowed = false;
+		this.checkout_quote = null;
 
 		// Selectors
 		this.$scan_input = $("#barcode-scan");
@@ -123,19 +323,141 @@ class MiniMartPOS {
 		this.$product_grid = $("#product-grid");
 		this.$recent_orders_list = $("#recent-orders-list");
 		this.$clear_cart_btn = $("#clear-cart-btn");
-		this.product_result_limit = 20;
+		this.product_result_limit = MiniMartPOS.product_page_length;
 		this.product_search_timer = null;
+
+		// Product grid state. Cards are windowed: only the visible rows get DOM
+		// nodes, and card data lives in product_map keyed by item_code/uom.
+		this.products = [];
+		this.product_map = new Map();
+		this.base_stock_by_item = new Map();
+		this.product_keys_by_stock_item = new Map();
+		this.rendered_cards = new Map();
+		this.product_row_height = 0;
+		this.product_grid_padding = { top: 0, bottom: 0 };
+		this.product_overscan_rows = 3;
+		this.product_window_frame = null;
+
+		// The catalog is paged by cursor; the next page is fetched when the
+		// window nears the end of the loaded products. Best sellers come first.
+		this.product_query = {
+			search_term: "",
+			item_group: "",
+			in_stock_only: true,
+			order_by: "velocity",
+		};
+		this.product_next_cursor = null;
+		this.product_request_seq = 0;
+		this.product_page_loading = false;
+
+		// Stock reserved by the cart, keyed by stock item_code. Each cart line's
+		// last applied contribution is kept so changes are applied as deltas.
+		this.reserved_stock = new Map();
+		this.line_reservations = new WeakMap();
+
+		// Cart rows are keyed by line_id and patched in place; the total is
+		// kept as a running sum of the rendered line totals.
+		this.cart_rows = new Map();
+		this.cart_row_signatures = new Map();
+		this.cart_line_totals = new Map();
+		this.cart_total = 0;
+
+		// Scans are requested as soon as they are read but added to the cart
+		// strictly in scan order.
+		this.scan_queue = [];
+		this.scan_draining = false;
+		this.scan_cache = new Map();
+		this.scan_cache_ttl = 60 * 1000;
+		this.last_product_search = "";
+
+		// Audit events are buffered here and sent in batches by flush_events().
+		this.event_buffer = [];
+		this.event_flush_interval = 15 * 1000;
+		this.event_flush_size = 50;
+
+		// Stock-take mode: scans are tallied here instead of going to the cart.
+		this.stock_count = null;
+		this.stock_count_timer = null;
+		this.stock_count_frame = null;
 	}
 
 	init() {
 		this.setup_customer_control();
 		this.bind_events();
-		this.load_item_groups();
-		this.load_products("", true);
-		this.load_recent_orders();
+		setInterval(() => this.flush_events(), this.event_flush_interval);
+		window.addEventListener("pagehide", () => {
+			this.flush_events(true);
+			this.save_stock_count_on_unload();
+		});
+
+		// Sections already delivered by the bootstrap call are rendered directly.
+		let boot = this.boot;
+		if (boot.item_groups) this.render_item_groups(boot.item_groups);
+		else this.load_item_groups();
+		if (boot.product_page) {
+			this.product_next_cursor = boot.product_page.next_cursor;
+			this.render_products(boot.product_page.products);
+		} else {
+			this.load_products("", true);
+		}
+		if (boot.recent_invoices) this.render_recent_orders(boot.recent_invoices);
+		else this.load_recent_orders();
+		this.set_held_sale_count(boot.held_sale_count || 0);
 		this.focus_input();
 	}
 
+	log_time_to_first_scan(page_load_started) {
+		// The scan input is usable once init() has rendered the first product page.
+		this.startup_timings = {
+			time_to_first_scan_ms: Math.round(performance.now() - page_load_started),
+		};
+		console.info("Mart POS time to first scan (ms):", this.startup_timings.time_to_first_scan_ms);
+	}
+
+	log_event(event_type, data = {}) {
+		this.event_buffer.push({
+			event_type: event_type,
+			event_time: frappe.datetime.now_datetime(),
+			...data,
+		});
+		if (this.event_buffer.length >= this.event_flush_size) this.flush_events();
+	}
+
+	flush_events(on_unload = false) {
+		if (!this.event_buffer.length) return;
+		let events = this.event_buffer;
+		this.event_buffer = [];
+
+		if (on_unload && navigator.sendBeacon) {
+			// The page is going away; a beacon survives the unload, frappe.call does not.
+			let form = new FormData();
+			form.append("events", JSON.stringify(events));
+			form.append("csrf_token", frappe.csrf_token);
+			navigator.sendBeacon("/api/method/minimart_pos.api.log_pos_events", form);
+			return;
+		}
+
+		frappe.call({
+			method: "minimart_pos.api.log_pos_events",
+			args: { events: JSON.stringify(events) },
+			error: () => {
+				// Keep the events for the next flush, but never grow without bound.
+				this.event_buffer = events.concat(this.event_buffer).slice(-1000);
+			},
+		});
+	}
+
+	set_held_sale_count(count) {
+		this.held_sale_count = Math.max(0, cint(count));
+		if (this.$held_sales_btn) {
+			this.$held_sales_btn.text(
+				this.held_sale_count
+					? `${__("Held Sales")} (${this.held_sale_count})`
+					: __("Held Sales"),
+			);
+		}
+	}
+
 	setup_customer_control() {
 		let me = this;
 		let cust_container = $("#customer-search-container");
@@ -146,15 +468,9 @@ class MiniMartPOS {
                 <button class="btn btn-sm btn-outline-secondary" id="set-guest-btn" style="height:38px;">Guest</button>
             </div>`).appendTo(cust_container);
 
-			this.customer_control = frappe.ui.form.make_control({
-				df: {
-					fieldtype: "Link",
-					options: "Customer",
-					placeholder: "Search Customer...",
-					onchange: () => me.focus_input(),
-				},
-				parent: $wrapper.find("#customer-link-field"),
-				render_input: true,
+			this.customer_control = new MartPOSCustomerPicker($wrapper.find("#customer-link-field"), {
+				placeholder: __("Search Customer..."),
+				onchange: () => me.focus_input(),
 			});
 
 			this.customer_control.set_value(this.shift_data.customer || "Guest");
@@ -173,18 +489,21 @@ class MiniMartPOS {
 	}
 
 	bind_events() {
-		const handleBarcodeScan = (e) => {
-			if (e.key === "Enter" || e.which == 13) {
-				let code = this.$scan_input.val().trim();
-				if (code) this.fetch_item(code);
-				this.$scan_input.val("");
-				this.load_products();
-				e.preventDefault();
-			}
-		};
+		// Enter is handled on keydown only; listening to keypress as well made
+		// every scan fire twice.
+		this.$scan_input.on("keydown", (e) => {
+			if (e.key !== "Enter" && e.which != 13) return;
+			e.preventDefault();
+			if (e.originalEvent && e.originalEvent.repeat) return;
 
-		this.$scan_input.on("keypress", handleBarcodeScan);
-		this.$scan_input.on("keydown", handleBarcodeScan);
+			let code = this.$scan_input.val().trim();
+			this.$scan_input.val("");
+			clearTimeout(this.product_search_timer);
+			if (code) this.fetch_item(code);
+
+			// Only reload the grid if it is currently showing search results.
+			if (this.last_product_search) this.load_products("", true);
+		});
 
 		this.$scan_input.on("input", () => this.schedule_product_refresh());
 		this.$group_filter.on("change", () => {
@@ -205,45 +524,135 @@ class MiniMartPOS {
 
 		$(document).on("click", "#checkout-btn", () => this.process_payment());
 
+		this.$product_grid.on("click", ".product-card", (e) => {
+			let item = this.product_map.get($(e.currentTarget).attr("data-product-key"));
+			if (item) this.add_to_cart(item);
+		});
+		this.$product_grid.on("scroll", () => this.schedule_product_window_render());
+		$(window).on("scroll", () => this.schedule_product_window_render());
+		$(window).on("resize", () => {
+			// Column count and card height change with the media queries.
+			this.product_row_height = 0;
+			this.schedule_product_window_render();
+		});
+
 		this.$clear_cart_btn.on("click", () => this.clear_cart());
+
+		this.bind_cart_events();
+	}
+
+	bind_cart_events() {
+		// Bound once; rows are patched in place so handlers never need rebinding.
+		const get_index = (el) => {
+			let line_id = $(el).closest(".cart-row").attr("data-line-id");
+			return this.cart.findIndex((line) => line.line_id === line_id);
+		};
+
+		this.$cart_container.on("click", ".btn-qty", (e) => {
+			this.update_qty(get_index(e.currentTarget), flt($(e.currentTarget).attr("data-delta")));
+		});
+		this.$cart_container.on("change", ".cart-qty-input", (e) => {
+			this.manual_qty_update(get_index(e.currentTarget), e.currentTarget.value);
+		});
+		this.$cart_container.on("change", ".cart-uom-select", (e) => {
+			this.change_cart_item_uom(get_index(e.currentTarget), $(e.currentTarget).val());
+		});
+		this.$cart_container.on("click", ".price-btn", (e) => {
+			this.open_item_price_modal(get_index(e.currentTarget));
+		});
+		this.$cart_container.on("click", ".discount-btn", (e) => {
+			this.open_item_discount_modal(get_index(e.currentTarget));
+		});
+		this.$cart_container.on("click", ".btn-remove", (e) => {
+			this.void_cart_item(get_index(e.currentTarget));
+		});
 	}
 
 	async trigger_cash_drawer() {
-		try {
-			if (!("serial" in navigator)) return;
-			if (!this.serialPort)
-				this.serialPort = await navigator.serial.requestPort({ filters: [] });
-			if (!this.serialPort.writable) await this.serialPort.open({ baudRate: 9600 });
-			const writer = this.serialPort.writable.getWriter();
-			const open_cmd = new Uint8Array([27, 112, 0, 25, 250]);
-			await writer.write(open_cmd);
-			writer.releaseLock();
-		} catch (err) {
-			console.error("Hardware Error:", err);
-			this.serialPort = null;
+		await this.write_to_serial(new Uint8Array([27, 112, 0, 25, 250]));
+	}
+
+	write_to_serial(bytes) {
+		// The drawer kick and receipts share one port; queue writes so they never overlap.
+		this.serial_queue = this.serial_queue
+			.then(async () => {
+				if (!("serial" in navigator)) return false;
+				if (!this.serialPort)
+					this.serialPort = await navigator.serial.requestPort({ filters: [] });
+				if (!this.serialPort.writable) await this.serialPort.open({ baudRate: 9600 });
+				const writer = this.serialPort.writable.getWriter();
+				try {
+					await writer.write(bytes);
+				} finally {
+					writer.releaseLock();
+				}
+				return true;
+			})
+			.catch((err) => {
+				console.error("Hardware Error:", err);
+				this.serialPort = null;
+				return false;
+			});
+		return this.serial_queue;
+	}
+
+	print_receipt(invoice_name, fallback_to_printview = true) {
+		if (!invoice_name) return;
+		if (!("serial" in navigator)) {
+			if (fallback_to_printview) this.open_printview(invoice_name);
+			return;
 		}
+
+		let started = performance.now();
+		frappe.call({
+			method: "minimart_pos.api.get_receipt",
+			args: { invoice: invoice_name, receipt_format: "escpos", width: this.receipt_width },
+			callback: async (r) => {
+				if (!r.message) return;
+				const bytes = Uint8Array.from(atob(r.message.data), (char) => char.charCodeAt(0));
+				const printed = await this.write_to_serial(bytes);
+				console.info(
+					`Mart POS receipt ${invoice_name} (${r.message.cached ? "cached" : "rendered"}) (ms):`,
+					Math.round(performance.now() - started),
+				);
+				if (!printed && fallback_to_printview) this.open_printview(invoice_name);
+			},
+			error: () => {
+				if (fallback_to_printview) this.open_printview(invoice_name);
+			},
+		});
+	}
+
+	open_printview(invoice_name) {
+		const params = new URLSearchParams({
+			doctype: "POS Invoice",
+			name: invoice_name,
+			trigger_print: 1,
+		});
+		window.open(`/printview?${params.toString()}`, "_blank");
 	}
 
 	load_item_groups() {
 		frappe.call({
-			method: "frappe.client.get_list",
-			args: {
-				doctype: "Item Group",
-				filters: { is_group: 0 },
-				fields: ["name"],
-				limit_page_length: 100,
-			},
+			method: "minimart_pos.api.get_pos_item_groups",
 			callback: (r) => {
-				if (r.message) {
-					let options = r.message.map(
-						(g) => `<option value="${g.name}">${g.name}</option>`,
-					);
-					this.$group_filter.append(options.join(""));
-				}
+				if (r.message) this.render_item_groups(r.message);
 			},
 		});
 	}
 
+	render_item_groups(groups) {
+		// Groups arrive in tree order; children are indented under their parent.
+		let options = groups.map((group) => {
+			let label = "\u00a0\u00a0".repeat(Math.max(0, group.depth - 1)) + group.name;
+			if (group.item_count !== null && group.item_count !== undefined) {
+				label += ` (${group.item_count})`;
+			}
+			return $("<option>").val(group.name).text(label);
+		});
+		this.$group_filter.append(options);
+	}
+
 	schedule_product_refresh() {
 		clearTimeout(this.product_search_timer);
 		this.product_search_timer = setTimeout(() => {
@@ -255,109 +664,333 @@ class MiniMartPOS {
 	load_products(search_term = "", in_stock_only = true) {
 		let item_group = this.$group_filter.val();
 		let normalized_search_term = (search_term || "").trim();
+		this.last_product_search = normalized_search_term;
 		let normalized_in_stock_only =
 			in_stock_only !== null && in_stock_only !== undefined
 				? in_stock_only
 				: !normalized_search_term;
+		this.product_query = {
+			search_term: normalized_search_term,
+			item_group: item_group,
+			in_stock_only: normalized_in_stock_only,
+			order_by: "velocity",
+		};
+		this.product_next_cursor = null;
+		this.product_page_loading = false;
+		let request_seq = ++this.product_request_seq;
+
+		this.request_product_page(null, (products, next_cursor) => {
+			// A newer search or filter has been issued since; drop this page.
+			if (request_seq !== this.product_request_seq) return;
+			this.product_next_cursor = next_cursor;
+			this.render_products(products);
+		});
+	}
+
+	load_more_products() {
+		if (!this.product_next_cursor || this.product_page_loading) return;
+		this.product_page_loading = true;
+		let request_seq = this.product_request_seq;
+
+		this.request_product_page(this.product_next_cursor, (products, next_cursor) => {
+			if (request_seq !== this.product_request_seq) return;
+			this.product_page_loading = false;
+			this.product_next_cursor = next_cursor;
+			this.append_products(products);
+		});
+	}
+
+	request_product_page(cursor, callback) {
 		frappe.call({
 			method: "minimart_pos.api.get_products",
 			args: {
-				search_term: normalized_search_term,
-				item_group: item_group,
+				...this.product_query,
 				limit_page_length: this.product_result_limit,
-				in_stock_only: normalized_in_stock_only,
+				compact: 1,
+				paged: 1,
+				cursor: cursor,
 			},
 			callback: (r) => {
-				if (r.message) this.render_products(r.message);
+				let products = decode_compact_payload(r.message);
+				let meta = (r.message && r.message.meta) || {};
+				if (products) callback(products, meta.next_cursor || null);
+			},
+			error: () => {
+				this.product_page_loading = false;
 			},
 		});
 	}
 
+	get_product_key(item) {
+		return `${item.item_code}::${item.uom || ""}`;
+	}
+
+	set_products(products) {
+		this.products = [];
+		this.product_map = new Map();
+		this.base_stock_by_item = new Map();
+		this.product_keys_by_stock_item = new Map();
+		this.add_products(products || []);
+	}
+
+	add_products(products) {
+		products.forEach((item) => {
+			let key = this.get_product_key(item);
+			if (this.product_map.has(key)) return;
+			this.products.push(item);
+			this.product_map.set(key, item);
+			if (!item.is_product_bundle && !this.base_stock_by_item.has(item.item_code)) {
+				this.base_stock_by_item.set(item.item_code, flt(item.actual_qty));
+			}
+
+			// A card depends on its own item and, for bundles, on every component.
+			this.index_product_key(item.item_code, key);
+			(item.bundle_components || []).forEach((component) =>
+				this.index_product_key(component.item_code, key),
+			);
+		});
+	}
+
+	append_products(products) {
+		if (!products.length) return;
+		this.add_products(products);
+		this.schedule_product_window_render();
+	}
+
+	index_product_key(item_code, key) {
+		let keys = this.product_keys_by_stock_item.get(item_code);
+		if (!keys) {
+			keys = new Set();
+			this.product_keys_by_stock_item.set(item_code, keys);
+		}
+		keys.add(key);
+	}
+
 	render_products(products) {
-		if (!products.length) {
+		this.set_products(products);
+		this.rendered_cards = new Map();
+		this.reset_product_grid_padding();
+
+		if (!this.products.length) {
 			this.$product_grid.html(
 				`<div class="pos-loading-state">${__("No products found")}</div>`,
 			);
 			return;
 		}
 
-		let html = products
-			.map((item) => {
-				const itemJSON = JSON.stringify(item).replace(/"/g, "&quot;");
-				const bundleComponents = encodeURIComponent(
-					JSON.stringify(item.bundle_components || []),
-				);
-				const bundleLabel = item.is_product_bundle
-					? `<span class="bundle-badge">${__("Bundle")}</span>`
-					: "";
-				let conversion = flt(item.conversion_factor) || 1;
-				let display_qty = conversion
-					? flt(item.actual_qty) / conversion
-					: flt(item.actual_qty);
-				let badge_class =
-					display_qty <= 0
-						? "bg-danger"
-						: display_qty <= 5
-							? "bg-warning"
-							: "bg-success";
-				return `
-                <div class="product-card"
-                      data-item-code="${item.item_code.toLowerCase()}"
-                      data-item-uom="${(item.uom || "").toLowerCase()}"
-                      data-item-name="${item.item_name.toLowerCase()}"
-                      data-item-group="${item.item_group || ""}"
-                      data-base-actual-qty="${item.actual_qty}"
-                      data-actual-qty="${display_qty}"
-                      data-display-conversion="${conversion}"
-                      data-bundle-components="${bundleComponents}"
-                      onclick="pos_instance.add_to_cart(${itemJSON})">
-                    ${bundleLabel}
-                    <span class="stock-badge ${badge_class}">${this.format_stock_qty(display_qty, conversion)}</span>
-                    <div class="product-image">
-                        ${item.image ? `<img src="${item.image}">` : `<div class="img-placeholder">${item.item_name[0]}</div>`}
-                    </div>
-                    <div class="product-name">${item.item_name}</div>
-                    <div class="product-uom">${item.uom || ""}</div>
-                    <div class="product-price">₱${flt(item.price).toFixed(2)}</div>
-                </div>
-            `;
-			})
-			.join("");
-		this.$product_grid.html(html);
+		this.$product_grid.empty().scrollTop(0);
+		this.render_product_window();
+	}
+
+	reset_product_grid_padding() {
+		let grid = this.$product_grid[0];
+		if (!grid) return;
+		grid.style.paddingTop = "";
+		grid.style.paddingBottom = "";
+		let style = getComputedStyle(grid);
+		this.product_grid_padding = {
+			top: parseFloat(style.paddingTop) || 0,
+			bottom: parseFloat(style.paddingBottom) || 0,
+		};
+	}
+
+	schedule_product_window_render() {
+		if (this.product_window_frame) return;
+		this.product_window_frame = requestAnimationFrame(() => {
+			this.product_window_frame = null;
+			this.render_product_window();
+		});
+	}
+
+	get_product_grid_columns() {
+		let grid = this.$product_grid[0];
+		let columns = getComputedStyle(grid).gridTemplateColumns.split(" ").filter(Boolean);
+		return Math.max(1, columns.length);
+	}
+
+	get_visible_product_rows(total_rows) {
+		// Works whether the grid scrolls itself (desktop) or the page scrolls
+		// (phone layout, where the grid has no max height).
+		let grid = this.$product_grid[0];
+		let rect = grid.getBoundingClientRect();
+		let content_offset = grid.scrollTop - rect.top - this.product_grid_padding.top;
+		let view_top = Math.max(rect.top, 0) + content_offset;
+		let view_bottom = Math.min(rect.bottom, window.innerHeight) + content_offset;
+		let row_height = this.product_row_height;
+
+		let first_row = Math.floor(Math.max(0, view_top) / row_height) - this.product_overscan_rows;
+		let last_row = Math.ceil(Math.max(0, view_bottom) / row_height) + this.product_overscan_rows;
+		return [Math.max(0, first_row), Math.min(total_rows, Math.max(last_row, 1))];
+	}
+
+	render_product_window() {
+		let grid = this.$product_grid[0];
+		if (!grid || !this.products.length) return;
+
+		let columns = this.get_product_grid_columns();
+		let total_rows = Math.ceil(this.products.length / columns);
+		let [first_row, last_row] = this.product_row_height
+			? this.get_visible_product_rows(total_rows)
+			: [0, Math.min(total_rows, 2)];
+
+		let start = first_row * columns;
+		let end = Math.min(this.products.length, last_row * columns);
+		let next_cards = new Map();
+		let nodes = [];
+
+		for (let i = start; i < end; i++) {
+			let item = this.products[i];
+			let key = this.get_product_key(item);
+			let card = this.rendered_cards.get(key) || this.create_product_card();
+			this.fill_product_card(card, item);
+			next_cards.set(key, card);
+			nodes.push(card);
+		}
+
+		// Existing nodes are moved, not rebuilt; cards that left the window are dropped.
+		grid.replaceChildren(...nodes);
+		this.rendered_cards = next_cards;
+
+		if (!this.product_row_height) {
+			let first_card = nodes[0];
+			let row_gap = parseFloat(getComputedStyle(grid).rowGap) || 0;
+			this.product_row_height = first_card ? first_card.offsetHeight + row_gap : 0;
+			if (this.product_row_height) {
+				this.render_product_window();
+			}
+			return;
+		}
+
+		grid.style.paddingTop = `${this.product_grid_padding.top + first_row * this.product_row_height}px`;
+		grid.style.paddingBottom = `${
+			this.product_grid_padding.bottom + (total_rows - last_row) * this.product_row_height
+		}px`;
+
+		if (last_row >= total_rows - this.product_overscan_rows) {
+			this.load_more_products();
+		}
+	}
+
+	create_product_card() {
+		let card = document.createElement("div");
+		card.className = "product-card";
+		card.innerHTML = `
+			<span class="bundle-badge">${__("Bundle")}</span>
+			<span class="stock-badge"></span>
+			<div class="product-image"></div>
+			<div class="product-name"></div>
+			<div class="product-uom"></div>
+			<div class="product-price"></div>
+		`;
+		return card;
+	}
+
+	fill_product_card(card, item) {
+		let key = this.get_product_key(item);
+		if (card.getAttribute("data-product-key") !== key || card.pos_item !== item) {
+			card.setAttribute("data-product-key", key);
+			card.pos_item = item;
+
+			let $card = $(card);
+			$card.find(".bundle-badge").toggle(Boolean(item.is_product_bundle));
+			$card.find(".product-name").text(item.item_name);
+			$card.find(".product-uom").text(item.uom || "");
+			$card.find(".product-price").text(`₱${flt(item.price).toFixed(2)}`);
+
+			let $image = $card.find(".product-image").empty();
+			if (item.thumbnail || item.image) {
+				$('<img loading="lazy" decoding="async">')
+					.attr("src", item.thumbnail || item.image)
+					.appendTo($image);
+			} else {
+				$('<div class="img-placeholder"></div>')
+					.text((item.item_name || "")[0] || "")
+					.appendTo($image);
+			}
+		}
+
+		this.update_card_stock_display(card, item);
 	}
 
 	fetch_item(query) {
-		frappe.call({
-			method: "minimart_pos.api.get_item_by_barcode",
-			args: { barcode: query },
-			callback: (r) => {
-				if (r.message) {
-					this.handle_fetched_item(r.message);
-				} else {
-					this.search_item(query);
-				}
-			},
+		let entry = { code: query, done: false, item: null };
+		this.scan_queue.push(entry);
+
+		// A stock take rescans the same shelf codes many times; known codes skip the round trip.
+		let counted_item = this.stock_count && this.stock_count.items_by_code.get(query);
+		if (counted_item) {
+			entry.item = counted_item;
+			entry.done = true;
+			this.drain_scan_queue();
+			return;
+		}
+
+		this.request_scan(query).then((item) => {
+			if (item && this.stock_count) this.stock_count.items_by_code.set(query, item);
+			entry.item = item;
+			entry.done = true;
+			this.drain_scan_queue();
 		});
 	}
 
-	search_item(query) {
-		frappe.call({
-			method: "minimart_pos.api.search_item",
-			args: { query: query },
-			callback: (r) => {
-				if (r.message) {
-					this.handle_fetched_item(r.message);
+	request_scan(code) {
+		let cached = this.scan_cache.get(code);
+		if (cached && Date.now() - cached.time < this.scan_cache_ttl) {
+			return cached.request;
+		}
+
+		let request = new Promise((resolve) => {
+			frappe.call({
+				method: "minimart_pos.api.scan",
+				args: { code: code, compact: 1 },
+				callback: (r) => resolve(decode_compact_payload(r.message) || null),
+				error: () => resolve(null),
+			});
+		});
+		this.scan_cache.set(code, { request: request, time: Date.now() });
+		request.then((item) => {
+			if (!item) this.scan_cache.delete(code);
+		});
+		return request;
+	}
+
+	async drain_scan_queue() {
+		if (this.scan_draining) return;
+		this.scan_draining = true;
+		try {
+			while (this.scan_queue.length && this.scan_queue[0].done) {
+				let entry = this.scan_queue.shift();
+				if (entry.item) {
+					await this.handle_fetched_item(entry.item);
 				} else {
 					frappe.show_alert({ message: __("Not found"), indicator: "red" });
 					frappe.utils.play_sound("error");
 					this.focus_input();
 				}
-			},
-		});
+			}
+		} finally {
+			this.scan_draining = false;
+		}
 	}
 
-	handle_fetched_item(item) {
-		this.add_to_cart(item);
+	async handle_fetched_item(item) {
+		if (this.stock_count) {
+			this.add_stock_count_scan(item);
+			frappe.utils.play_sound("submit");
+			this.focus_input();
+			return;
+		}
+		if (item.uoms && item.uoms.length) {
+			if (!this.uom_cache) this.uom_cache = {};
+			this.uom_cache[item.item_code] = item.uoms;
+		}
+		this.log_event("scan", {
+			item_code: item.item_code,
+			uom: item.uom,
+			qty: 1,
+			amount: flt(item.price),
+		});
+		await this.add_to_cart(item);
 		frappe.utils.play_sound("submit");
 		this.focus_input();
 	}
@@ -390,7 +1023,7 @@ class MiniMartPOS {
 		if (existing) {
 			existing.qty += 1;
 		} else {
-			this.cart.push({
+			existing = {
 				item_code: item.item_code,
 				item_name: item.item_name,
 				price: flt(default_uom.price),
@@ -399,10 +1032,12 @@ class MiniMartPOS {
 				uom: default_uom.uom,
 				bundle_components: item.bundle_components || [],
 				uoms: uoms, // cache UOMs for selector
-			});
+			};
+			this.ensure_cart_line_id(existing);
+			this.cart.push(existing);
 		}
 
-		this.sync_grid_stock();
+		this.sync_grid_stock(this.reserve_cart_line(existing));
 		this.render_cart();
 	}
 
@@ -413,13 +1048,26 @@ class MiniMartPOS {
 			discount_pct = 100;
 			frappe.show_alert({ message: __("Discount cannot exceed 100%"), indicator: "orange" });
 		}
+		this.log_item_discount(item, discount_pct);
 		item.discount_pct = discount_pct;
 		this.render_cart();
 	}
 
+	log_item_discount(item, discount_pct) {
+		if (flt(item.discount_pct) === discount_pct) return;
+		this.log_event("item_discount", {
+			item_code: item.item_code,
+			uom: item.uom,
+			qty: flt(item.qty),
+			amount: flt(item.price) * flt(item.qty) * (discount_pct / 100),
+			details: `${flt(item.discount_pct)}% -> ${discount_pct}%`,
+		});
+	}
+
 	open_item_discount_modal(index) {
 		let me = this;
 		let item = this.cart[index];
+		if (!item) return;
 		const basePrice = flt(item.price);
 		const updatePreview = (value) => {
 			let discount_pct = Math.max(0, Math.min(100, flt(value)));
@@ -456,6 +1104,7 @@ class MiniMartPOS {
 			primary_action_label: __("Apply"),
 			primary_action(values) {
 				let discount_pct = Math.max(0, Math.min(100, flt(values.discount_pct)));
+				me.log_item_discount(item, discount_pct);
 				item.discount_pct = discount_pct;
 				me.render_cart();
 				d.hide();
@@ -515,6 +1164,7 @@ class MiniMartPOS {
 						let updatedUoms = r.message.uoms || [];
 						if (!me.uom_cache) me.uom_cache = {};
 						me.uom_cache[item.item_code] = updatedUoms;
+						me.scan_cache.clear();
 
 						item.uoms = updatedUoms;
 						item.price = price;
@@ -536,68 +1186,86 @@ class MiniMartPOS {
 		d.show();
 	}
 
-	sync_grid_stock() {
-		this.refresh_all_card_stock_displays();
+	set_cart(cart) {
+		this.cart = cart || [];
+		this.cart.forEach((cart_item) => this.ensure_cart_line_id(cart_item));
+		this.reserved_stock = new Map();
+		this.line_reservations = new WeakMap();
+		this.cart.forEach((cart_item) => this.reserve_cart_line(cart_item));
+		this.sync_grid_stock();
 	}
 
-	get_cart_item_stock_units(cart_item) {
-		let uom_row = (cart_item.uoms || []).find((u) => u.uom === cart_item.uom);
-		let conversion = flt(uom_row && uom_row.conversion_factor) || 1;
-		return flt(cart_item.qty) * conversion;
+	get_line_reservations(cart_item) {
+		let stock_units = this.get_cart_item_stock_units(cart_item);
+		let reservations = [[cart_item.item_code, stock_units]];
+		(cart_item.bundle_components || []).forEach((component) => {
+			reservations.push([component.item_code, stock_units * flt(component.qty)]);
+		});
+		return reservations;
 	}
 
-	get_reserved_stock_qty(item_code) {
-		return this.cart.reduce((total, cart_item) => {
-			let stock_units = this.get_cart_item_stock_units(cart_item);
-			if (cart_item.item_code === item_code) {
-				total += stock_units;
-			}
+	add_reserved_stock(item_code, qty) {
+		let total = flt(this.reserved_stock.get(item_code)) + qty;
+		if (Math.abs(total) < 1e-9) {
+			this.reserved_stock.delete(item_code);
+		} else {
+			this.reserved_stock.set(item_code, total);
+		}
+	}
 
-			(cart_item.bundle_components || []).forEach((component) => {
-				if (component.item_code === item_code) {
-					total += stock_units * flt(component.qty);
-				}
-			});
+	reserve_cart_line(cart_item, release = false) {
+		// Swap the line's previous contribution for its current one and
+		// return the stock item codes whose reserved qty changed.
+		let affected = new Set();
+		(this.line_reservations.get(cart_item) || []).forEach(([item_code, qty]) => {
+			this.add_reserved_stock(item_code, -qty);
+			affected.add(item_code);
+		});
 
-			return total;
-		}, 0);
+		let reservations = release ? [] : this.get_line_reservations(cart_item);
+		reservations.forEach(([item_code, qty]) => {
+			this.add_reserved_stock(item_code, qty);
+			affected.add(item_code);
+		});
+		this.line_reservations.set(cart_item, reservations);
+		return affected;
 	}
 
-	get_product_cards(item_code) {
-		return this.$product_grid.find(
-			`.product-card[data-item-code="${item_code.toLowerCase()}"]`,
-		);
-	}
+	sync_grid_stock(affected_item_codes = null) {
+		if (!affected_item_codes) {
+			this.refresh_all_card_stock_displays();
+			return;
+		}
 
-	get_product_card(item_code, uom = null) {
-		let $cards = this.get_product_cards(item_code);
-		if (!uom) return $cards.first();
-		let $card = $cards.filter(`[data-item-uom="${String(uom).toLowerCase()}"]`).first();
-		return $card.length ? $card : $cards.first();
+		let keys = new Set();
+		affected_item_codes.forEach((item_code) => {
+			(this.product_keys_by_stock_item.get(item_code) || []).forEach((key) => keys.add(key));
+		});
+		keys.forEach((key) => {
+			let card = this.rendered_cards.get(key);
+			if (card) this.update_card_stock_display(card, card.pos_item);
+		});
 	}
 
-	get_bundle_components_from_card($card) {
-		let encoded = $card.attr("data-bundle-components");
-		if (!encoded) return [];
+	get_cart_item_stock_units(cart_item) {
+		let uom_row = (cart_item.uoms || []).find((u) => u.uom === cart_item.uom);
+		let conversion = flt(uom_row && uom_row.conversion_factor) || 1;
+		return flt(cart_item.qty) * conversion;
+	}
 
-		try {
-			return JSON.parse(decodeURIComponent(encoded));
-		} catch (e) {
-			console.error("Failed to parse bundle components", e);
-			return [];
-		}
+	get_reserved_stock_qty(item_code) {
+		return flt(this.reserved_stock.get(item_code));
 	}
 
 	get_base_stock_qty(item_code) {
 		// Product-card quantities are display-only. Checkout uses backend
 		// validation so hidden, filtered, paged, or barcode-only items still validate.
-		let $card = this.get_product_card(item_code);
-		return $card.length ? flt($card.attr("data-base-actual-qty")) : 0;
+		return flt(this.base_stock_by_item.get(item_code));
 	}
 
 	get_product_name(item_code) {
-		let $card = this.get_product_card(item_code);
-		return ($card.attr("data-item-name") || item_code).trim();
+		let item = this.products.find((row) => row.item_code === item_code);
+		return item ? item.item_name : item_code;
 	}
 
 	get_checkout_cart_payload() {
@@ -674,36 +1342,18 @@ class MiniMartPOS {
 	}
 
 	refresh_all_card_stock_displays() {
-		this.$product_grid.find(".product-card").each((_, card) => {
-			let $card = $(card);
-			let item_code = $card.attr("data-item-code");
-			let display_conversion = flt($card.attr("data-display-conversion")) || 1;
-			let display_uom = $card.attr("data-item-uom");
-			this.update_card_stock_display(item_code, display_conversion, display_uom);
-		});
+		this.rendered_cards.forEach((card) => this.update_card_stock_display(card, card.pos_item));
 	}
 
-	update_card_stock_display(item_code, display_conversion = 1, display_uom = null) {
-		let $card = this.get_product_card(item_code, display_uom);
-		if (!$card.length) return;
+	update_card_stock_display(card, item) {
+		if (!card || !item) return;
 
-		let bundle_components = this.get_bundle_components_from_card($card);
+		let display_conversion = flt(item.conversion_factor) || 1;
+		let bundle_components = item.bundle_components || [];
 		let remaining_stock = bundle_components.length
 			? this.get_remaining_bundle_qty(bundle_components)
-			: Math.max(
-					0,
-					flt($card.attr("data-base-actual-qty")) -
-						this.get_reserved_stock_qty(item_code),
-				);
-		let displayed_stock = display_conversion
-			? remaining_stock / display_conversion
-			: remaining_stock;
-
-		$card.attr("data-display-conversion", display_conversion);
-		$card.attr("data-actual-qty", displayed_stock);
-		$card
-			.find(".stock-badge")
-			.text(this.format_stock_qty(displayed_stock, display_conversion));
+			: Math.max(0, flt(item.actual_qty) - this.get_reserved_stock_qty(item.item_code));
+		let displayed_stock = remaining_stock / display_conversion;
 
 		let badge_class =
 			displayed_stock <= 0
@@ -711,8 +1361,9 @@ class MiniMartPOS {
 				: displayed_stock <= 5
 					? "bg-warning"
 					: "bg-success";
-		$card
+		$(card)
 			.find(".stock-badge")
+			.text(this.format_stock_qty(displayed_stock, display_conversion))
 			.removeClass("bg-danger bg-warning bg-success")
 			.addClass(badge_class);
 	}
@@ -736,123 +1387,175 @@ class MiniMartPOS {
 
 		let next_qty = flt(item.qty) + delta;
 		item.qty = next_qty < 1 ? 1 : next_qty;
-		this.sync_grid_stock();
+		this.sync_grid_stock(this.reserve_cart_line(item));
 		this.render_cart();
 	}
 
-	manual_qty_update(index, value) {
-		let item = this.cart[index];
-		if (!item) return;
+	manual_qty_update(index, value) {
+		let item = this.cart[index];
+		if (!item) return;
+
+		let parsed_qty = flt(value);
+		if (!Number.isFinite(parsed_qty) || parsed_qty < 1) {
+			parsed_qty = 1;
+		}
+
+		item.qty = parsed_qty;
+		this.sync_grid_stock(this.reserve_cart_line(item));
+		this.render_cart();
+	}
+
+	ensure_cart_line_id(cart_item) {
+		if (!cart_item.line_id) {
+			cart_item.line_id = frappe.utils.get_random(10);
+		}
+		return cart_item.line_id;
+	}
+
+	get_cart_line_total(item) {
+		let discount_pct = flt(item.discount_pct || 0);
+		let linePrice = flt(item.price) * (1 - discount_pct / 100);
+		if (linePrice < 0) linePrice = 0;
+		return flt(item.qty) * linePrice;
+	}
+
+	get_cart_row_signature(item) {
+		return [
+			item.item_name,
+			item.qty,
+			item.price,
+			item.discount_pct,
+			item.uom,
+			(item.uoms || []).map((u) => u.uom).join("|"),
+		].join("\u0001");
+	}
+
+	render_cart() {
+		let container = this.$cart_container[0];
+		if (!this.cart.length) {
+			this.cart_rows = new Map();
+			this.cart_row_signatures = new Map();
+			this.cart_line_totals = new Map();
+			this.cart_total = 0;
+			$("#cart-count").text(`0 Items`);
+			this.$cart_container.html(`<div class="empty-cart-msg">${__("No items in cart")}</div>`);
+			this.update_total();
+			return;
+		}
+
+		this.$cart_container.children(".empty-cart-msg").remove();
+
+		let live_ids = new Set();
+		this.cart.forEach((item, index) => {
+			let line_id = this.ensure_cart_line_id(item);
+			live_ids.add(line_id);
+
+			let row = this.cart_rows.get(line_id);
+			if (!row) {
+				row = this.create_cart_row(item);
+				this.cart_rows.set(line_id, row);
+			}
+
+			let signature = this.get_cart_row_signature(item);
+			if (this.cart_row_signatures.get(line_id) !== signature) {
+				this.patch_cart_row(row, item);
+				this.cart_row_signatures.set(line_id, signature);
+
+				let line_total = this.get_cart_line_total(item);
+				this.cart_total += line_total - flt(this.cart_line_totals.get(line_id));
+				this.cart_line_totals.set(line_id, line_total);
+			}
+
+			// Only move rows that are out of place; a moved node loses focus.
+			if (container.children[index] !== row) {
+				container.insertBefore(row, container.children[index] || null);
+			}
+		});
+
+		this.cart_rows.forEach((row, line_id) => {
+			if (live_ids.has(line_id)) return;
+			row.remove();
+			this.cart_total -= flt(this.cart_line_totals.get(line_id));
+			this.cart_rows.delete(line_id);
+			this.cart_row_signatures.delete(line_id);
+			this.cart_line_totals.delete(line_id);
+		});
+
+		$("#cart-count").text(`${this.cart.length} Items`);
+		this.update_total();
+	}
+
+	create_cart_row(item) {
+		let row = document.createElement("div");
+		row.className = "cart-row";
+		row.setAttribute("data-line-id", item.line_id);
+		row.innerHTML = `
+			<div class="cart-item-line cart-item-line-header">
+				<div class="cart-item-name"></div>
+				<div class="item-total">
+					<span class="item-total-value"></span>
+				</div>
+			</div>
 
-		let parsed_qty = flt(value);
-		if (!Number.isFinite(parsed_qty) || parsed_qty < 1) {
-			parsed_qty = 1;
-		}
+			<div class="cart-item-line cart-item-line-controls">
+				<div class="qty-controls">
+					<button class="btn-qty" data-delta="-1">-</button>
+					<input type="number" class="cart-qty-input" min="1">
+					<button class="btn-qty" data-delta="1">+</button>
+				</div>
 
-		item.qty = parsed_qty;
-		this.sync_grid_stock();
-		this.render_cart();
+				<div class="uom-selector-wrapper"></div>
+
+				<div class="cart-actions">
+					<button class="price-btn" title="Set Rate"></button>
+					<button class="discount-btn" title="Set Discount"></button>
+					<button class="btn-remove btn-remove-square" title="Remove Item">×</button>
+				</div>
+			</div>
+		`;
+		return row;
 	}
 
-	render_cart() {
-		let html = this.cart
-			.map((item, index) => {
-				let discount_pct = flt(item.discount_pct || 0);
-				let linePrice = flt(item.price) * (1 - discount_pct / 100);
-				if (linePrice < 0) linePrice = 0;
-				let lineTotal = (item.qty * linePrice).toFixed(2);
-				let priceButtonClass =
-					flt(item.price) <= 0 ? "price-btn price-btn-zero" : "price-btn";
-
-				// UOM selector dropdown
-				let uom_selector = "";
-				if (item.uoms && item.uoms.length > 1) {
-					uom_selector = `<select class="cart-uom-select" data-index="${index}">
-                    ${item.uoms
-						.map(
-							(u) =>
-								`<option value="${u.uom}" ${u.uom === item.uom ? "selected" : ""}>${u.uom}</option>`,
-						)
-						.join("")}
-                </select>`;
-				} else if (item.uoms && item.uoms.length === 1) {
-					uom_selector = `<span class="cart-uom-label">${item.uoms[0].uom}</span>`;
-				}
+	patch_cart_row(row, item) {
+		let $row = $(row);
+		$row.find(".cart-item-name").text(item.item_name);
+		$row.find(".item-total-value").text(`₱${this.get_cart_line_total(item).toFixed(2)}`);
+		$row
+			.find(".price-btn")
+			.toggleClass("price-btn-zero", flt(item.price) <= 0)
+			.text(`₱${flt(item.price).toFixed(2)}`);
+		$row.find(".discount-btn").text(`${flt(item.discount_pct || 0).toFixed(0)}%`);
+
+		let input = $row.find(".cart-qty-input")[0];
+		if (document.activeElement !== input) {
+			input.value = item.qty;
+		} else if (flt(input.value) !== flt(item.qty)) {
+			// Keep the caret where the cashier left it while the value changes.
+			let caret = null;
+			try {
+				caret = input.selectionStart;
+			} catch (e) {
+				caret = null;
+			}
+			input.value = item.qty;
+			if (caret !== null) {
+				input.setSelectionRange(caret, caret);
+			}
+		}
 
-				return `
-            <div class="cart-row">
-                <div class="cart-item-line cart-item-line-header">
-                    <div class="cart-item-name">${item.item_name}</div>
-                    <div class="item-total">
-                        <span class="item-total-value">₱${lineTotal}</span>
-                    </div>
-                </div>
-
-                <div class="cart-item-line cart-item-line-controls">
-
-    <div class="qty-controls">
-        <button onclick="pos_instance.update_qty(${index}, -1)" class="btn-qty">-</button>
-
-        <input
-            type="number"
-            class="cart-qty-input"
-            value="${item.qty}"
-            min="1"
-            onchange="pos_instance.manual_qty_update(${index}, this.value)">
-
-        <button onclick="pos_instance.update_qty(${index}, 1)" class="btn-qty">+</button>
-    </div>
-
-    <div class="uom-selector-wrapper">
-        ${uom_selector}
-    </div>
-
-    <div class="cart-actions">
-
-        <button
-            class="${priceButtonClass}"
-            onclick="pos_instance.open_item_price_modal(${index})"
-            title="Set Rate">
-            ₱${flt(item.price).toFixed(2)}
-        </button>
-
-        <button
-            class="discount-btn"
-            onclick="pos_instance.open_item_discount_modal(${index})"
-            title="Set Discount">
-            ${flt(item.discount_pct || 0).toFixed(0)}%
-        </button>
-
-        <button
-            onclick="pos_instance.void_cart_item(${index})"
-            class="btn-remove btn-remove-square"
-            title="Remove Item">
-            ×
-        </button>
-
-    </div>
-
-</div>
-            </div>
-        `;
-			})
-			.join("");
-		$("#cart-count").text(`${this.cart.length} Items`);
-		this.$cart_container.html(
-			this.cart.length
-				? html
-				: `<div class="empty-cart-msg">${__("No items in cart")}</div>`,
-		);
-		// Bind UOM change events
-		this.$cart_container
-			.find(".cart-uom-select")
-			.off("change")
-			.on("change", (e) => {
-				let idx = $(e.target).data("index");
-				let new_uom = $(e.target).val();
-				this.change_cart_item_uom(idx, new_uom);
-			});
-		this.update_total();
+		let uom_key = (item.uoms || []).map((u) => u.uom).join("|");
+		let $uom_wrapper = $row.find(".uom-selector-wrapper");
+		if ($uom_wrapper.attr("data-uoms") !== uom_key) {
+			$uom_wrapper.attr("data-uoms", uom_key).empty();
+			if (item.uoms && item.uoms.length > 1) {
+				let $select = $('<select class="cart-uom-select"></select>');
+				item.uoms.forEach((u) => $("<option>").val(u.uom).text(u.uom).appendTo($select));
+				$select.appendTo($uom_wrapper);
+			} else if (item.uoms && item.uoms.length === 1) {
+				$('<span class="cart-uom-label"></span>').text(item.uoms[0].uom).appendTo($uom_wrapper);
+			}
+		}
+		$uom_wrapper.find(".cart-uom-select").val(item.uom);
 	}
 
 	change_cart_item_uom(index, new_uom) {
@@ -862,9 +1565,7 @@ class MiniMartPOS {
 		if (!uom_row) return;
 		item.uom = uom_row.uom;
 		item.price = flt(uom_row.price);
-		let conversion = flt(uom_row.conversion_factor);
-		this.update_card_stock_display(item.item_code, conversion, item.uom);
-		this.sync_grid_stock();
+		this.sync_grid_stock(this.reserve_cart_line(item));
 		// Optionally, reset discount on UOM change
 		// item.discount_pct = 0;
 		this.render_cart();
@@ -873,8 +1574,15 @@ class MiniMartPOS {
 	void_cart_item(index) {
 		let item = this.cart[index];
 		if (!item) return;
+		this.log_event("line_removed", {
+			item_code: item.item_code,
+			uom: item.uom,
+			qty: flt(item.qty),
+			amount: this.get_cart_line_total(item),
+			reference: this.active_held_sale_name,
+		});
 		this.cart.splice(index, 1);
-		this.sync_grid_stock();
+		this.sync_grid_stock(this.reserve_cart_line(item, true));
 		this.render_cart();
 		this.focus_input();
 	}
@@ -884,26 +1592,24 @@ class MiniMartPOS {
 	}
 
 	update_total() {
-		let total = this.cart.reduce((sum, i) => {
-			let discount_pct = flt(i.discount_pct || 0);
-			let linePrice = flt(i.price) * (1 - discount_pct / 100);
-			if (linePrice < 0) linePrice = 0;
-			return sum + i.qty * linePrice;
-		}, 0);
-		this.$total_display.text(total.toFixed(2));
+		this.$total_display.text(Math.max(0, this.cart_total).toFixed(2));
 	}
 
 	clear_cart() {
 		if (this.cart.length === 0) return;
 
 		const do_clear = () => {
-			this.cart = [];
+			this.log_event("cart_cleared", {
+				qty: this.cart.length,
+				amount: this.cart_total,
+				reference: this.active_held_sale_name,
+			});
+			this.set_cart([]);
 			this.active_held_sale_name = null;
 			if (this.customer_control) {
 				this.customer_control.set_value("Guest");
 			}
 			this.render_cart();
-			this.sync_grid_stock();
 			this.focus_input();
 		};
 
@@ -958,7 +1664,10 @@ class MiniMartPOS {
 					callback: (r) => {
 						if (!r.message) return;
 						d.hide();
-						this.cart = [];
+						if (!this.active_held_sale_name) {
+							this.set_held_sale_count(this.held_sale_count + 1);
+						}
+						this.set_cart([]);
 						this.active_held_sale_name = null;
 						this.render_cart();
 						this.load_products();
@@ -978,6 +1687,7 @@ class MiniMartPOS {
 		frappe.call({
 			method: "minimart_pos.api.get_held_sales",
 			callback: (r) => {
+				this.set_held_sale_count((r.message || []).length);
 				this.render_held_sales_dialog(r.message || []);
 			},
 		});
@@ -1295,13 +2005,12 @@ class MiniMartPOS {
 			freeze: true,
 			callback: (r) => {
 				if (!r.message) return;
-				this.cart = r.message.cart || [];
+				this.set_cart(r.message.cart || []);
 				this.active_held_sale_name = r.message.name;
 				if (this.customer_control && r.message.customer) {
 					this.customer_control.set_value(r.message.customer);
 				}
 				this.render_cart();
-				this.sync_grid_stock();
 				this.focus_input();
 				dialog.hide();
 				frappe.show_alert({ message: __("Held sale restored"), indicator: "green" });
@@ -1419,6 +2128,9 @@ class MiniMartPOS {
 								<button type="button" class="btn btn-default btn-block text-left" data-action="view">
 									<i class="fa fa-file-text-o mr-2"></i>${__("View Invoice")}
 								</button>
+								<button type="button" class="btn btn-default btn-block text-left" data-action="return">
+									<i class="fa fa-undo mr-2"></i>${__("Return Sale")}
+								</button>
 							</div>
 						`,
 					},
@@ -1434,6 +2146,10 @@ class MiniMartPOS {
 					d.hide();
 					frappe.set_route("Form", "POS Invoice", pos_invoice_name);
 				});
+				d.$wrapper.find('[data-action="return"]').on("click", () => {
+					d.hide();
+					this.return_sale(pos_invoice_name);
+				});
 			};
 
 			d.show();
@@ -1444,21 +2160,154 @@ class MiniMartPOS {
 				typeof transaction === "string" ? transaction : transaction && transaction.pos_invoice_name;
 			if (!pos_invoice_name) return;
 
-			const params = new URLSearchParams({
-				doctype: "POS Invoice",
-				name: pos_invoice_name,
-				trigger_print: 1,
-			});
-			window.open(`/printview?${params.toString()}`, "_blank");
+			this.print_receipt(pos_invoice_name);
+		}
+
+		prompt_return_sale() {
+			frappe.prompt(
+				{
+					fieldtype: "Data",
+					fieldname: "invoice",
+					label: __("Receipt No. or Barcode"),
+					reqd: 1,
+				},
+				(values) => this.return_sale(values.invoice),
+				__("Return Sale"),
+				__("Find Sale"),
+			);
 		}
 
 		return_sale(invoice_name) {
 			if (!invoice_name) return;
 
-			frappe.msgprint({
-				title: __("Not Available"),
-				indicator: "orange",
-				message: __("Return Sale is not available from POS Invoice recent transactions yet."),
+			frappe.call({
+				method: "minimart_pos.api.get_returnable_invoice",
+				args: { invoice: invoice_name },
+				freeze: true,
+				callback: (r) => r.message && this.show_return_dialog(r.message),
+			});
+		}
+
+		show_return_dialog(sale) {
+			if (!sale.has_returnable_qty) {
+				frappe.msgprint(__("Everything on {0} has already been returned.", [sale.name]));
+				return;
+			}
+
+			const refund_modes = [...((this.shift_data && this.shift_data.payment_methods) || []), "Utang"];
+			const rows = sale.lines
+				.map(
+					(line) => `
+						<tr data-row="${this.escape_html(line.name)}" data-rate="${flt(line.amount) / (flt(line.qty) || 1)}">
+							<td>${this.escape_html(line.item_name)}<div class="text-muted small">${this.escape_html(line.uom)}</div></td>
+							<td class="text-right">${flt(line.qty)}</td>
+							<td class="text-right">${flt(line.returned_qty)}</td>
+							<td class="text-right" style="width: 90px;">
+								<input type="number" class="form-control input-xs return-qty" min="0" max="${flt(line.returnable_qty)}" step="any" value="0" ${line.returnable_qty > 0 ? "" : "disabled"}>
+							</td>
+						</tr>
+					`,
+				)
+				.join("");
+
+			let d = new frappe.ui.Dialog({
+				title: __("Return Sale {0}", [sale.name]),
+				size: "large",
+				fields: [
+					{
+						fieldtype: "HTML",
+						fieldname: "lines",
+						options: `
+							<div class="text-muted mb-2">${this.escape_html(sale.customer)} &middot; ${this.escape_html(frappe.datetime.str_to_user(sale.posting_date))} &middot; ₱${flt(sale.grand_total).toFixed(2)}</div>
+							<table class="table table-sm">
+								<thead>
+									<tr>
+										<th>${__("Item")}</th>
+										<th class="text-right">${__("Sold")}</th>
+										<th class="text-right">${__("Returned")}</th>
+										<th class="text-right">${__("Return")}</th>
+									</tr>
+								</thead>
+								<tbody>${rows}</tbody>
+							</table>
+							<div class="d-flex justify-content-between align-items-center">
+								<button type="button" class="btn btn-xs btn-default return-all-btn">${__("Return All")}</button>
+								<b class="return-total">₱0.00</b>
+							</div>
+						`,
+					},
+					{
+						fieldtype: "Select",
+						fieldname: "mode_of_payment",
+						label: __("Refund Through"),
+						options: refund_modes.join("\n"),
+						default: refund_modes.includes(sale.default_mode_of_payment)
+							? sale.default_mode_of_payment
+							: refund_modes[0],
+						description: __("Utang credits the refund to the customer's balance."),
+					},
+				],
+				primary_action_label: __("Create Return"),
+				primary_action: (values) => {
+					const items = [];
+					d.$wrapper.find("tr[data-row]").each((i, row) => {
+						const qty = flt($(row).find(".return-qty").val());
+						if (qty > 0) items.push({ pos_invoice_item: $(row).attr("data-row"), qty: qty });
+					});
+					if (!items.length) {
+						frappe.msgprint(__("Enter the quantity to return on at least one line."));
+						return;
+					}
+					this.submit_return(d, sale, items, values.mode_of_payment);
+				},
+			});
+
+			const update_total = () => {
+				let total = 0;
+				d.$wrapper.find("tr[data-row]").each((i, row) => {
+					let $input = $(row).find(".return-qty");
+					let qty = Math.min(Math.max(flt($input.val()), 0), flt($input.attr("max")));
+					if (qty !== flt($input.val())) $input.val(qty);
+					total += qty * flt($(row).attr("data-rate"));
+				});
+				d.$wrapper.find(".return-total").text(`₱${total.toFixed(2)}`);
+			};
+			d.$wrapper.find(".return-qty").on("input change", update_total);
+			d.$wrapper.find(".return-all-btn").on("click", () => {
+				d.$wrapper.find(".return-qty:enabled").each((i, input) => $(input).val($(input).attr("max")));
+				update_total();
+			});
+			d.show();
+		}
+
+		submit_return(dialog, sale, items, mode_of_payment) {
+			frappe.call({
+				method: "minimart_pos.api.create_return_invoice",
+				args: {
+					invoice: sale.name,
+					items: JSON.stringify(items),
+					mode_of_payment: mode_of_payment,
+				},
+				freeze: true,
+				freeze_message: __("Creating return..."),
+				callback: (r) => {
+					if (!r.message) return;
+					dialog.hide();
+					if (mode_of_payment !== "Utang") {
+						this.trigger_cash_drawer();
+					}
+					frappe.show_alert({
+						message: __("Return {0} created. Refund ₱{1}.", [
+							r.message.name,
+							Math.abs(flt(r.message.grand_total)).toFixed(2),
+						]),
+						indicator: "green",
+					});
+					this.reprint_receipt(r.message.name);
+					this.load_recent_orders();
+					this.load_products(this.last_product_search || "", !this.last_product_search);
+					this.focus_input();
+				},
 			});
 		}
 
@@ -1677,29 +2526,82 @@ class MiniMartPOS {
 
 		this.$payment_dialog = d;
 		d.show();
+		this.request_checkout_quote(customer);
+	}
+
+	request_checkout_quote(customer) {
+		// Price the invoice on the server while the cashier takes payment;
+		// create_invoice() reuses it when nothing changed in between.
+		let quote = {
+			token: null,
+			customer: customer,
+			cart: JSON.stringify(this.get_checkout_cart_payload()),
+			total_payable: this.current_payment_total,
+		};
+		this.checkout_quote = quote;
+		frappe.call({
+			method: "minimart_pos.api.quote_cart",
+			args: {
+				cart: quote.cart,
+				customer: customer,
+				total_payable: quote.total_payable,
+			},
+			callback: (r) => {
+				if (this.checkout_quote === quote && r.message) {
+					quote.token = r.message.quote_token;
+				}
+			},
+		});
+	}
+
+	get_checkout_quote_token(cart, customer) {
+		let quote = this.checkout_quote;
+		if (
+			!quote ||
+			!quote.token ||
+			quote.customer !== customer ||
+			quote.cart !== cart ||
+			quote.total_payable !== this.current_payment_total
+		) {
+			return null;
+		}
+		return quote.token;
 	}
 
 	submit_payment(dialog, selected_mop, received, customer, payment_due_date = null) {
-		let cart_payload = this.get_checkout_cart_payload();
+		let cart = JSON.stringify(this.get_checkout_cart_payload());
+		let quote_token = this.get_checkout_quote_token(cart, customer);
+		let started = performance.now();
+		this.checkout_quote = null;
 
 		frappe.call({
 			method: "minimart_pos.api.create_invoice",
 			args: {
-				cart: JSON.stringify(cart_payload),
+				cart: cart,
 				customer: customer,
 				mode_of_payment: selected_mop,
 				amount_paid: received,
 				total_payable: this.current_payment_total,
 				held_sale_name: this.active_held_sale_name,
 				payment_due_date: payment_due_date,
+				quote_token: quote_token,
 			},
 			freeze: true,
 			callback: (r) => {
+				console.info(
+					`Mart POS checkout (${quote_token ? "quoted" : "full"}) (ms):`,
+					Math.round(performance.now() - started),
+				);
 				if (selected_mop !== "Utang") {
 					this.trigger_cash_drawer();
 				}
+				// Only on a receipt printer; without one the cashier reprints from recent transactions.
+				this.print_receipt(r.message, false);
 				dialog.hide();
-				this.cart = [];
+				if (this.active_held_sale_name) {
+					this.set_held_sale_count(this.held_sale_count - 1);
+				}
+				this.set_cart([]);
 				this.active_held_sale_name = null;
 				this.render_cart();
 				this.load_recent_orders();
@@ -1708,31 +2610,59 @@ class MiniMartPOS {
 		});
 	}
 
+	get_utang_credit_status(customer, amount, freeze = false) {
+		// The customer search already returned the picked customer's credit
+		// figures; only fall back to the server when they are missing or old.
+		// create_invoice() enforces the limit again on submit.
+		let details = this.customer_control && this.customer_control.get_credit_details(customer);
+		if (details) {
+			let projected_outstanding = flt(details.current_outstanding) + flt(amount);
+			return Promise.resolve({
+				customer: customer,
+				company: details.company,
+				credit_limit: flt(details.credit_limit),
+				current_outstanding: flt(details.current_outstanding),
+				projected_outstanding: projected_outstanding,
+				available_credit: flt(details.available_credit),
+				allowed:
+					flt(details.credit_limit) > 0 &&
+					projected_outstanding <= flt(details.credit_limit),
+			});
+		}
+
+		return new Promise((resolve, reject) => {
+			frappe.call({
+				method: "minimart_pos.api.get_utang_credit_status",
+				args: { customer: customer, amount: amount },
+				freeze: freeze,
+				callback: (r) => (r.message ? resolve(r.message) : reject()),
+				error: reject,
+			});
+		});
+	}
+
 	validate_utang_credit(customer, amount, on_success) {
-		frappe.call({
-			method: "minimart_pos.api.get_utang_credit_status",
-			args: { customer: customer, amount: amount },
-			freeze: true,
-			callback: (r) => {
-				if (!r.message) return;
-				if (!r.message.allowed) {
+		this.get_utang_credit_status(customer, amount, true).then(
+			(status) => {
+				if (!status.allowed) {
 					frappe.msgprint({
 						title: __("Utang Not Allowed"),
 						indicator: "red",
 						message: __(
 							"Credit limit exceeded. Current outstanding: {0}, Sale amount: {1}, Credit limit: {2}.",
 							[
-								flt(r.message.current_outstanding).toFixed(2),
+								flt(status.current_outstanding).toFixed(2),
 								flt(amount).toFixed(2),
-								flt(r.message.credit_limit).toFixed(2),
+								flt(status.credit_limit).toFixed(2),
 							],
 						),
 					});
 					return;
 				}
-				if (on_success) on_success(r.message);
+				if (on_success) on_success(status);
 			},
-		});
+			() => {},
+		);
 	}
 
 	attach_payment_listeners(original_total) {
@@ -1780,7 +2710,12 @@ class MiniMartPOS {
 			} else {
 				me.current_payment_total = original_total - val;
 			}
+			me.log_event("sale_discount", {
+				amount: original_total - me.current_payment_total,
+				details: type === "perc" ? `${val}%` : `${val}`,
+			});
 			me.update_payment_ui();
+			me.request_checkout_quote(me.customer_control ? me.customer_control.get_value() : null);
 			if ($wrapper.find(".mop-btn.active").attr("data-mop") === "Utang") {
 				me.handle_payment_method_change();
 			}
@@ -1841,29 +2776,28 @@ class MiniMartPOS {
 			.addClass("text-muted")
 			.html(__("Checking credit limit..."));
 
-		frappe.call({
-			method: "minimart_pos.api.get_utang_credit_status",
-			args: { customer: customer, amount: this.current_payment_total },
-			callback: (r) => {
-				if (!r.message) return;
-				this.current_utang_allowed = Boolean(r.message.allowed);
+		this.get_utang_credit_status(customer, this.current_payment_total).then(
+			(status) => {
+				this.current_utang_allowed = Boolean(status.allowed);
 				$utang_status
 					.removeClass("text-muted text-danger text-success")
-					.addClass(r.message.allowed ? "text-success" : "text-danger")
+					.addClass(status.allowed ? "text-success" : "text-danger")
 					.html(
-						`${__("Outstanding")}: ₱${flt(r.message.current_outstanding).toFixed(2)}<br>` +
-							`${__("Credit Limit")}: ₱${flt(r.message.credit_limit).toFixed(2)}<br>` +
-							`${__("After Sale")}: ₱${flt(r.message.projected_outstanding).toFixed(2)}`,
+						`${__("Outstanding")}: ₱${flt(status.current_outstanding).toFixed(2)}<br>` +
+							`${__("Credit Limit")}: ₱${flt(status.credit_limit).toFixed(2)}<br>` +
+							`${__("After Sale")}: ₱${flt(status.projected_outstanding).toFixed(2)}`,
 					);
+				this.update_payment_ui();
 			},
-			error: () => {
+			() => {
 				this.current_utang_allowed = false;
 				$utang_status
 					.removeClass("text-muted text-success")
 					.addClass("text-danger")
 					.html(__("Utang is not allowed for this customer or amount."));
+				this.update_payment_ui();
 			},
-		});
+		);
 
 		this.update_payment_ui();
 	}
@@ -1904,6 +2838,363 @@ class MiniMartPOS {
 	view_past_order(invoice_name) {
 		if (invoice_name) frappe.set_route("Form", "POS Invoice", invoice_name);
 	}
+	print_shelf_labels() {
+		let d = new frappe.ui.Dialog({
+			title: __("Print Shelf Labels"),
+			fields: [
+				{
+					fieldname: "item_group",
+					fieldtype: "Link",
+					options: "Item Group",
+					label: __("Item Group"),
+				},
+				{
+					fieldname: "price_changed_since",
+					fieldtype: "Datetime",
+					label: __("Prices Changed Since"),
+				},
+				{
+					fieldname: "items",
+					fieldtype: "Small Text",
+					label: __("Item Codes"),
+					description: __("Comma separated. Used instead of the filters above when set."),
+				},
+			],
+			primary_action_label: __("Open Labels"),
+			primary_action: (values) => {
+				let args = {};
+				if (values.items) args.items = values.items;
+				else if (values.price_changed_since) args.price_changed_since = values.price_changed_since;
+				else if (values.item_group) args.item_group = values.item_group;
+				else {
+					frappe.msgprint(__("Choose an Item Group, a date, or item codes."));
+					return;
+				}
+				d.hide();
+				// The sheet is streamed as HTML; print it (or save as PDF) from the new tab.
+				const params = new URLSearchParams(args);
+				window.open(`/api/method/minimart_pos.api.label_sheet?${params.toString()}`, "_blank");
+			},
+		});
+		d.show();
+	}
+
+	start_stock_count() {
+		if (this.stock_count) {
+			this.focus_input();
+			return;
+		}
+		if (this.cart.length) {
+			frappe.msgprint(__("Finish or hold the current sale before counting stock."));
+			return;
+		}
+		frappe.call({
+			method: "minimart_pos.api.start_stock_count",
+			freeze: true,
+			callback: (r) => {
+				if (!r.message) return;
+				if (r.message.status === "Queued") {
+					// The last count is still being reconciled; report on it instead.
+					this.handle_stock_count_state(r.message);
+					return;
+				}
+				this.enter_stock_count(r.message);
+			},
+		});
+	}
+
+	enter_stock_count(state) {
+		let tallies = new Map();
+		for (let [item_code, uom, qty] of state.counts || []) {
+			tallies.set(this.get_stock_count_key(item_code, uom), {
+				item_code: item_code,
+				item_name: item_code,
+				uom: uom,
+				qty: flt(qty),
+			});
+		}
+		this.stock_count = {
+			name: state.name,
+			warehouse: state.warehouse,
+			tallies: tallies,
+			// Counts not yet sent, keyed like tallies, and the batch being sent.
+			pending: new Map(),
+			pending_scans: 0,
+			unsaved: null,
+			saving: null,
+			batch: cint(state.last_batch),
+			scan_count: cint(state.scan_count),
+			items_by_code: new Map(),
+			recent: [],
+		};
+		this.stock_count_timer = setInterval(
+			() => this.save_stock_count().catch(() => {}),
+			MiniMartPOS.stock_count_autosave_interval,
+		);
+		this.render_stock_count_panel();
+		if (state.status === "Failed" && state.error) {
+			frappe.msgprint({ title: __("Last Submit Failed"), indicator: "red", message: state.error });
+		}
+		this.focus_input();
+	}
+
+	get_stock_count_key(item_code, uom) {
+		return `${item_code}\u0000${uom || ""}`;
+	}
+
+	add_stock_count_scan(item, qty = 1) {
+		let sc = this.stock_count;
+		let key = this.get_stock_count_key(item.item_code, item.uom);
+		let tally = sc.tallies.get(key);
+		if (!tally) {
+			tally = { item_code: item.item_code, item_name: item.item_name, uom: item.uom, qty: 0 };
+			sc.tallies.set(key, tally);
+		}
+		tally.item_name = item.item_name || tally.item_name;
+		tally.qty += qty;
+
+		let pending = sc.pending.get(key);
+		if (!pending) {
+			pending = { item_code: tally.item_code, uom: tally.uom, qty: 0 };
+			sc.pending.set(key, pending);
+		}
+		pending.qty += qty;
+		sc.pending_scans += qty > 0 ? 1 : 0;
+		sc.scan_count += qty > 0 ? 1 : 0;
+
+		sc.recent.unshift({ tally: tally, qty: qty });
+		sc.recent.length = Math.min(sc.recent.length, 8);
+		this.update_stock_count_panel();
+
+		if (sc.pending_scans >= MiniMartPOS.stock_count_autosave_scans) {
+			this.save_stock_count().catch(() => {});
+		}
+	}
+
+	undo_stock_count_scan() {
+		let last = this.stock_count && this.stock_count.recent[0];
+		if (!last || last.tally.qty <= 0) return;
+		this.add_stock_count_scan(last.tally, -1);
+		this.focus_input();
+	}
+
+	save_stock_count() {
+		let sc = this.stock_count;
+		if (!sc) return Promise.resolve();
+		if (sc.saving) return sc.saving;
+		if (!sc.unsaved) {
+			if (!sc.pending.size) return Promise.resolve();
+			sc.unsaved = {
+				batch: sc.batch + 1,
+				deltas: [...sc.pending.values()].map((d) => [d.item_code, d.uom, d.qty]),
+				scans: sc.pending_scans,
+			};
+			sc.pending = new Map();
+			sc.pending_scans = 0;
+		}
+
+		// A failed batch is kept and resent with the same number, so the server
+		// can ignore it if the first attempt did arrive.
+		let unsaved = sc.unsaved;
+		sc.saving = new Promise((resolve, reject) => {
+			frappe.call({
+				method: "minimart_pos.api.save_stock_count",
+				args: {
+					stock_count: sc.name,
+					deltas: JSON.stringify(unsaved.deltas),
+					batch: unsaved.batch,
+					scan_count: unsaved.scans,
+				},
+				callback: () => {
+					sc.batch = unsaved.batch;
+					sc.unsaved = null;
+					resolve();
+				},
+				error: () => reject(),
+				always: () => {
+					sc.saving = null;
+					this.update_stock_count_panel();
+				},
+			});
+		});
+		return sc.saving;
+	}
+
+	save_stock_count_on_unload() {
+		let sc = this.stock_count;
+		if (!sc || !navigator.sendBeacon) return;
+		let batch = sc.unsaved || {
+			batch: sc.batch + 1,
+			deltas: [...sc.pending.values()].map((d) => [d.item_code, d.uom, d.qty]),
+			scans: sc.pending_scans,
+		};
+		if (!batch.deltas.length) return;
+
+		let form = new FormData();
+		form.append("stock_count", sc.name);
+		form.append("deltas", JSON.stringify(batch.deltas));
+		form.append("batch", batch.batch);
+		form.append("scan_count", batch.scans);
+		form.append("csrf_token", frappe.csrf_token);
+		navigator.sendBeacon("/api/method/minimart_pos.api.save_stock_count", form);
+	}
+
+	async flush_stock_count() {
+		let sc = this.stock_count;
+		while (sc.saving || sc.unsaved || sc.pending.size) {
+			await this.save_stock_count();
+		}
+	}
+
+	finish_stock_count() {
+		let sc = this.stock_count;
+		if (!sc || !sc.tallies.size) {
+			frappe.msgprint(__("Nothing has been counted yet."));
+			return;
+		}
+		frappe.confirm(
+			__("Submit {0} counted lines ({1} scans) as a Stock Reconciliation for {2}?", [
+				sc.tallies.size,
+				sc.scan_count,
+				frappe.utils.escape_html(sc.warehouse || ""),
+			]),
+			async () => {
+				try {
+					await this.flush_stock_count();
+				} catch (e) {
+					frappe.msgprint(__("Could not save the latest counts. Check the connection and try again."));
+					return;
+				}
+				frappe.call({
+					method: "minimart_pos.api.submit_stock_count",
+					args: { stock_count: sc.name },
+					freeze: true,
+					freeze_message: __("Submitting stock count..."),
+					callback: (r) => r.message && this.handle_stock_count_state(r.message),
+				});
+			},
+		);
+	}
+
+	handle_stock_count_state(state) {
+		if (state.status === "Queued") {
+			frappe.show_alert({ message: __("Stock count queued for reconciliation"), indicator: "blue" });
+			setTimeout(() => {
+				frappe.call({
+					method: "minimart_pos.api.get_stock_count_status",
+					args: { stock_count: state.name },
+					callback: (r) => r.message && this.handle_stock_count_state(r.message),
+				});
+			}, 5000);
+			return;
+		}
+
+		if (state.status === "Submitted") {
+			let message = __("Stock Reconciliation {0} created.", [
+				`<a href="/app/stock-reconciliation/${encodeURIComponent(state.stock_reconciliation)}">${frappe.utils.escape_html(state.stock_reconciliation)}</a>`,
+			]);
+			if (state.skipped_items) {
+				message += "<br>" + __("Not reconciled (batch, serial, non-stock or unknown UOM): {0}", [
+					frappe.utils.escape_html(state.skipped_items),
+				]);
+			}
+			frappe.msgprint({ title: __("Stock Count Submitted"), indicator: "green", message: message });
+			if (this.stock_count && this.stock_count.name === state.name) this.exit_stock_count();
+			return;
+		}
+
+		if (state.status === "Failed") {
+			frappe.msgprint({
+				title: __("Stock Count Failed"),
+				indicator: "red",
+				message: frappe.utils.escape_html(state.error || __("Unknown error")),
+			});
+		}
+	}
+
+	discard_stock_count() {
+		let sc = this.stock_count;
+		if (!sc) return;
+		frappe.confirm(__("Discard this stock count? Counted quantities will be lost."), () => {
+			frappe.call({
+				method: "minimart_pos.api.cancel_stock_count",
+				args: { stock_count: sc.name },
+				callback: () => this.exit_stock_count(),
+			});
+		});
+	}
+
+	exit_stock_count() {
+		clearInterval(this.stock_count_timer);
+		this.stock_count_timer = null;
+		this.stock_count = null;
+		if (this.$stock_count_panel) this.$stock_count_panel.remove();
+		this.$stock_count_panel = null;
+		this.$cart_container.show();
+		this.focus_input();
+	}
+
+	render_stock_count_panel() {
+		let sc = this.stock_count;
+		this.$cart_container.hide();
+		this.$stock_count_panel = $(`
+			<div class="stock-count-panel p-3">
+				<div class="d-flex justify-content-between align-items-center mb-2">
+					<h4 class="m-0">${__("Stock Count")}</h4>
+					<small class="text-muted">${frappe.utils.escape_html(sc.warehouse || "")}</small>
+				</div>
+				<div class="mb-2">
+					<b class="sc-scans">0</b> ${__("scans")} &middot;
+					<b class="sc-lines">0</b> ${__("lines")} &middot;
+					<span class="sc-saved text-muted"></span>
+				</div>
+				<div class="sc-last mb-2" style="font-size: 1.2em; font-weight: bold;"></div>
+				<div class="sc-recent small mb-3"></div>
+				<div class="d-flex gap-2">
+					<button class="btn btn-sm btn-default sc-undo">${__("Undo Last")}</button>
+					<button class="btn btn-sm btn-primary sc-finish">${__("Finish Count")}</button>
+					<button class="btn btn-sm btn-outline-danger sc-discard">${__("Discard")}</button>
+				</div>
+			</div>
+		`).insertBefore(this.$cart_container);
+
+		this.$stock_count_panel.find(".sc-undo").on("click", () => this.undo_stock_count_scan());
+		this.$stock_count_panel.find(".sc-finish").on("click", () => this.finish_stock_count());
+		this.$stock_count_panel.find(".sc-discard").on("click", () => this.discard_stock_count());
+		this.update_stock_count_panel();
+	}
+
+	update_stock_count_panel() {
+		// Fast scanners can fire many scans per frame; the panel is drawn once per frame.
+		if (this.stock_count_frame) return;
+		this.stock_count_frame = requestAnimationFrame(() => {
+			this.stock_count_frame = null;
+			let sc = this.stock_count;
+			if (!sc || !this.$stock_count_panel) return;
+
+			let $panel = this.$stock_count_panel;
+			let unsaved = sc.pending_scans + (sc.unsaved ? sc.unsaved.scans : 0);
+			$panel.find(".sc-scans").text(sc.scan_count);
+			$panel.find(".sc-lines").text(sc.tallies.size);
+			$panel
+				.find(".sc-saved")
+				.text(unsaved ? __("{0} scans not saved yet", [unsaved]) : __("All counts saved"));
+
+			let describe = (tally) =>
+				`${frappe.utils.escape_html(tally.item_name || tally.item_code)} &times; ${tally.qty} ${frappe.utils.escape_html(tally.uom || "")}`;
+			let last = sc.recent[0];
+			$panel.find(".sc-last").html(last ? describe(last.tally) : __("Scan an item to start counting"));
+			$panel
+				.find(".sc-recent")
+				.html(
+					sc.recent
+						.slice(1)
+						.map((entry) => `<div class="text-muted">${entry.qty < 0 ? __("Undo") + ": " : ""}${describe(entry.tally)}</div>`)
+						.join(""),
+				);
+		});
+	}
+
 	close_shift() {
 		frappe.confirm(__("Close shift?"), () => {
 			frappe.call({
@@ -0,0 +1,29 @@
+frappe.query_reports["Mart POS Reorder Suggestions"] = {
+	filters: [
+		{
+			fieldname: "pos_profile",
+			label: __("POS Profile"),
+			fieldtype: "Link",
+			options: "POS Profile",
+			reqd: 1,
+		},
+		{
+			fieldname: "lookback_days",
+			label: __("Sales History (Days)"),
+			fieldtype: "Int",
+			default: 30,
+		},
+		{
+			fieldname: "lead_time_days",
+			label: __("Lead Time (Days)"),
+			fieldtype: "Int",
+			default: 3,
+		},
+		{
+			fieldname: "cover_days",
+			label: __("Days of Cover to Order"),
+			fieldtype: "Int",
+			default: 7,
+		},
+	],
+};
@@ -0,0 +1,40 @@
+from frappe import _
+
+from minimart_pos.api import get_reorder_suggestions
+
+
+def execute(filters=None):
+	filters = filters or {}
+	data = get_reorder_suggestions(
+		pos_profile=filters.get("pos_profile"),
+		lookback_days=filters.get("lookback_days"),
+		lead_time_days=filters.get("lead_time_days"),
+		cover_days=filters.get("cover_days"),
+	)
+	return get_columns(), data
+
+
+def get_columns():
+	return [
+		{
+			"label": _("Item Code"),
+			"fieldname": "item_code",
+			"fieldtype": "Link",
+			"options": "Item",
+			"width": 140,
+		},
+		{"label": _("Item Name"), "fieldname": "item_name", "fieldtype": "Data", "width": 200},
+		{
+			"label": _("Stock UOM"),
+			"fieldname": "stock_uom",
+			"fieldtype": "Link",
+			"options": "UOM",
+			"width": 90,
+		},
+		{"label": _("Actual Qty"), "fieldname": "actual_qty", "fieldtype": "Float", "width": 100},
+		{"label": _("Ordered Qty"), "fieldname": "ordered_qty", "fieldtype": "Float", "width": 100},
+		{"label": _("Sold Qty"), "fieldname": "sold_qty", "fieldtype": "Float", "width": 100},
+		{"label": _("Daily Velocity"), "fieldname": "daily_velocity", "fieldtype": "Float", "width": 110},
+		{"label": _("Days of Cover"), "fieldname": "days_of_cover", "fieldtype": "Float", "width": 110},
+		{"label": _("Suggested Qty"), "fieldname": "suggested_qty", "fieldtype": "Float", "width": 110},
+	]
@@ -0,0 +1,5 @@
+from minimart_pos.api import ensure_hot_path_indexes
+
+
+def execute():
+	ensure_hot_path_indexes()
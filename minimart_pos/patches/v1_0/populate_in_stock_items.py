@@ -0,0 +1,5 @@
+from minimart_pos.api import rebuild_in_stock_items
+
+
+def execute():
+	rebuild_in_stock_items()
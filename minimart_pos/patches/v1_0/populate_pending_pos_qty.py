@@ -0,0 +1,5 @@
+from minimart_pos.api import rebuild_pending_pos_qty
+
+
+def execute():
+	rebuild_pending_pos_qty()
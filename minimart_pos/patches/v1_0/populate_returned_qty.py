@@ -0,0 +1,5 @@
+from minimart_pos.api import rebuild_returned_qty
+
+
+def execute():
+	rebuild_returned_qty()
@@ -0,0 +1,48 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from minimart_pos.api import (
+	CUSTOMER_INDEX_CACHE_KEY,
+	RECENT_CUSTOMERS_CACHE_KEY,
+	clear_customer_index,
+	find_customers_by_prefix,
+	get_recent_customers,
+	remember_recent_customer,
+)
+
+
+class TestCustomerSearch(FrappeTestCase):
+	def setUp(self):
+		clear_customer_index()
+
+	def tearDown(self):
+		clear_customer_index()
+
+	def insert_customer(self, customer_name):
+		customer = frappe.get_doc(
+			{"doctype": "Customer", "customer_name": customer_name, "customer_type": "Individual"}
+		).insert()
+		# The index is updated after commit; run those callbacks without committing.
+		frappe.db.after_commit.run()
+		return customer
+
+	def test_saved_customer_is_found_by_prefix(self):
+		find_customers_by_prefix("qzv", 10)
+		self.assertTrue(frappe.cache().exists(CUSTOMER_INDEX_CACHE_KEY))
+
+		customer = self.insert_customer(f"Qzvmart Suki {frappe.generate_hash(length=6)}")
+		with patch("minimart_pos.api.build_customer_index") as build_customer_index:
+			self.assertIn(customer.name, find_customers_by_prefix("qzvmart", 10))
+			self.assertIn(customer.name, find_customers_by_prefix("suki", 10))
+		build_customer_index.assert_not_called()
+
+	def test_recent_customers_are_read_back(self):
+		pos_profile = f"_Test POS Profile {frappe.generate_hash(length=6)}"
+		remember_recent_customer(pos_profile, "_Test Customer")
+		remember_recent_customer(pos_profile, "_Test Customer 1")
+		remember_recent_customer(pos_profile, "_Test Customer")
+
+		self.assertEqual(get_recent_customers(pos_profile), ["_Test Customer", "_Test Customer 1"])
+		frappe.cache().delete_value(f"{RECENT_CUSTOMERS_CACHE_KEY}:{pos_profile}")
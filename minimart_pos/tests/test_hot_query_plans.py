@@ -0,0 +1,317 @@
+import re
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, now_datetime
+
+from minimart_pos.api import (
+	ensure_hot_path_indexes,
+	get_available_qty_map,
+	get_catalog_rows,
+	get_latest_item_price_rate,
+	get_return_lines,
+	get_shift_invoice_rows,
+)
+
+ITEM_COUNT = 5000
+BUNDLE_COUNT = 50
+INVOICE_DAYS = 30
+INVOICES_PER_DAY = 40
+# Tables seed_plan_data fills; a full scan of any of them fails.
+SEEDED_TABLES = {
+	"tabItem",
+	"tabItem Barcode",
+	"tabItem Price",
+	"tabBin",
+	"tabMart POS In Stock Item",
+	"tabProduct Bundle",
+	"tabProduct Bundle Item",
+	"tabPOS Invoice",
+	"tabPOS Invoice Item",
+	"tabMart POS Item Sales Daily",
+}
+
+WAREHOUSE = "_Test Plan Warehouse - _TC"
+OTHER_WAREHOUSE = "_Test Plan Other Warehouse - _TC"
+PRICE_LIST = "_Test Plan Price List"
+
+
+class TestHotQueryPlans(FrappeTestCase):
+	"""EXPLAIN each POS hot-path query on a seeded dataset.
+
+	A full scan of a seeded table fails. A filesort fails unless the test
+	names the one table it is expected on and why.
+	"""
+
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		# Adding an index commits, so do it before seeding.
+		ensure_hot_path_indexes()
+		seed_plan_data()
+		cls.profile = frappe._dict(
+			name="_Test Plan POS Profile", warehouse=WAREHOUSE, selling_price_list=PRICE_LIST
+		)
+
+	def assert_plan(self, run, filesort_tables=(), filesort_reason=None):
+		self.assertEqual(
+			bool(filesort_tables), bool(filesort_reason), "Name the filesort tables and the reason"
+		)
+		run()
+		query = frappe.safe_decode(frappe.db.last_query)
+		# EXPLAIN shows aliases; map them back to the table they name.
+		tables = {alias: table for table, alias in re.findall(r"`(tab[^`]+)`\s+(?:AS\s+)?(\w+)", query)}
+		for row in frappe.db.sql(f"EXPLAIN {query}", as_dict=True):
+			alias = row.get("table") or ""
+			if alias.startswith("<"):
+				# Derived and materialized tables are built from rows already filtered.
+				continue
+			table = tables.get(alias, alias)
+			plan = f"{alias} ({table}): type={row.get('type')} key={row.get('key')} rows={row.get('rows')} {row.get('Extra')}"
+			if table in SEEDED_TABLES:
+				self.assertNotEqual(row.get("type"), "ALL", f"Full scan. {plan}")
+			if alias not in filesort_tables:
+				self.assertNotIn("Using filesort", row.get("Extra") or "", plan)
+
+	def test_catalog_page(self):
+		self.assert_plan(
+			lambda: get_catalog_rows(self.profile, limit_page_length=60),
+			filesort_tables=("st",),
+			filesort_reason="conversion factor and UOM sort keys are computed from the joined price row",
+		)
+
+	def test_catalog_by_velocity(self):
+		self.assert_plan(
+			lambda: get_catalog_rows(self.profile, limit_page_length=60, order_by="velocity"),
+			filesort_tables=("st", "sd"),
+			filesort_reason="the leading sort key is the units total grouped from the daily rollup",
+		)
+
+	def test_catalog_search(self):
+		self.assert_plan(
+			lambda: get_catalog_rows(self.profile, search_term="plan item 01", limit_page_length=60),
+			filesort_tables=("st",),
+			filesort_reason="the leading sort key is the computed match rank",
+		)
+
+	def test_catalog_scan(self):
+		self.assert_plan(
+			lambda: get_catalog_rows(self.profile, scan_code=barcode(123), in_stock_only=False),
+			filesort_tables=("i",),
+			filesort_reason="orders the UOM rows of the scanned item by keys computed from the price row",
+		)
+
+	def test_barcode_lookup(self):
+		self.assert_plan(lambda: frappe.db.get_value("Item Barcode", {"barcode": barcode(123)}, "parent"))
+
+	def test_item_price_lookup(self):
+		self.assert_plan(lambda: get_latest_item_price_rate(item_code(123), "Nos", PRICE_LIST))
+
+	def test_stock_availability(self):
+		self.assert_plan(lambda: get_available_qty_map([item_code(n) for n in range(100)], WAREHOUSE))
+
+	def test_bundle_components(self):
+		# The component query of get_bundle_component_map, which runs an Item lookup after it.
+		self.assert_plan(
+			lambda: frappe.get_all(
+				"Product Bundle Item",
+				filters={"parent": ["in", [bundle_code(n) for n in range(20)]]},
+				fields=["parent", "item_code", "qty"],
+				order_by="parent asc, idx asc",
+				limit_page_length=0,
+			)
+		)
+
+	def test_recent_invoices(self):
+		now = now_datetime()
+		self.assert_plan(lambda: get_shift_invoice_rows(self.profile.name, add_days(now, -1), now))
+
+	def test_return_lines(self):
+		self.assert_plan(lambda: get_return_lines(invoice_name(0, 0)))
+
+
+def item_code(n):
+	return f"_Test Plan Item {n:05d}"
+
+
+def barcode(n):
+	return f"990{n:09d}"
+
+
+def bundle_code(n):
+	return f"_Test Plan Bundle {n:03d}"
+
+
+def invoice_name(day, n):
+	return f"_Test Plan PSINV-{day:02d}-{n:03d}"
+
+
+def seed_plan_data():
+	"""Bulk insert Items, prices, barcodes, Bins, bundles and a month of POS Invoices."""
+	now = now_datetime()
+	today = now.date()
+
+	items = [(item_code(n), f"Plan Item {n:05d}") for n in range(ITEM_COUNT)]
+	frappe.db.bulk_insert(
+		"Item",
+		[
+			"name",
+			"item_code",
+			"item_name",
+			"item_group",
+			"stock_uom",
+			"is_stock_item",
+			"is_sales_item",
+			"has_variants",
+			"disabled",
+			"creation",
+			"modified",
+		],
+		[(code, code, name, "_Test Item Group", "Nos", 1, 1, 0, 0, now, now) for code, name in items]
+		+ [
+			(
+				bundle_code(n),
+				bundle_code(n),
+				f"Plan Bundle {n:03d}",
+				"_Test Item Group",
+				"Nos",
+				0,
+				1,
+				0,
+				0,
+				now,
+				now,
+			)
+			for n in range(BUNDLE_COUNT)
+		],
+	)
+	frappe.db.bulk_insert(
+		"Item Barcode",
+		["name", "parent", "parenttype", "parentfield", "idx", "barcode"],
+		[
+			(f"{code}-barcode", code, "Item", "barcodes", 1, barcode(n))
+			for n, (code, _name) in enumerate(items)
+		],
+	)
+	frappe.db.bulk_insert(
+		"Item Price",
+		["name", "item_code", "price_list", "uom", "price_list_rate", "selling", "creation", "modified"],
+		[
+			(f"{code}-{price_list}", code, price_list, "Nos", 10 + n % 90, 1, now, now)
+			for n, (code, _name) in enumerate(items)
+			for price_list in (PRICE_LIST, "_Test Plan Other Price List")
+		],
+	)
+	frappe.db.bulk_insert(
+		"Bin",
+		["name", "item_code", "warehouse", "actual_qty", "stock_uom"],
+		[
+			(f"{code}-{warehouse}", code, warehouse, n % 7, "Nos")
+			for n, (code, _name) in enumerate(items)
+			for warehouse in (WAREHOUSE, OTHER_WAREHOUSE)
+		],
+	)
+	# Most but not all items are in stock, as on a real shelf.
+	frappe.db.bulk_insert(
+		"Mart POS In Stock Item",
+		["name", "warehouse", "item_code", "is_bundle"],
+		[
+			(f"{code}-{warehouse}", warehouse, code, 0)
+			for n, (code, _name) in enumerate(items)
+			if n % 7
+			for warehouse in (WAREHOUSE, OTHER_WAREHOUSE)
+		],
+	)
+	frappe.db.bulk_insert(
+		"Product Bundle",
+		["name", "new_item_code", "disabled"],
+		[(bundle_code(n), bundle_code(n), 0) for n in range(BUNDLE_COUNT)],
+	)
+	frappe.db.bulk_insert(
+		"Product Bundle Item",
+		["name", "parent", "parenttype", "parentfield", "idx", "item_code", "qty"],
+		[
+			(
+				f"{bundle_code(n)}-{idx}",
+				bundle_code(n),
+				"Product Bundle",
+				"items",
+				idx,
+				item_code(n * 3 + idx),
+				1,
+			)
+			for n in range(BUNDLE_COUNT)
+			for idx in (1, 2, 3)
+		],
+	)
+
+	invoices = []
+	invoice_items = []
+	sales = []
+	for day in range(INVOICE_DAYS):
+		posting_date = add_days(today, -day)
+		for n in range(INVOICES_PER_DAY):
+			name = invoice_name(day, n)
+			pos_profile = "_Test Plan POS Profile" if n % 2 else "_Test Plan Other POS Profile"
+			posting_time = f"{8 + n % 12:02d}:{n % 60:02d}:00"
+			invoices.append(
+				(name, pos_profile, posting_date, posting_time, 1, 0, "_Test Customer", 30, now, now)
+			)
+			for idx in (1, 2, 3):
+				code = item_code((day * INVOICES_PER_DAY + n) * 3 % ITEM_COUNT + idx)
+				invoice_items.append(
+					(
+						f"{name}-{idx}",
+						name,
+						"POS Invoice",
+						"items",
+						idx,
+						code,
+						code,
+						1,
+						"Nos",
+						10,
+						10,
+						WAREHOUSE,
+					)
+				)
+				sales.append((f"{name}-{idx}", posting_date, WAREHOUSE, code, "Nos", 1, 1, 10))
+	frappe.db.bulk_insert(
+		"POS Invoice",
+		[
+			"name",
+			"pos_profile",
+			"posting_date",
+			"posting_time",
+			"docstatus",
+			"is_return",
+			"customer",
+			"grand_total",
+			"creation",
+			"modified",
+		],
+		invoices,
+	)
+	frappe.db.bulk_insert(
+		"POS Invoice Item",
+		[
+			"name",
+			"parent",
+			"parenttype",
+			"parentfield",
+			"idx",
+			"item_code",
+			"item_name",
+			"qty",
+			"uom",
+			"rate",
+			"amount",
+			"warehouse",
+		],
+		invoice_items,
+	)
+	frappe.db.bulk_insert(
+		"Mart POS Item Sales Daily",
+		["name", "sales_date", "warehouse", "item_code", "uom", "qty", "stock_qty", "amount"],
+		sales,
+	)
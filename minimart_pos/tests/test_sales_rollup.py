@@ -0,0 +1,93 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, get_datetime, getdate
+
+from minimart_pos.api import (
+	SALES_ROLLUP_WATERMARK_KEY,
+	ensure_hot_path_indexes,
+	get_item_sales_bucket_name,
+	get_item_sales_bucket_totals,
+	update_item_sales_rollup,
+)
+
+WAREHOUSE = "_Test Rollup Warehouse - _TC"
+POSTING_DATE = getdate("2099-01-01")
+# Later than anything else on a test site, so a run only sees the seeded invoices.
+MODIFIED = get_datetime("2099-01-01 12:00:00")
+ITEM_COUNT = 2000
+
+
+def item_code(n):
+	return f"_Test Rollup Item {n:05d}"
+
+
+class TestSalesRollup(FrappeTestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		# Adding an index commits, so do it before seeding.
+		ensure_hot_path_indexes()
+		# One line per item over 30 days, so the plan test has real tables to choose from.
+		invoices = []
+		lines = []
+		for n in range(ITEM_COUNT):
+			name = f"_Test Rollup PSINV-{n:05d}"
+			posting_date = add_days(POSTING_DATE, -(n % 30))
+			invoices.append((name, 1, posting_date, MODIFIED, MODIFIED))
+			lines.append(
+				(f"{name}-1", name, "POS Invoice", "items", 1, item_code(n), WAREHOUSE, "Nos", 2, 2, 20)
+			)
+		frappe.db.bulk_insert(
+			"POS Invoice", ["name", "docstatus", "posting_date", "creation", "modified"], invoices
+		)
+		frappe.db.bulk_insert(
+			"POS Invoice Item",
+			[
+				"name",
+				"parent",
+				"parenttype",
+				"parentfield",
+				"idx",
+				"item_code",
+				"warehouse",
+				"uom",
+				"qty",
+				"stock_qty",
+				"base_net_amount",
+			],
+			lines,
+		)
+
+	def test_batches_sharing_modified_are_not_skipped(self):
+		# The watermark is rolled back with the rest of the class; drop its cached copy too.
+		self.addCleanup(frappe.defaults.clear_cache, "__global")
+		frappe.db.set_global(SALES_ROLLUP_WATERMARK_KEY, str(MODIFIED))
+		# Every seeded invoice has the same `modified`, so each batch boundary falls inside it.
+		with (
+			patch("minimart_pos.api.SALES_ROLLUP_BATCH_SIZE", 300),
+			patch.object(frappe.db, "commit"),
+		):
+			update_item_sales_rollup()
+
+		for n in range(ITEM_COUNT):
+			bucket = (add_days(POSTING_DATE, -(n % 30)), WAREHOUSE, item_code(n), "Nos")
+			self.assertEqual(
+				frappe.db.get_value("Mart POS Item Sales Daily", get_item_sales_bucket_name(*bucket), "qty"),
+				2,
+				bucket,
+			)
+
+	def test_bucket_totals_use_indexes(self):
+		buckets = [(add_days(POSTING_DATE, -(n % 30)), WAREHOUSE, item_code(n), "Nos") for n in range(0, 50)]
+		totals = get_item_sales_bucket_totals(buckets)
+		self.assertEqual(len(totals), 50)
+
+		plan = {
+			row.table: row
+			for row in frappe.db.sql(f"EXPLAIN {frappe.safe_decode(frappe.db.last_query)}", as_dict=True)
+		}
+		self.assertNotEqual(plan["pii"].type, "ALL", plan["pii"])
+		self.assertIsNotNone(plan["pii"].key, plan["pii"])
+		self.assertEqual(plan["pi"].key, "PRIMARY", plan["pi"])